@@ -0,0 +1,48 @@
+"""add hnsw index to document_chunks embedding
+
+Revision ID: 8d451dc84712
+Revises: c9b0f76a17b3
+Create Date: 2026-10-17 09:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d451dc84712'
+down_revision: Union[str, Sequence[str], None] = 'c9b0f76a17b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    # Build the index concurrently so retrieval keeps working while a large
+    # corpus is indexed. CONCURRENTLY cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_document_chunks_embedding_hnsw',
+            'document_chunks',
+            ['embedding'],
+            unique=False,
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_l2_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_document_chunks_embedding_hnsw',
+            table_name='document_chunks',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,47 @@
+"""add content_hash to document_chunks and document_sources manifest
+
+Revision ID: 3f1a6b2c9d47
+Revises: 8d451dc84712
+Create Date: 2026-10-17 09:30:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a6b2c9d47'
+down_revision: Union[str, Sequence[str], None] = '8d451dc84712'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('document_chunks', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    # Backfill hashes so already-ingested chunks are reused instead of re-embedded.
+    op.execute(
+        "UPDATE document_chunks "
+        "SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex') "
+        "WHERE content IS NOT NULL"
+    )
+    op.create_index(op.f('ix_document_chunks_content_hash'), 'document_chunks', ['content_hash'], unique=False)
+    op.create_index(op.f('ix_document_chunks_source'), 'document_chunks', ['source'], unique=False)
+    op.create_table('document_sources',
+    sa.Column('source', sa.Text(), nullable=False),
+    sa.Column('file_hash', sa.String(length=64), nullable=False),
+    sa.Column('chunk_count', sa.Integer(), nullable=False),
+    sa.Column('embedding_model', sa.String(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('source')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('document_sources')
+    op.drop_index(op.f('ix_document_chunks_source'), table_name='document_chunks')
+    op.drop_index(op.f('ix_document_chunks_content_hash'), table_name='document_chunks')
+    op.drop_column('document_chunks', 'content_hash')
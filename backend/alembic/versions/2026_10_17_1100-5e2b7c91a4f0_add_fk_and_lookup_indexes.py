@@ -0,0 +1,62 @@
+"""add foreign-key and lookup indexes
+
+Revision ID: 5e2b7c91a4f0
+Revises: a57e0c3d18b9
+Create Date: 2026-10-17 11:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b7c91a4f0'
+down_revision: Union[str, Sequence[str], None] = 'a57e0c3d18b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (index name, table, columns), matched to the filters/orderings of the hot routes.
+INDEXES = [
+    ('ix_assignments_user_id_created_at', 'assignments', ['user_id', 'created_at']),
+    ('ix_steps_assignment_id', 'steps', ['assignment_id']),
+    ('ix_steps_parent_id_position_y', 'steps', ['parent_id', 'position_y']),
+    ('ix_connections_assignment_id_from_to', 'connections', ['assignment_id', 'from_step', 'to_step']),
+    ('ix_connections_from_step', 'connections', ['from_step']),
+    ('ix_connections_to_step', 'connections', ['to_step']),
+    ('ix_chat_messages_assignment_step_timestamp', 'chat_messages', ['assignment_id', 'step_id', 'timestamp']),
+    ('ix_chat_messages_step_id_timestamp', 'chat_messages', ['step_id', 'timestamp']),
+    ('ix_idea_sessions_user_id_created_at', 'idea_sessions', ['user_id', 'created_at']),
+    ('ix_idea_messages_session_id_created_at', 'idea_messages', ['session_id', 'created_at']),
+    ('ix_spec_changes_session_id_created_at', 'spec_changes', ['session_id', 'created_at']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY keeps the tables writable while the indexes build; it cannot
+    # run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
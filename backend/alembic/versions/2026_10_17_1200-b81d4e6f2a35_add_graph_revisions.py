@@ -0,0 +1,49 @@
+"""add graph revisions and tombstones
+
+Revision ID: b81d4e6f2a35
+Revises: 5e2b7c91a4f0
+Create Date: 2026-10-17 12:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b81d4e6f2a35'
+down_revision: Union[str, Sequence[str], None] = '5e2b7c91a4f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant server default lets Postgres add the columns without rewriting the tables.
+    op.add_column('assignments', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('steps', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('connections', sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_steps_assignment_id_revision', 'steps', ['assignment_id', 'revision'], unique=False)
+    op.create_index('ix_connections_assignment_id_revision', 'connections', ['assignment_id', 'revision'], unique=False)
+    op.create_table('graph_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('assignment_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['assignment_id'], ['assignments.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_graph_tombstones_assignment_id_revision', 'graph_tombstones', ['assignment_id', 'revision'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_graph_tombstones_assignment_id_revision', table_name='graph_tombstones')
+    op.drop_table('graph_tombstones')
+    op.drop_index('ix_connections_assignment_id_revision', table_name='connections')
+    op.drop_index('ix_steps_assignment_id_revision', table_name='steps')
+    op.drop_column('connections', 'revision')
+    op.drop_column('steps', 'revision')
+    op.drop_column('assignments', 'revision')
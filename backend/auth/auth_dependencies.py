@@ -4,10 +4,12 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from sqlalchemy.orm import Session
-from core.database import SessionLocal
+from core.database import get_db
 from models.models import User
 from typing import Optional
 from core.config import SECRET_KEY, ALGORITHM
+from auth.principal_cache import principal_cache
+from services.llm_gateway import bind_user
 
 # Use the same secret and algorithm as in your auth_routes.py
 SECRET_KEY = SECRET_KEY
@@ -15,14 +17,8 @@ ALGORITHM = ALGORITHM
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")  # Assumes your login endpoint is at /login
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def token_claims(token: str) -> dict:
+    """The claims of a valid access token (with a sub claim); raises 401 otherwise."""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: Optional[str] = payload.get("sub")
@@ -30,23 +26,47 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
-    
+    return payload
+
+def token_email(token: str) -> str:
+    """The email (sub claim) of a valid access token; raises 401 otherwise."""
+    return token_claims(token)["sub"]
+
+def load_user(db: Session, email: str) -> User:
     user = db.query(User).filter(User.email == email).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    # Detach the user and end the read transaction so the connection goes back to the
+    # pool right away instead of being held while the route awaits slow work (LLM calls).
+    # Loaded columns stay readable; the route's session starts a new transaction on its next query.
+    db.expunge(user)
+    db.rollback()
     return user
 
+def resolve_user(db: Session, token: str) -> User:
+    """
+    The token's user, from the principal cache when possible (no JWT decode, no query).
+    A token is only cached after it verified, and never beyond its exp.
+    """
+    user = principal_cache.get(token)
+    if user is None:
+        claims = token_claims(token)
+        user = load_user(db, claims["sub"])
+        principal_cache.set(token, user, claims.get("exp"))
+    return user
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    return resolve_user(db, token)
+
 def get_current_user_with_google(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
     """Modified version of get_current_user that works with Google auth users who have no password."""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
-    
-    user = db.query(User).filter(User.email == email).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
+    return resolve_user(db, token)
+
+async def get_llm_user(current_user: User = Depends(get_current_user)) -> User:
+    """
+    get_current_user for routes that call the LLM: also attributes the request's LLM
+    calls to the user for the gateway's per-user limits. Async so the binding is made
+    in the request's own task (sync dependencies run in a worker thread).
+    """
+    bind_user(current_user.id)
+    return current_user
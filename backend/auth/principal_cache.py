@@ -0,0 +1,125 @@
+# principal_cache.py
+"""
+Cache of authenticated users keyed by access token.
+
+get_current_user verifies a token and loads its user once; later requests with the
+same token are served from memory without decoding the JWT or querying users.
+An entry expires after PRINCIPAL_CACHE_TTL_SECONDS or when the token itself
+expires, whichever is first.
+
+Committed changes to a User (update or delete) invalidate that user's entries in
+this process through a session hook. Other worker processes keep theirs until
+the TTL runs out. Cached users are detached and shared between requests, so
+treat them as read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from core.config import PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES
+from models.models import User
+
+
+class PrincipalCache:
+    """LRU of token -> detached User, with a per-entry deadline."""
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES, ttl_seconds: int = PRINCIPAL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        # Sync dependencies run in the threadpool.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[User]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if expires_at <= time.monotonic():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def set(self, token: str, user: User, token_exp: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (time.monotonic() + ttl, user)
+            self._tokens_by_email.setdefault(user.email, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, email: str):
+        with self._lock:
+            for token in list(self._tokens_by_email.get(email, ())):
+                self._remove(token)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_email.clear()
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        email = entry[1].email
+        tokens = self._tokens_by_email.get(email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[email]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations
+        }
+
+
+principal_cache = PrincipalCache()
+
+
+# ---------------------------
+# Invalidation on user changes
+# ---------------------------
+@event.listens_for(Session, "before_flush")
+def collect_changed_users(session, flush_context, instances):
+    emails = session.info.setdefault("changed_user_emails", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and (obj in session.deleted or session.is_modified(obj)):
+            # Both the old and the new address, in case the email itself changed.
+            history = inspect(obj).attrs.email.history
+            emails.update(email for email in (history.deleted or ()) if email)
+            emails.add(obj.email)
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_users(session):
+    for email in session.info.pop("changed_user_emails", ()):
+        principal_cache.invalidate_user(email)
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_users(session):
+    session.info.pop("changed_user_emails", None)
@@ -0,0 +1,82 @@
+"""
+Benchmark event-loop blocking: sync SessionLocal vs AsyncSessionLocal inside async handlers.
+
+Each simulated request does a DB read (SELECT pg_sleep) and a slow "LLM call"
+(asyncio.sleep), the same shape as the chat and idea-message routes. With the sync
+session every DB round-trip stalls the whole event loop; with the async session
+the reads overlap with each other and with the in-flight LLM calls.
+
+Usage (from backend/):
+    python -m benchmarks.async_db_benchmark --requests 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import text
+from core.database import SessionLocal, AsyncSessionLocal, engine, async_engine
+
+app = FastAPI()
+DB_SECONDS = 0.02
+LLM_SECONDS = 0.5
+
+
+@app.get("/sync-db")
+async def sync_db():
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_sleep(:s)"), {"s": DB_SECONDS})
+    finally:
+        db.close()
+    await asyncio.sleep(LLM_SECONDS)
+    return {}
+
+
+@app.get("/async-db")
+async def async_db():
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("SELECT pg_sleep(:s)"), {"s": DB_SECONDS})
+    await asyncio.sleep(LLM_SECONDS)
+    return {}
+
+
+async def run(path, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{path:>10}: {total / elapsed:7.1f} req/s  p50 {p50:7.1f} ms  p99 {p99:7.1f} ms")
+
+
+async def main():
+    global DB_SECONDS, LLM_SECONDS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--db-seconds", type=float, default=DB_SECONDS)
+    parser.add_argument("--llm-seconds", type=float, default=LLM_SECONDS)
+    args = parser.parse_args()
+    DB_SECONDS, LLM_SECONDS = args.db_seconds, args.llm_seconds
+
+    await run("/sync-db", args.requests, args.concurrency)
+    await run("/async-db", args.requests, args.concurrency)
+    engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
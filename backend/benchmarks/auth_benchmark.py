@@ -0,0 +1,68 @@
+"""
+Benchmark per-request authentication overhead with and without the principal cache.
+
+Creates a throwaway user, issues a token for it and resolves that token the way
+get_current_user does, once per simulated request with a fresh session (as the
+get_db dependency provides). "uncached" clears the cache before every request,
+so each one decodes the JWT and queries users; "cached" only pays for the first.
+
+Usage (from backend/):
+    python -m benchmarks.auth_benchmark --requests 2000
+"""
+import argparse
+import time
+import uuid
+import numpy as np
+from core.database import SessionLocal, engine
+from models.models import User
+from auth.auth_dependencies import resolve_user
+from auth.principal_cache import principal_cache
+from routes.auth_routes import create_access_token
+
+
+def percentile(samples, pct):
+    return float(np.percentile(np.array(samples), pct)) * 1000
+
+
+def run(token, requests, cached):
+    principal_cache.clear()
+    timings = []
+    for _ in range(requests):
+        if not cached:
+            principal_cache.clear()
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            resolve_user(db, token)
+        finally:
+            db.close()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    email = f"auth-bench-{uuid.uuid4().hex}@example.com"
+    db = SessionLocal()
+    db.add(User(email=email, auth_provider="email"))
+    db.commit()
+    db.close()
+    token = create_access_token(data={"sub": email})
+    try:
+        print(f"{'mode':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>10}")
+        for mode, cached in (("uncached", False), ("cached", True)):
+            timings = run(token, args.requests, cached)
+            print(f"{mode:>9} {percentile(timings, 50):>9.3f} {percentile(timings, 99):>9.3f} {len(timings) / sum(timings):>10.0f}")
+    finally:
+        db = SessionLocal()
+        db.query(User).filter(User.email == email).delete()
+        db.commit()
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
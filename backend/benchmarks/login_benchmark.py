@@ -0,0 +1,98 @@
+"""
+Benchmark a login burst: bcrypt inline in sync routes vs the password hasher pool.
+
+"/login-inline" verifies the password the way login used to: a sync route calling
+bcrypt directly, which occupies one of the shared request threads per login.
+"/login-pooled" awaits services.password_hasher.verify_password. While a burst of
+logins runs, "/ping" (a sync route, like most routes here) is requested at a steady
+rate; its latency shows how much the burst stalls everything else.
+
+Usage (from backend/):
+    python -m benchmarks.login_benchmark --logins 200 --concurrency 100
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI, HTTPException
+from services.password_hasher import pwd_context, verify_password, shutdown_executor
+
+app = FastAPI()
+PASSWORD = "correct horse battery staple"
+HASH = pwd_context.hash(PASSWORD)
+
+
+@app.post("/login-inline")
+def login_inline():
+    if not pwd_context.verify(PASSWORD, HASH):
+        raise HTTPException(status_code=401)
+    return {}
+
+
+@app.post("/login-pooled")
+async def login_pooled():
+    valid, _ = await verify_password(PASSWORD, HASH)
+    if not valid:
+        raise HTTPException(status_code=401)
+    return {}
+
+
+@app.get("/ping")
+def ping():
+    return {}
+
+
+def summarize(name, latencies, elapsed=None):
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    rate = f"{len(latencies) / elapsed:7.1f} req/s  " if elapsed else " " * 15
+    print(f"{name:>14}: {rate}p50 {p50:8.1f} ms  p99 {p99:8.1f} ms")
+
+
+async def run(path, logins, concurrency, ping_interval):
+    semaphore = asyncio.Semaphore(concurrency)
+    login_latencies, ping_latencies = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one_login():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path)
+                if response.status_code == 200:
+                    login_latencies.append(time.perf_counter() - start)
+
+        async def pings(done):
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get("/ping")).raise_for_status()
+                ping_latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(ping_interval)
+
+        done = asyncio.Event()
+        pinger = asyncio.create_task(pings(done))
+        start = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await pinger
+    summarize(path, login_latencies, elapsed)
+    summarize("  /ping during", ping_latencies)
+    if len(login_latencies) < logins:
+        print(f"{'':>14}  {logins - len(login_latencies)} logins shed with 503")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--ping-interval", type=float, default=0.01)
+    args = parser.parse_args()
+
+    await run("/login-inline", args.logins, args.concurrency, args.ping_interval)
+    await run("/login-pooled", args.logins, args.concurrency, args.ping_interval)
+    shutdown_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
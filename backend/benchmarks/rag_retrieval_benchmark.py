@@ -0,0 +1,89 @@
+"""
+Benchmark RAG retrieval latency against corpus size.
+
+Builds a scratch copy of document_chunks filled with random 1536-dim vectors,
+then measures p50/p99 latency of the retriever query with a sequential scan
+and with the HNSW index at several ef_search values.
+
+Usage (from backend/):
+    python -m benchmarks.rag_retrieval_benchmark --sizes 1000 10000 50000 --queries 200
+"""
+import argparse
+import time
+import numpy as np
+from sqlalchemy import text
+from core.database import engine
+
+BENCH_TABLE = "document_chunks_bench"
+DIM = 1536
+
+
+def percentile(samples, pct):
+    return float(np.percentile(np.array(samples), pct)) * 1000
+
+
+def build_corpus(conn, size, rng):
+    conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    conn.execute(text(f"CREATE TABLE {BENCH_TABLE} (id serial PRIMARY KEY, content text, embedding vector({DIM}))"))
+    batch = 1000
+    for start in range(0, size, batch):
+        rows = [
+            {"content": f"chunk {i}", "embedding": rng.random(DIM).tolist()}
+            for i in range(start, min(start + batch, size))
+        ]
+        conn.execute(
+            text(f"INSERT INTO {BENCH_TABLE} (content, embedding) VALUES (:content, (:embedding)::vector)"),
+            rows
+        )
+
+
+def run_queries(conn, queries, ef_search=None, seq_scan=False):
+    timings = []
+    for q in queries:
+        if seq_scan:
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+        if ef_search:
+            conn.execute(text("SELECT set_config('hnsw.ef_search', :v, true)"), {"v": str(ef_search)})
+        start = time.perf_counter()
+        conn.execute(
+            text(f"SELECT content FROM {BENCH_TABLE} ORDER BY embedding <-> (:embedding)::vector LIMIT 5"),
+            {"embedding": q}
+        ).fetchall()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[20, 40, 100])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = [rng.random(DIM).tolist() for _ in range(args.queries)]
+
+    print(f"{'corpus':>8} {'mode':>14} {'p50 ms':>9} {'p99 ms':>9}")
+    for size in args.sizes:
+        with engine.begin() as conn:
+            build_corpus(conn, size, rng)
+        with engine.begin() as conn:
+            timings = run_queries(conn, queries, seq_scan=True)
+            print(f"{size:>8} {'seq scan':>14} {percentile(timings, 50):>9.2f} {percentile(timings, 99):>9.2f}")
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE INDEX ON {BENCH_TABLE} USING hnsw (embedding vector_l2_ops) "
+                "WITH (m = 16, ef_construction = 64)"
+            ))
+        for ef in args.ef_search:
+            with engine.begin() as conn:
+                timings = run_queries(conn, queries, ef_search=ef)
+                mode = f"hnsw ef={ef}"
+                print(f"{size:>8} {mode:>14} {percentile(timings, 50):>9.2f} {percentile(timings, 99):>9.2f}")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark node insertion/deletion on a large workflow graph.
+
+Builds a ~1k-node workflow (main steps with substep columns, the shape the canvas
+produces) and times random inserts and deletes against the in-memory WorkflowGraph,
+including the diff bookkeeping, plus a full auto-layout and the incremental layout
+after each insert (utils/layout.py). Each operation also reports how many rows its diff
+would write, which is what write_graph_diff sends to the database.
+
+Usage (from backend/):
+    python -m benchmarks.workflow_graph_benchmark --nodes 1000 --operations 2000
+"""
+import argparse
+import random
+import time
+import numpy as np
+from fastapi import HTTPException
+from utils.workflow_graph import WorkflowGraph
+from utils.layout import full_layout, layout_around
+
+INSERTION_TYPES = ["new_step", "after", "substep"]
+
+
+def build_rows(nodes, substeps_per_step):
+    steps, connections = [], []
+    step_id = 0
+    previous_main = None
+    while step_id < nodes:
+        step_id += 1
+        main_id = step_id
+        steps.append((main_id, None, main_id * 100.0, 0.0))
+        if previous_main is not None:
+            connections.append((len(connections) + 1, previous_main, main_id))
+        previous = main_id
+        for index in range(substeps_per_step):
+            if step_id >= nodes:
+                break
+            step_id += 1
+            steps.append((step_id, main_id, main_id * 100.0, 70.0 * (index + 1)))
+            connections.append((len(connections) + 1, previous, step_id))
+            previous = step_id
+        previous_main = main_id
+    return steps, connections
+
+
+def diff_rows(graph):
+    return (
+        len(graph.new_steps) + len(graph.step_changes) + len(graph.deleted_steps) +
+        len(graph.new_connections) + len(graph.connection_changes) + len(graph.deleted_connections)
+    )
+
+
+def reload(graph, next_id):
+    """The graph as WorkflowGraph.load would return it after write_graph_diff."""
+    ids = {}
+    for temp_id in graph.new_steps + graph.new_connections:
+        ids[temp_id] = next_id
+        next_id += 1
+    steps = [
+        (ids.get(step_id, step_id), ids.get(node.parent_id, node.parent_id), node.position_x, node.position_y)
+        for step_id, node in graph.steps.items()
+    ]
+    connections = [
+        (ids.get(connection_id, connection_id), ids.get(from_step, from_step), ids.get(to_step, to_step))
+        for connection_id, (from_step, to_step) in graph.connections.items()
+    ]
+    return WorkflowGraph(graph.assignment_id, steps, connections), next_id
+
+
+def percentile(samples, pct):
+    return float(np.percentile(np.array(samples), pct)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--substeps", type=int, default=4)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    steps, connections = build_rows(args.nodes, args.substeps)
+
+    start = time.perf_counter()
+    graph = WorkflowGraph(1, steps, connections)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f"build: {len(steps)} steps, {len(connections)} connections in {build_ms:.2f} ms")
+
+    start = time.perf_counter()
+    full_layout(graph)
+    print(f"full layout: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    timings = {"insert": [], "delete": [], "layout_around": []}
+    rows = {"insert": [], "delete": []}
+    next_id = len(steps) + len(connections) + 1
+    for _ in range(args.operations):
+        kind = "delete" if rng.random() < 0.5 and len(graph.steps) > 1 else "insert"
+        target = rng.choice(list(graph.steps))
+        start = time.perf_counter()
+        try:
+            if kind == "delete":
+                graph.delete(target)
+            else:
+                graph.insert("bench", target, insertion_type=rng.choice(INSERTION_TYPES))
+        except HTTPException:
+            continue
+        timings[kind].append(time.perf_counter() - start)
+        rows[kind].append(diff_rows(graph))
+        if kind == "insert":
+            start = time.perf_counter()
+            layout_around(graph, graph.new_steps[-1])
+            timings["layout_around"].append(time.perf_counter() - start)
+        # Each request loads the graph anew: persist the temporary ids and reset the diff.
+        graph, next_id = reload(graph, next_id)
+
+    for kind, samples in timings.items():
+        if not samples:
+            continue
+        print(
+            f"{kind:>6}: n={len(samples)} p50={percentile(samples, 50):.3f} ms "
+            f"p99={percentile(samples, 99):.3f} ms" +
+            (f" rows written: mean={np.mean(rows[kind]):.1f} max={max(rows[kind])}" if kind in rows else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,102 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 150))
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 
+# GET /metrics is only served to requests with "Authorization: Bearer <METRICS_TOKEN>";
+# without a token configured the endpoint is disabled (404).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Vector search tuning for RAG retrieval (pgvector).
+# ef_search applies to the HNSW index, probes to an IVFFlat index if one is used instead.
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 5))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", 40))
+RAG_IVFFLAT_PROBES = int(os.getenv("RAG_IVFFLAT_PROBES", 10))
+
+# Document ingestion: chunks per embeddings request and max requests in flight.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", 4))
+
+# Query-embedding cache: in-process LRU tier and optional Postgres tier.
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 2048))
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", 24 * 3600))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "false").lower() == "true"
+EMBEDDING_CACHE_PERSIST_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_PERSIST_TTL_SECONDS", 30 * 24 * 3600))
+
+# PDF extraction process pool.
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", 50 * 1024 * 1024))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 500))
+
+# Database connection pools (applied to both the sync and async engines, so the
+# worst case per process is 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side statement_timeout in milliseconds; 0 disables it.
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+# Maximum operations accepted by POST /assignments/{id}/batch.
+GRAPH_BATCH_MAX_OPERATIONS = int(os.getenv("GRAPH_BATCH_MAX_OPERATIONS", 500))
+
+# Canvas drag channel (WebSocket /assignments/{id}/positions): coalesced positions
+# are flushed every POSITION_FLUSH_INTERVAL_MS, on drag end, or once this many steps are pending.
+POSITION_FLUSH_INTERVAL_MS = int(os.getenv("POSITION_FLUSH_INTERVAL_MS", 500))
+POSITION_MAX_PENDING = int(os.getenv("POSITION_MAX_PENDING", 1000))
+
+# Authenticated-principal cache (auth/principal_cache.py). Entries never outlive the
+# token's exp; the TTL also bounds staleness across worker processes.
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+
+# Password hashing (services/password_hasher.py). Hashes are computed in a dedicated
+# thread pool so login bursts can't take over the request threadpool. Stored hashes
+# with a different cost are re-hashed at the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# Hash requests allowed to wait for a worker before new ones are rejected with 503.
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+
+# LLM gateway (services/llm_gateway.py): one pooled OpenAI client for all LLM and
+# embedding calls. Requests over a limit wait in line instead of failing.
+# LLM_PER_USER_CONCURRENCY applies to calls made for a user (bind_user); calls with no
+# user bound (ingestion, /test-gpt) are only limited by the global cap and budgets.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+LLM_PER_USER_CONCURRENCY = int(os.getenv("LLM_PER_USER_CONCURRENCY", 3))
+# Budgets slightly under the account's OpenAI limits avoid 429s; 0 disables a budget.
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 3000))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 1000000))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
+
+# LLM response cache for workflow generation and deep dives (services/response_cache.py).
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 6 * 3600))
+# Opt-in: also reuse a response whose query embedding is this similar (cosine) to the
+# new one, when everything else in the request (context chunks, parameters) is identical.
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD", 0.98))
+# Share one upstream call among identical concurrent chat/embedding requests.
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true"
+
+# Prompt assembly (services/prompt_builder.py). Token budget for the whole prompt and
+# for each component; over budget, history is trimmed first, then RAG notes, the
+# spec/assignment text, the system prompt, and the user's question last.
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", 12000))
+PROMPT_BUDGET_SYSTEM = int(os.getenv("PROMPT_BUDGET_SYSTEM", 3000))
+PROMPT_BUDGET_RAG = int(os.getenv("PROMPT_BUDGET_RAG", 2500))
+PROMPT_BUDGET_HISTORY = int(os.getenv("PROMPT_BUDGET_HISTORY", 2000))
+PROMPT_BUDGET_SPEC = int(os.getenv("PROMPT_BUDGET_SPEC", 6000))
+PROMPT_BUDGET_QUESTION = int(os.getenv("PROMPT_BUDGET_QUESTION", 1500))
+
+# Background jobs (services/job_queue.py, run by worker.py). A failed attempt is retried
+# after JOB_RETRY_BASE_SECONDS * 2^(attempt - 1) until JOB_MAX_ATTEMPTS is used up; a
+# running job whose worker stopped renewing its lease for JOB_LEASE_SECONDS is claimed again.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", 10))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 600))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1.0))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", 8))
+# How often GET /jobs/{id}/events checks the job for changes.
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", 0.5))
@@ -1,17 +1,22 @@
 from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from core.database import SessionLocal, engine, Base
+from core.database import engine, Base, get_db
 from models.models import Assignment, Step, Connection, User
 from services.gpt_workflow import generate_assignment_workflow
+from services.pdf_extractor import (
+    iter_pages, format_pages, read_upload, check_page_limit, shutdown_executor,
+    PdfTooLargeError, PdfTooManyPagesError
+)
+from services import password_hasher
 from datetime import datetime
 import uvicorn
 import asyncio
 from typing import List, Optional
 import os
-import tempfile
-import PyPDF2
+import json
 import shutil
 
 # Import routers
@@ -24,6 +29,11 @@ from routes.chat_routes import router as chat_router
 from routes.connection_routes import router as connection_router  # Import new connection router
 from routes.idea_session_routes import router as idea_session_router  # Import idea session router
 from routes.idea_message_routes import router as idea_message_router  # Import idea message router
+from routes.metrics_routes import router as metrics_router
+from routes.job_routes import router as job_router
+
+# Registers the before_flush hook that bumps assignment graph revisions.
+import utils.revisions
 
 # Import current user dependency
 from auth.auth_dependencies import get_current_user
@@ -41,7 +51,8 @@ app.add_middleware(
                    "https://assignment-workflow-mocha.vercel.app"],  # Frontend URL
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept"],
+    allow_headers=["Content-Type", "Authorization", "Accept", "If-None-Match", "Idempotency-Key"],
+    expose_headers=["ETag", "Location"],
 )
 
 # Include routers
@@ -54,50 +65,54 @@ app.include_router(connection_router)  # Add the new connection router
 # app.include_router(idea_router)
 app.include_router(idea_session_router)  # Add the idea session router
 app.include_router(idea_message_router)  # Add the idea message router
+app.include_router(metrics_router)
+app.include_router(job_router)
+
+@app.on_event("shutdown")
+def shutdown_pdf_extractor():
+    shutdown_executor()
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown_executor()
 
 
 # Pydantic model for assignment creation.
 class AssignmentRequest(BaseModel):
     assignment_input: str
 
-# Dependency to provide DB session.
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
     
+async def read_pdf_uploads(files: List[UploadFile]):
+    """
+    Read each uploaded PDF straight from the spooled upload and enforce the size and
+    page limits before any extraction starts. Returns (filename, data, page_count) tuples.
+    """
+    uploads = []
+    for file in files:
+        if file.filename.endswith('.pdf'):
+            try:
+                data = await read_upload(file)
+                page_count = await check_page_limit(data)
+            except (PdfTooLargeError, PdfTooManyPagesError) as e:
+                raise HTTPException(status_code=413, detail=f"{file.filename}: {e}")
+            uploads.append((file.filename, data, page_count))
+    return uploads
+
 @app.post("/test-pdf-extraction")
 async def test_pdf_extraction(
     files: List[UploadFile] = File(...),
     current_user: User = Depends(get_current_user)
 ):
     try:
-        extracted_text = ""
+        extracted_parts = []
         processed_files = []
         
-        for file in files:
-            if file.filename.endswith('.pdf'):
-                processed_files.append(file.filename)
-                with tempfile.NamedTemporaryFile(delete=False) as temp:
-                    await file.seek(0)  # Reset file position
-                    content = await file.read()
-                    temp.write(content)
-                    temp_path = temp.name
-                
-                try:
-                    with open(temp_path, 'rb') as pdf_file:
-                        pdf_reader = PyPDF2.PdfReader(pdf_file)
-                        for page_num in range(len(pdf_reader.pages)):
-                            page = pdf_reader.pages[page_num]
-                            page_text = page.extract_text()
-                            if page_text:
-                                extracted_text += f"--- Page {page_num + 1} ---\n{page_text}\n\n"
-                finally:
-                    os.unlink(temp_path)
+        for filename, data, page_count in await read_pdf_uploads(files):
+            processed_files.append(filename)
+            pages = [page_text async for _, page_text in iter_pages(data, total_pages=page_count)]
+            extracted_parts.append(format_pages(pages))
         
+        extracted_text = "".join(extracted_parts)
         return {
             "success": True,
             "processed_files": processed_files,
@@ -106,10 +121,35 @@ async def test_pdf_extraction(
             "full_text": extracted_text
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print("Error in test-pdf-extraction endpoint:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/pdf-extraction/stream")
+async def stream_pdf_extraction(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Extract PDFs and stream one NDJSON line per page as soon as it is parsed:
+    {"file": ..., "page": ..., "pages": ..., "text": ...}, then a final {"done": true} line.
+    """
+    uploads = await read_pdf_uploads(files)
+
+    async def page_lines():
+        try:
+            for filename, data, page_count in uploads:
+                async for page_num, page_text in iter_pages(data, total_pages=page_count):
+                    yield json.dumps({"file": filename, "page": page_num, "pages": page_count, "text": page_text}) + "\n"
+            yield json.dumps({"done": True, "processed_files": [filename for filename, _, _ in uploads]}) + "\n"
+        except Exception as e:
+            print("Error in pdf-extraction stream:", e)
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(page_lines(), media_type="application/x-ndjson")
+
 @app.post("/test-gpt")
 def test_gpt(body: dict):
     """
@@ -3,7 +3,7 @@
 import datetime, uuid
 from sqlalchemy import (
     Column, Integer, String, Boolean, Float, Text, ForeignKey, TIMESTAMP,
-    DateTime, Enum as SQLEnum, UniqueConstraint
+    DateTime, Enum as SQLEnum, UniqueConstraint, Index
 )
 from sqlalchemy.orm import relationship
 from core.database import Base  # Import the Base from database.py
@@ -19,7 +19,46 @@ class DocumentChunk(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     content = Column(Text)
     embedding = Column(Vector(1536))
-    source = Column(Text)
+    source = Column(Text, index=True)
+    # sha256 of the chunk content, used to skip re-embedding unchanged chunks.
+    content_hash = Column(String(64), index=True)
+
+    __table_args__ = (
+        # Approximate nearest-neighbour index for retrieval. rag_retriever orders by
+        # L2 distance (<->), so the index must use the matching vector_l2_ops opclass.
+        Index(
+            "ix_document_chunks_embedding_hnsw",
+            embedding,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_l2_ops"},
+        ),
+    )
+
+class DocumentSource(Base):
+    """
+    Ingestion manifest: one row per ingested document, used to skip unchanged
+    files and to find chunks that belong to modified or removed files.
+    """
+    __tablename__ = "document_sources"
+
+    source = Column(Text, primary_key=True)
+    file_hash = Column(String(64), nullable=False)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    embedding_model = Column(String, nullable=False)
+    updated_at = Column(DateTime, nullable=False,
+                        default=datetime.datetime.utcnow,
+                        onupdate=datetime.datetime.utcnow)
+
+class QueryEmbedding(Base):
+    """Persistent tier of the query-embedding cache (services/embedding_cache.py)."""
+    __tablename__ = "query_embeddings"
+
+    # sha256 of (model, normalized text)
+    cache_key = Column(String(64), primary_key=True)
+    model = Column(String, nullable=False)
+    embedding = Column(Vector(1536), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
 
 # ---------------------
 # User Model
@@ -65,6 +104,9 @@ class Assignment(Base):
     completed = Column(Boolean, default=False)
     # Timestamp when the assignment was created.
     created_at = Column(TIMESTAMP, default=datetime.datetime.utcnow)
+    # Graph revision, bumped on every change to the assignment, its steps or its
+    # connections (see utils/revisions.py). Used for ETags and delta loads.
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationship: each assignment belongs to a user.
     owner = relationship("User", back_populates="assignments")
@@ -75,6 +117,11 @@ class Assignment(Base):
     # Relationship: one assignment has many chat messages (for the unified chatbot).
     chat_messages = relationship("ChatMessage", back_populates="assignment", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Dashboard: a user's assignments, newest first.
+        Index("ix_assignments_user_id_created_at", "user_id", "created_at"),
+    )
+
 
 # ---------------------
 # Step Model (represents a node or step in the flowchart)
@@ -96,12 +143,21 @@ class Step(Base):
     position_y = Column(Float, nullable=False)
     # Boolean indicating if this step is marked as completed.
     completed = Column(Boolean, default=False)
+    # Assignment revision at which this step was last created or changed.
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationship: each step belongs to an assignment.
     assignment = relationship("Assignment", back_populates="steps")
     # Self-referential relationship: a step can have multiple sub-steps.
     sub_steps = relationship("Step", backref="parent", remote_side=[id])
 
+    __table_args__ = (
+        Index("ix_steps_assignment_id", "assignment_id"),
+        # Children of a step, ordered top to bottom (delete_node promotion).
+        Index("ix_steps_parent_id_position_y", "parent_id", "position_y"),
+        Index("ix_steps_assignment_id_revision", "assignment_id", "revision"),
+    )
+
 
 # ---------------------
 # Connection Model (represents an edge/connection between two steps)
@@ -117,9 +173,42 @@ class Connection(Base):
     from_step = Column(Integer, ForeignKey("steps.id", ondelete="CASCADE"), nullable=False)
     # The ending step of the connection.
     to_step = Column(Integer, ForeignKey("steps.id", ondelete="CASCADE"), nullable=False)
+    # Assignment revision at which this connection was last created or changed.
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationship: each connection belongs to an assignment.
     assignment = relationship("Assignment", back_populates="connections")
+    # Many-to-one links to the connected steps. Besides navigation, they make the unit
+    # of work insert new steps before connections that reference them in one flush.
+    source_step = relationship("Step", foreign_keys=[from_step])
+    target_step = relationship("Step", foreign_keys=[to_step])
+
+    __table_args__ = (
+        # Also serves plain assignment_id lookups and the duplicate-connection check.
+        Index("ix_connections_assignment_id_from_to", "assignment_id", "from_step", "to_step"),
+        Index("ix_connections_from_step", "from_step"),
+        Index("ix_connections_to_step", "to_step"),
+        Index("ix_connections_assignment_id_revision", "assignment_id", "revision"),
+    )
+
+
+# ---------------------
+# GraphTombstone Model (records deleted steps/connections for delta loads)
+# ---------------------
+class GraphTombstone(Base):
+    __tablename__ = "graph_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), nullable=False)
+    # "step" or "connection"
+    kind = Column(String, nullable=False)
+    object_id = Column(Integer, nullable=False)
+    # Assignment revision at which the object was deleted.
+    revision = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_graph_tombstones_assignment_id_revision", "assignment_id", "revision"),
+    )
 
 
 # ---------------------
@@ -144,6 +233,50 @@ class ChatMessage(Base):
     # Relationship: each chat message belongs to an assignment.
     assignment = relationship("Assignment", back_populates="chat_messages")
 
+    __table_args__ = (
+        # Assignment-level history (step_id IS NULL) in timestamp order.
+        Index("ix_chat_messages_assignment_step_timestamp", "assignment_id", "step_id", "timestamp"),
+        # Node history in timestamp order.
+        Index("ix_chat_messages_step_id_timestamp", "step_id", "timestamp"),
+    )
+
+
+# ---------------------
+# Job Model (background LLM work, see services/job_queue.py)
+# ---------------------
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # "workflow" or "deep_dive"
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    # queued -> running -> succeeded | failed (a failed attempt with retries left goes back to queued)
+    status = Column(String, nullable=False, default="queued")
+    # Current stage of a running job, for status polling and SSE.
+    progress = Column(String, nullable=True)
+    result = Column(JSONB, nullable=True)
+    # Error of the last failed attempt.
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    # Client-supplied Idempotency-Key; a retried request gets the original job back.
+    idempotency_key = Column(String, nullable=True)
+    # A queued job is not claimed before this time (retry backoff).
+    run_after = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    # Set by the worker holding the job; a lease older than JOB_LEASE_SECONDS can be reclaimed.
+    locked_at = Column(DateTime, nullable=True)
+    lock_token = Column(String(32), nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "idempotency_key", name="uq_jobs_user_id_idempotency_key"),
+        # Claim query: queued or running jobs in run_after order.
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
 # ───────── NEW TABLES (Flowde 2.0) ─────────
 
 # Enum for session status
@@ -185,6 +318,10 @@ class IdeaSession(Base):
                               cascade="all, delete-orphan",
                               order_by="SpecChange.created_at")
 
+    __table_args__ = (
+        Index("ix_idea_sessions_user_id_created_at", "user_id", "created_at"),
+    )
+
 class IdeaMessage(Base):
     __tablename__ = "idea_messages"
 
@@ -204,6 +341,10 @@ class IdeaMessage(Base):
 
     session = relationship("IdeaSession", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_idea_messages_session_id_created_at", "session_id", "created_at"),
+    )
+
 class SpecChange(Base):
     __tablename__ = "spec_changes"
 
@@ -225,6 +366,10 @@ class SpecChange(Base):
     
     session = relationship("IdeaSession", back_populates="spec_changes")
 
+    __table_args__ = (
+        Index("ix_spec_changes_session_id_created_at", "session_id", "created_at"),
+    )
+
 class Node(Base):
     """
     A graph node representing a component in the tech stack flowchart.
@@ -1,20 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from core.database import SessionLocal
+from core.database import get_db
 from models.models import Assignment, Step, Connection
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
+from utils.graph_loader import load_revision, load_graph_json, compact_graph
 
 router = APIRouter()
 
-# Dependency: Provide a database session per request
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Pydantic models for API responses
 class ConnectionModel(BaseModel):
     id: int
@@ -44,32 +38,56 @@ class AssignmentDetailModel(BaseModel):
     class Config:
         orm_mode = True
 
+def graph_etag(assignment_id: int, revision: int, graph_format: str, since: Optional[int]) -> str:
+    tag = f"{assignment_id}-{revision}-{graph_format}"
+    if since is not None:
+        tag += f"-since-{since}"
+    return f'"{tag}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
 @router.get("/assignments/{assignment_id}", response_model=AssignmentDetailModel)
-def get_assignment_details(assignment_id: int, db: Session = Depends(get_db)):
+def get_assignment_details(
+    assignment_id: int,
+    request: Request,
+    graph_format: Literal["full", "compact"] = Query("full", alias="format"),
+    since: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db)
+):
     """
     Get detailed information about a specific assignment, including all steps and connections.
     This endpoint is used by the React Flow chart to visualize the assignment.
+
+    The graph is loaded with a single query. ?format=compact returns steps and
+    connections as parallel arrays (see utils/graph_loader.compact_graph).
+
+    Responses carry an ETag derived from the assignment's revision; a matching
+    If-None-Match gets a 304 after a single primary-key lookup. ?since=<revision>
+    returns only the steps/connections changed after that revision, plus
+    deleted_steps/deleted_connections id lists.
     """
-    # Query the assignment
-    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
-    if not assignment:
+    revision = load_revision(db, assignment_id)
+    if revision is None:
         raise HTTPException(status_code=404, detail="Assignment not found")
-    
-    # Query all steps for this assignment
-    steps = db.query(Step).filter(Step.assignment_id == assignment_id).all()
-    
-    # Query all connections for this assignment
-    connections = db.query(Connection).filter(Connection.assignment_id == assignment_id).all()
-    
-    # Create the response model
-    response = {
-        "id": assignment.id,
-        "title": assignment.title,
-        "description": assignment.description,
-        "deadline": assignment.deadline.isoformat() if assignment.deadline else None,
-        "completed": assignment.completed,
-        "steps": steps,
-        "connections": connections
+    current_etag = graph_etag(assignment_id, revision, graph_format, since)
+    if etag_matches(request.headers.get("if-none-match"), current_etag):
+        return Response(status_code=304, headers={"ETag": current_etag})
+
+    loaded = load_graph_json(db, assignment_id, since)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    # The graph may be newer than the revision checked above; tag what is actually sent.
+    revision, graph_json = loaded
+    headers = {
+        "ETag": graph_etag(assignment_id, revision, graph_format, since),
+        "Cache-Control": "private, no-cache"
     }
     
-    return response
\ No newline at end of file
+    if graph_format == "compact":
+        return ORJSONResponse(compact_graph(graph_json), headers=headers)
+    # Postgres already produced the JSON document; send it without re-encoding.
+    return Response(content=graph_json, media_type="application/json", headers=headers)
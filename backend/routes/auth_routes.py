@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from core.database import SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import get_db, get_async_db
 from models.models import User
 from pydantic import BaseModel
-from passlib.context import CryptContext
+from services.password_hasher import hash_password, verify_password, PasswordHasherBusy
 import jwt
 from datetime import datetime, timedelta
 from typing import Optional
@@ -24,9 +26,6 @@ SECRET_KEY = SECRET_KEY
 ALGORITHM = ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = ACCESS_TOKEN_EXPIRE_MINUTES
 
-# Password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Pydantic models for requests and responses.
 class UserCreate(BaseModel):
     email: str
@@ -42,20 +41,12 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-# Dependency to get DB session.
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Utility functions for password hashing and verification.
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins right now, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -68,13 +59,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 # Signup endpoint
+# Signup and login are async: bcrypt runs in the password hasher's own pool
+# (services/password_hasher.py) and the queries use the async session, so neither
+# occupies a request thread while a hash is computed.
 @router.post("/signup", response_model=Token)
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(User).filter(User.email == user.email).first()
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    existing_user = (await db.execute(select(User.id).where(User.email == user.email))).scalar()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    try:
+        hashed_password = await hash_password(user.password)
+    except PasswordHasherBusy:
+        raise hasher_busy()
     new_user = User(
     email=user.email,
     password_hash=hashed_password,
@@ -82,21 +79,30 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     last_name=user.last_name
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     
     access_token = create_access_token(data={"sub": new_user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Login endpoint
 @router.post("/login", response_model=Token)
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.password_hash):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(select(User).where(User.email == user.email))).scalar()
+    # End the read transaction so the connection isn't held while bcrypt runs.
+    await db.commit()
+    try:
+        valid, upgraded_hash = await verify_password(user.password, db_user.password_hash if db_user else None)
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
+    if upgraded_hash:
+        # The stored hash used another cost factor; replace it while we have the password.
+        db_user.password_hash = upgraded_hash
+        await db.commit()
     
     access_token = create_access_token(data={"sub": db_user.email})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,32 +1,29 @@
 # chat_routes.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 import json
 import asyncio
+from contextlib import aclosing
 
 # Import models and dependencies
 from models.models import ChatMessage, Assignment, Step, User, Connection
-from core.database import SessionLocal
-from auth.auth_dependencies import get_current_user
+from core.database import AsyncSessionLocal, get_db, get_async_db
+from auth.auth_dependencies import get_current_user, get_llm_user
 from services.gpt_workflow import generate_assignment_workflow
-from services.gpt_chat import (generate_assignment_chat_response, generate_node_chat_response)
-from services.deep_dive import generate_deep_dive_breakdown
-from utils.node_operations import create_node
+from services.gpt_chat import (
+    build_assignment_chat_messages, build_node_chat_messages, complete_chat, stream_chat_response
+)
+from services.deep_dive import generate_deep_dive_breakdown, node_deep_dive_context, save_deep_dive
 
 
 router = APIRouter()
 
-# Dependency: provide DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # -------------------------------
 # Pydantic models for chat messages
 # -------------------------------
@@ -96,65 +93,135 @@ def get_node_chat(node_id: int, db: Session = Depends(get_db), current_user: Use
     ).order_by(ChatMessage.timestamp).all()
     return messages
 
-# ------------------------------------------------
-# POST /chat
-# Create a new chat message (assignment-level or node-specific).
-# This endpoint calls the GPT helper to generate a reply,
-# then stores the user query and GPT response in the DB.
-# ------------------------------------------------
-@router.post("/chat", response_model=ChatMessageResponse)
-async def post_chat_message(chat: ChatMessageCreate, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def load_chat_context(chat: ChatMessageCreate, db: AsyncSession, current_user: User):
+    """
+    Verify ownership and collect the arguments the GPT chat helpers need.
+    Returns ("assignment" | "node", kwargs).
+    """
     # Verify assignment ownership.
-    assignment = db.query(Assignment).filter(
-        Assignment.id == chat.assignment_id, 
-        Assignment.user_id == current_user.id
-    ).first()
+    assignment = (await db.execute(
+        select(Assignment).where(
+            Assignment.id == chat.assignment_id, 
+            Assignment.user_id == current_user.id
+        )
+    )).scalars().first()
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found or not authorized")
     
     if chat.is_deepdive:
         raise HTTPException(status_code=400, detail="Use /chat/deepdive/{node_id} endpoint for deep dives")
-    else:
-        if chat.step_id is None:
-            recent_messages = db.query(ChatMessage).filter(
+    if chat.step_id is None:
+        recent_messages = (await db.execute(
+            select(ChatMessage).where(
                 ChatMessage.assignment_id == chat.assignment_id,
                 ChatMessage.step_id.is_(None)
-            ).order_by(ChatMessage.timestamp.desc()).limit(5).all()
-            # Assignment-level chat.
-            bot_response = await generate_assignment_chat_response(
-                chat.user_message, 
-                assignment_title=assignment.title, 
-                assignment_description=assignment.description,
-                recent_messages=recent_messages
-            )
-        else:
-            # Node-specific chat.
-            node = db.query(Step).filter(Step.id == chat.step_id).first()
-            if not node:
-                raise HTTPException(status_code=404, detail="Node not found")
-            # Retrieve the last 5 messages for this node.
-            recent_node_messages = db.query(ChatMessage).filter(
-                ChatMessage.step_id == chat.step_id
-            ).order_by(ChatMessage.timestamp.desc()).limit(5).all()
-            bot_response = await generate_node_chat_response(
-                chat.user_message, 
-                assignment_title=assignment.title, 
-                assignment_description=assignment.description,
-                node_content=node.content,
-                recent_node_messages=recent_node_messages
-            )
-        
-        new_message = ChatMessage(
-            assignment_id=chat.assignment_id,
-            step_id=chat.step_id,
-            user_message=chat.user_message,  # Store only the user's question (without added context)
-            bot_response=bot_response,
-            timestamp=datetime.utcnow()
+            ).order_by(ChatMessage.timestamp.desc()).limit(5)
+        )).scalars().all()
+        # Assignment-level chat.
+        return "assignment", dict(
+            question=chat.user_message,
+            assignment_title=assignment.title,
+            assignment_description=assignment.description,
+            recent_messages=recent_messages
         )
-        db.add(new_message)
-        db.commit()
-        db.refresh(new_message)
-        return new_message
+    # Node-specific chat.
+    node = await db.get(Step, chat.step_id)
+    if not node:
+        raise HTTPException(status_code=404, detail="Node not found")
+    # Retrieve the last 5 messages for this node.
+    recent_node_messages = (await db.execute(
+        select(ChatMessage).where(
+            ChatMessage.step_id == chat.step_id
+        ).order_by(ChatMessage.timestamp.desc()).limit(5)
+    )).scalars().all()
+    return "node", dict(
+        question=chat.user_message,
+        assignment_title=assignment.title,
+        assignment_description=assignment.description,
+        node_content=node.content,
+        recent_node_messages=recent_node_messages
+    )
+
+async def build_chat_messages(kind: str, context: dict, db: AsyncSession) -> list:
+    """
+    Build the GPT messages (RAG retrieval runs on the request's session), then end the
+    read transaction so the pooled connection is released before the slow LLM call.
+    """
+    if kind == "assignment":
+        messages = await build_assignment_chat_messages(**context, db=db)
+    else:
+        messages = await build_node_chat_messages(**context, db=db)
+    await db.commit()
+    return messages
+
+async def save_chat_message(db: AsyncSession, chat: ChatMessageCreate, bot_response: str) -> ChatMessage:
+    new_message = ChatMessage(
+        assignment_id=chat.assignment_id,
+        step_id=chat.step_id,
+        user_message=chat.user_message,  # Store only the user's question (without added context)
+        bot_response=bot_response,
+        timestamp=datetime.utcnow()
+    )
+    db.add(new_message)
+    await db.commit()
+    await db.refresh(new_message)
+    return new_message
+
+# ------------------------------------------------
+# POST /chat
+# Create a new chat message (assignment-level or node-specific).
+# This endpoint calls the GPT helper to generate a reply,
+# then stores the user query and GPT response in the DB.
+# ------------------------------------------------
+@router.post("/chat", response_model=ChatMessageResponse)
+async def post_chat_message(chat: ChatMessageCreate, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_llm_user)):
+    kind, context = await load_chat_context(chat, db, current_user)
+    messages = await build_chat_messages(kind, context, db)
+    bot_response = await complete_chat(messages)
+    return await save_chat_message(db, chat, bot_response)
+
+# ------------------------------------------------
+# POST /chat/stream
+# Same as POST /chat, but forwards tokens as server-sent events while the
+# completion is generated:
+#   event: token  data: {"token": "..."}
+#   event: done   data: <ChatMessageResponse>
+#   event: error  data: {"detail": "..."}
+# The ChatMessage is only stored once the stream completes. If the client
+# disconnects, the upstream completion is closed and nothing is stored.
+# ------------------------------------------------
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/chat/stream")
+async def stream_chat_message(chat: ChatMessageCreate, request: Request, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_llm_user)):
+    kind, context = await load_chat_context(chat, db, current_user)
+    messages = await build_chat_messages(kind, context, db)
+
+    async def events():
+        tokens = []
+        try:
+            async with aclosing(stream_chat_response(messages)) as stream:
+                async for token in stream:
+                    if await request.is_disconnected():
+                        return
+                    tokens.append(token)
+                    yield format_sse("token", {"token": token})
+        except Exception as e:
+            print(f"Error during streamed chat: {e}")
+            yield format_sse("error", {"detail": "Chat response failed"})
+            return
+
+        # The request-scoped session is already closed once streaming starts.
+        async with AsyncSessionLocal() as stream_db:
+            new_message = await save_chat_message(stream_db, chat, "".join(tokens).strip())
+            yield format_sse("done", ChatMessageResponse.model_validate(new_message, from_attributes=True).model_dump(mode="json"))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ------------------------------------------------
 # POST /chat/deepdive/{node_id}
@@ -167,65 +234,21 @@ class DeepDiveRequest(BaseModel):
 
 
 @router.post("/chat/deepdive/{node_id}", response_model=DeepDiveResponse)
-async def deep_dive_node(node_id: int, request: DeepDiveRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def deep_dive_node(node_id: int, request: DeepDiveRequest, db: Session = Depends(get_db), current_user: User = Depends(get_llm_user)):
     # Verify node exists and belongs to current user
     node = db.query(Step).filter(Step.id == node_id).first()
     if not node or node.assignment.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Node not found or not authorized")
     
-    assignment = db.query(Assignment).filter(Assignment.id == node.assignment_id).first()
-    
-    # Use the question from the request
-    node_context = f"Assignment: {assignment.title}\nDescription: {assignment.description}\nNode Content: {node.content}\n"
-    node_context += f"\nUser Deep Dive Question: {request.question}\n"
-    
+    node_context = node_deep_dive_context(node.assignment, node, request.question)
     breakdown = await generate_deep_dive_breakdown(node_context, extra_context=request.question)
     if not breakdown:
         raise HTTPException(status_code=500, detail="Deep dive breakdown failed")
     
-    breakdown_steps = breakdown["new_steps"]
-    created_steps = []
-    reference_node_id = node.id  # Start with the original node as reference
-    
-    for idx, substep in enumerate(breakdown_steps):
-        content = substep.get("content", "")
-        
-        # Determine insertion logic
-        if node.parent_id is None:  # Parent node
-            if idx == 0:
-                insertion_type = "new_step"
-            else:
-                insertion_type = "after"
-        else:  # Child node
-            if idx == 0:
-                insertion_type = "substep"
-            else:
-                insertion_type = "after"
-        
-        # Use the shared utility function
-        new_step = create_node(
-            db=db,
-            current_user=current_user,
-            assignment_id=node.assignment_id,
-            content=content,
-            reference_node_id=reference_node_id,
-            insertion_type=insertion_type
-        )
-        
-        created_steps.append(new_step)
-        reference_node_id = new_step.id  # Update reference for next iteration
-    
-    # Store chat message
-    new_chat = ChatMessage(
-        assignment_id=node.assignment_id,
-        step_id=node_id,
-        user_message=request.question,
-        bot_response=json.dumps({"substeps": [s.content for s in created_steps]}),
-        timestamp=datetime.utcnow()
-    )
-    db.add(new_chat)
+    # Insert all substeps (and their connections) in one flush, with the chat message.
+    created_steps = save_deep_dive(db, node, request.question, breakdown)
+    # Build the response before commit expires the new rows.
+    breakdown_steps = [StepModel.from_orm(step) for step in created_steps]
     db.commit()
 
-    # Convert to response model
-    breakdown_steps = [StepModel.from_orm(step) for step in created_steps]
-    return DeepDiveResponse(breakdown_steps=breakdown_steps)
\ No newline at end of file
+    return DeepDiveResponse(breakdown_steps=breakdown_steps)
@@ -3,19 +3,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from models.models import Connection, Assignment, User
-from core.database import SessionLocal
+from models.models import Connection, Assignment, Step, User
+from core.database import get_db
 from auth.auth_dependencies import get_current_user
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class ConnectionCreate(BaseModel):
     assignment_id: int
     from_step: int
@@ -35,6 +28,12 @@ def create_connection(
     if assignment.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to modify this assignment")
     
+    # Both steps must belong to this assignment
+    endpoints = {connection.from_step, connection.to_step}
+    found = db.query(Step.id).filter(Step.id.in_(endpoints), Step.assignment_id == assignment.id).count()
+    if found != len(endpoints):
+        raise HTTPException(status_code=404, detail="Step not found in this assignment")
+    
     # Check if connection already exists
     existing_connection = db.query(Connection).filter(
         Connection.assignment_id == connection.assignment_id,
@@ -3,21 +3,13 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 from models.models import Assignment, Step
-from core.database import SessionLocal
+from core.database import get_db
 from auth.auth_dependencies import get_current_user  # Ensure this dependency is defined as shown earlier
 from models.models import User
 from sqlalchemy import desc
 
 router = APIRouter()
 
-# Dependency to get a DB session.
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Pydantic model for a summary of an assignment.
 class AssignmentSummary(BaseModel):
     id: int
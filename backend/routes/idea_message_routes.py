@@ -1,26 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List, Dict
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime
+from contextlib import aclosing
+import json
 
-from core.database import SessionLocal
+from core.database import AsyncSessionLocal, get_async_db
 from models.models import IdeaSession, IdeaMessage, User, SpecChange
-from auth.auth_dependencies import get_current_user
-from services.architect_gpt import call_architect_gpt
+from auth.auth_dependencies import get_llm_user
+from services.architect_gpt import call_architect_gpt, stream_architect_gpt
 from services.spec_service import markdown_to_json
 
 router = APIRouter()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class MessageRequest(BaseModel):
     session_id: UUID
     user_msg: str
@@ -32,138 +28,221 @@ class MessageResponse(BaseModel):
     updated_sections: list[str]
     changes_made: Optional[list[dict]] = []  # New field for Phase 1
 
-@router.post("/api/idea/message", response_model=MessageResponse)
-async def process_idea_message(
-    request: MessageRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Process a new message in an idea session.
-    Stores the message, gets GPT response, and updates the spec if needed.
-    """
+async def get_owned_session(db: AsyncSession, session_id: UUID, current_user: User) -> IdeaSession:
     # Get the session and verify ownership
-    session = db.query(IdeaSession).filter(
-        IdeaSession.id == request.session_id,
-        IdeaSession.user_id == current_user.id
-    ).first()
+    session = (await db.execute(
+        select(IdeaSession).where(
+            IdeaSession.id == session_id,
+            IdeaSession.user_id == current_user.id
+        )
+    )).scalars().first()
     
     if not session:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Session not found or you don't have permission to access it"
         )
+    return session
+
+async def load_message_context(db: AsyncSession, session: IdeaSession) -> Dict:
+    """
+    Collect the keyword arguments ArchitectGPT needs (everything except the
+    user message and skill level) for the next message in a session.
+    """
+    # Check if this is the first message
+    is_first_message = (await db.execute(
+        select(IdeaMessage.id).where(IdeaMessage.session_id == session.id).limit(1)
+    )).first() is None
+    
+    # Get current context summary if it exists
+    current_context = None
+    if session.context_summaries and len(session.context_summaries) > 0:
+        current_context = session.context_summaries[-1]
+    
+    # Get message history
+    message_history = []
+    previous_messages = (await db.execute(
+        select(IdeaMessage)
+        .where(IdeaMessage.session_id == session.id)
+        .order_by(IdeaMessage.created_at.desc())
+        .limit(10)  # Get last 10 messages
+    )).scalars().all()
     
+    for msg in previous_messages:
+        message_dict = {
+            "user_message": msg.content if msg.role == "user" else "",
+            "bot_response": msg.content if msg.role == "assistant" else "",
+            "spec_markdown": None  # We'll get this from spec_changes if needed
+        }
+        message_history.append(message_dict)
+    
+    message_history.reverse()  # Put in chronological order
+    
+    return {
+        "spec_markdown": session.spec_markdown or "",
+        "is_first_message": is_first_message,
+        "context_summary": current_context,
+        "message_history": message_history
+    }
+
+def apply_gpt_response(
+    db: AsyncSession,
+    session: IdeaSession,
+    request: MessageRequest,
+    gpt_response: Dict,
+    is_first_message: bool
+):
+    """Store the user and assistant messages and apply any spec update. Does not commit."""
     # Store user message
-    user_message = IdeaMessage(
+    db.add(IdeaMessage(
         session_id=session.id,
         role="user",
         content=request.user_msg,
         created_at=datetime.utcnow()
+    ))
+    
+    # Store assistant message
+    assistant_message = IdeaMessage(
+        session_id=session.id,
+        role="assistant",
+        content=gpt_response["assistant_msg"],
+        created_at=datetime.utcnow()
     )
-    db.add(user_message)
+    db.add(assistant_message)
     
-    try:
-        # Check if this is the first message
-        is_first_message = not db.query(IdeaMessage).filter(
-            IdeaMessage.session_id == session.id,
-            IdeaMessage.id != user_message.id  # Exclude current message
-        ).first()
+    # Update spec if changed
+    if gpt_response["spec_markdown"] != session.spec_markdown:
+        # Convert markdown to JSON for structured storage
+        spec_json = markdown_to_json(gpt_response["spec_markdown"])
         
-        # Get current context summary if it exists
-        current_context = None
-        if session.context_summaries and len(session.context_summaries) > 0:
-            current_context = session.context_summaries[-1]
+        # Determine if this is the first content creation (empty -> content)
+        is_initial_version = not (session.spec_markdown and session.spec_markdown.strip())
         
-        # Get message history
-        message_history = []
-        previous_messages = db.query(IdeaMessage).filter(
-            IdeaMessage.session_id == session.id,
-            IdeaMessage.id != user_message.id  # Exclude current message
-        ).order_by(IdeaMessage.created_at.desc()).limit(10).all()  # Get last 10 messages
+        # Always create SpecChange entry, but mark initial versions appropriately
+        spec_change = SpecChange(
+            session_id=session.id,
+            spec_markdown=gpt_response["spec_markdown"],
+            patch={"updated_sections": gpt_response["updated_sections"]},
+            change_data={
+                "type": "initial_version" if is_initial_version else "gpt_update",
+                "is_initial": is_initial_version,
+                "updated_sections": gpt_response["updated_sections"],
+                "changes_made": gpt_response.get("changes_made", []),  # Store structured changes
+                "skill_level": request.skill_level  # Track skill level used
+            },
+            created_at=datetime.utcnow()
+        )
+        db.add(spec_change)
         
-        for msg in previous_messages:
-            message_dict = {
-                "user_message": msg.content if msg.role == "user" else "",
-                "bot_response": msg.content if msg.role == "assistant" else "",
-                "spec_markdown": None  # We'll get this from spec_changes if needed
-            }
-            message_history.append(message_dict)
+        # Update session
+        session.spec_markdown = gpt_response["spec_markdown"]
+        session.spec_json = spec_json
         
-        message_history.reverse()  # Put in chronological order
+        # Update title if this is the first message and we got a suggestion
+        if is_first_message and gpt_response.get("suggested_title"):
+            session.title = gpt_response["suggested_title"]
+        
+        # Update context summaries if we got a new one
+        if gpt_response.get("context_summary"):
+            # Reassign rather than append in place so the JSONB change is detected.
+            session.context_summaries = (session.context_summaries or []) + [gpt_response["context_summary"]]
+        
+        session.updated_at = datetime.utcnow()
+
+def build_message_response(session: IdeaSession, gpt_response: Dict) -> MessageResponse:
+    return MessageResponse(
+        assistant_msg=gpt_response["assistant_msg"],
+        spec_markdown=session.spec_markdown or "",
+        updated_sections=gpt_response["updated_sections"],
+        changes_made=gpt_response.get("changes_made", [])  # Include changes for Phase 1
+    )
+
+@router.post("/api/idea/message", response_model=MessageResponse)
+async def process_idea_message(
+    request: MessageRequest,
+    current_user: User = Depends(get_llm_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Process a new message in an idea session.
+    Stores the message, gets GPT response, and updates the spec if needed.
+    """
+    session = await get_owned_session(db, request.session_id, current_user)
+    
+    try:
+        context = await load_message_context(db, session)
+        # Release the connection while ArchitectGPT runs; loaded objects stay usable.
+        await db.commit()
         
         # Call ArchitectGPT with skill level
         gpt_response = await call_architect_gpt(
-            spec_markdown=session.spec_markdown or "",
             user_msg=request.user_msg,
             session_id=str(session.id),
-            is_first_message=is_first_message,
-            context_summary=current_context,
-            message_history=message_history,
-            skill_level=request.skill_level
-        )
-        
-        # Store assistant message
-        assistant_message = IdeaMessage(
-            session_id=session.id,
-            role="assistant",
-            content=gpt_response["assistant_msg"],
-            created_at=datetime.utcnow()
+            skill_level=request.skill_level,
+            **context
         )
-        db.add(assistant_message)
-        
-        # Update spec if changed
-        if gpt_response["spec_markdown"] != session.spec_markdown:
-            # Convert markdown to JSON for structured storage
-            spec_json = markdown_to_json(gpt_response["spec_markdown"])
-            
-            # Determine if this is the first content creation (empty -> content)
-            is_initial_version = not (session.spec_markdown and session.spec_markdown.strip())
-            
-            # Always create SpecChange entry, but mark initial versions appropriately
-            spec_change = SpecChange(
-                session_id=session.id,
-                spec_markdown=gpt_response["spec_markdown"],
-                patch={"updated_sections": gpt_response["updated_sections"]},
-                change_data={
-                    "type": "initial_version" if is_initial_version else "gpt_update",
-                    "is_initial": is_initial_version,
-                    "updated_sections": gpt_response["updated_sections"],
-                    "changes_made": gpt_response.get("changes_made", []),  # Store structured changes
-                    "skill_level": request.skill_level  # Track skill level used
-                },
-                created_at=datetime.utcnow()
-            )
-            db.add(spec_change)
-            
-            # Update session
-            session.spec_markdown = gpt_response["spec_markdown"]
-            session.spec_json = spec_json
-            
-            # Update title if this is the first message and we got a suggestion
-            if is_first_message and gpt_response.get("suggested_title"):
-                session.title = gpt_response["suggested_title"]
-            
-            # Update context summaries if we got a new one
-            if gpt_response.get("context_summary"):
-                if not session.context_summaries:
-                    session.context_summaries = []
-                session.context_summaries.append(gpt_response["context_summary"])
-            
-            session.updated_at = datetime.utcnow()
         
-        db.commit()
+        apply_gpt_response(db, session, request, gpt_response, context["is_first_message"])
+        await db.commit()
         
-        return MessageResponse(
-            assistant_msg=gpt_response["assistant_msg"],
-            spec_markdown=session.spec_markdown or "",
-            updated_sections=gpt_response["updated_sections"],
-            changes_made=gpt_response.get("changes_made", [])  # Include changes for Phase 1
-        )
+        return build_message_response(session, gpt_response)
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing message: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/api/idea/message/stream")
+async def stream_idea_message(
+    request: MessageRequest,
+    current_user: User = Depends(get_llm_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming variant of /api/idea/message. Sends server-sent events:
+      event: assistant_delta  data: {"text": ...}            assistant_msg tokens as they arrive
+      event: section          data: {"section": ..., "content": ...}  each spec section once it is complete
+      event: done             data: <MessageResponse>         after IdeaMessage/SpecChange are committed
+      event: error            data: {"detail": ...}
+    """
+    session = await get_owned_session(db, request.session_id, current_user)
+    session_id = session.id
+    context = await load_message_context(db, session)
+
+    async def events():
+        gpt_response = None
+        async with aclosing(stream_architect_gpt(
+            user_msg=request.user_msg,
+            skill_level=request.skill_level,
+            **context
+        )) as stream:
+            async for event in stream:
+                if event["type"] == "assistant_delta":
+                    yield format_sse("assistant_delta", {"text": event["text"]})
+                elif event["type"] == "section":
+                    yield format_sse("section", {"section": event["section"], "content": event["content"]})
+                else:
+                    gpt_response = event["result"]
+
+        # The request-scoped session is already closed once streaming starts.
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                stream_session = await stream_db.get(IdeaSession, session_id)
+                apply_gpt_response(stream_db, stream_session, request, gpt_response, context["is_first_message"])
+                await stream_db.commit()
+                yield format_sse("done", build_message_response(stream_session, gpt_response).model_dump())
+            except Exception as e:
+                await stream_db.rollback()
+                print(f"Error storing streamed idea message: {e}")
+                yield format_sse("error", {"detail": f"Error processing message: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -4,22 +4,15 @@ from typing import List
 from pydantic import BaseModel
 from datetime import datetime
 from models.models import IdeaSession, User, IdeaMessage, SpecChange
-from core.database import SessionLocal
+from core.database import get_db, get_async_db
 from auth.auth_dependencies import get_current_user
-from sqlalchemy import desc
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from services.spec_service import markdown_to_json
 
 router = APIRouter()
 
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 class IdeaSessionResponse(BaseModel):
     id: UUID
     title: str | None
@@ -145,15 +138,18 @@ async def create_session(
 @router.get("/api/idea/sessions", response_model=List[IdeaSessionResponse])
 async def get_user_sessions(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Fetch all idea sessions for the authenticated user.
     Returns sessions sorted by most recent first.
     """
-    sessions = db.query(IdeaSession).filter(
-        IdeaSession.user_id == current_user.id
-    ).order_by(desc(IdeaSession.created_at)).all()
+    result = await db.execute(
+        select(IdeaSession)
+        .where(IdeaSession.user_id == current_user.id)
+        .order_by(desc(IdeaSession.created_at))
+    )
+    sessions = result.scalars().all()
 
     # Transform sessions to include spec preview
     return [
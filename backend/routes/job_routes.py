@@ -0,0 +1,149 @@
+# job_routes.py
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import JOB_EVENTS_POLL_SECONDS
+from core.database import AsyncSessionLocal, get_async_db
+from auth.auth_dependencies import get_current_user
+from models.models import Assignment, Job, Step, User
+from services.job_queue import enqueue, IdempotencyConflict, TERMINAL_STATUSES
+
+router = APIRouter()
+
+KEEPALIVE_SECONDS = 15
+
+# -------------------------------
+# Pydantic models
+# -------------------------------
+class WorkflowJobRequest(BaseModel):
+    assignment_input: str
+
+class DeepDiveJobRequest(BaseModel):
+    question: str
+
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    # workflow: the generated workflow; deep_dive: {"breakdown_steps": [...]} as POST /chat/deepdive returns
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+def job_response(job: Job) -> dict:
+    return JobResponse.model_validate(job).model_dump(mode="json")
+
+async def accept_job(response: Response, db: AsyncSession, user: User, kind: str, payload: dict, idempotency_key: Optional[str]) -> dict:
+    try:
+        job = await enqueue(db, user.id, kind, payload, idempotency_key)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different request")
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return job_response(job)
+
+# ------------------------------------------------
+# POST /jobs/workflow
+# POST /jobs/deepdive/{node_id}
+# Queue a workflow generation or a deep dive and return the job (202) right away;
+# a worker process (worker.py) does the LLM call and the DB writes. Resending a
+# request with the same Idempotency-Key header returns the original job.
+# ------------------------------------------------
+@router.post("/jobs/workflow", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def create_workflow_job(
+    request: WorkflowJobRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    return await accept_job(response, db, current_user, "workflow", {"assignment_input": request.assignment_input}, idempotency_key)
+
+@router.post("/jobs/deepdive/{node_id}", status_code=status.HTTP_202_ACCEPTED, response_model=JobResponse)
+async def create_deep_dive_job(
+    node_id: int,
+    request: DeepDiveJobRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    owner_id = (await db.execute(
+        select(Assignment.user_id).join(Step, Step.assignment_id == Assignment.id).where(Step.id == node_id)
+    )).scalar()
+    if owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Node not found or not authorized")
+    return await accept_job(response, db, current_user, "deep_dive", {"node_id": node_id, "question": request.question}, idempotency_key)
+
+# ------------------------------------------------
+# GET /jobs/{job_id}
+# Poll a job's status; result (or error) is set once it succeeded (or failed).
+# ------------------------------------------------
+async def load_job(db: AsyncSession, job_id: int, current_user: User) -> Job:
+    job = (await db.execute(
+        select(Job).where(Job.id == job_id, Job.user_id == current_user.id)
+    )).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or not authorized")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    return job_response(await load_job(db, job_id, current_user))
+
+# ------------------------------------------------
+# GET /jobs/{job_id}/events
+# Server-sent events for a job until it finishes:
+#   event: status  data: <JobResponse>   whenever status, progress or attempts change
+#   event: done    data: <JobResponse>   once it succeeded or failed (then the stream ends)
+# ------------------------------------------------
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: int, request: Request, db: AsyncSession = Depends(get_async_db), current_user: User = Depends(get_current_user)):
+    job = await load_job(db, job_id, current_user)
+    # Don't keep the request's pooled connection for the whole stream.
+    await db.close()
+
+    async def events():
+        current = job
+        last_state, last_sent = None, time.monotonic()
+        while True:
+            state = (current.status, current.progress, current.attempts)
+            if current.status in TERMINAL_STATUSES:
+                yield format_sse("done", job_response(current))
+                return
+            if state != last_state:
+                yield format_sse("status", job_response(current))
+                last_state, last_sent = state, time.monotonic()
+            elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+            if await request.is_disconnected():
+                return
+            async with AsyncSessionLocal() as poll_db:
+                current = await poll_db.get(Job, job_id)
+            if current is None:
+                yield format_sse("error", {"detail": "Job was deleted"})
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,38 @@
+# metrics_routes.py
+
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from core.config import METRICS_TOKEN
+from services.embedding_cache import embedding_cache
+from core.database import pool_status
+from services import position_updates, password_hasher, prompt_builder
+from auth.principal_cache import principal_cache
+from services.llm_gateway import gateway
+from services.response_cache import response_cache
+
+router = APIRouter()
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+
+@router.get("/metrics", dependencies=[Depends(require_metrics_token)])
+def get_metrics():
+    """
+    Operational counters for caches and pools, used to size and tune them.
+    Requires the METRICS_TOKEN bearer token.
+    """
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "db_pools": pool_status(),
+        "position_updates": position_updates.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "llm_gateway": gateway.stats(),
+        "response_cache": response_cache.stats(),
+        "prompts": prompt_builder.stats()
+    }
@@ -1,24 +1,22 @@
 # node_routes.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Annotated, Literal, Optional, List, Union
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 from models.models import Step, Assignment, User, Connection
-from core.database import SessionLocal
-from auth.auth_dependencies import get_current_user
-from utils.node_operations import create_node
+from core.database import get_db, AsyncSessionLocal
+from core.config import GRAPH_BATCH_MAX_OPERATIONS, POSITION_FLUSH_INTERVAL_MS, POSITION_MAX_PENDING
+from auth.auth_dependencies import get_current_user, token_email
+from services.position_updates import PositionCoalescer
+from utils.node_operations import create_node, delete_node_and_rewire, apply_graph_batch, layout_assignment
+from utils.graph_loader import load_revision
 
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # ---------------------------
 # Update Node Position (unchanged)
 # ---------------------------
@@ -33,10 +31,17 @@ def update_node_position(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    node = db.query(Step).filter(Step.id == node_id).first()
-    if not node:
+    # Load the owner with the step instead of lazy-loading node.assignment.
+    row = (
+        db.query(Step, Assignment.user_id)
+        .join(Assignment, Step.assignment_id == Assignment.id)
+        .filter(Step.id == node_id)
+        .first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="Node not found")
-    if node.assignment.user_id != current_user.id:
+    node, owner_id = row
+    if owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this node")
     
     node.position_x = update.position_x
@@ -44,6 +49,87 @@ def update_node_position(
     db.commit()
     return {"message": "Node position updated successfully"}
 
+# ---------------------------
+# Drag Channel (WebSocket)
+# ---------------------------
+# While dragging, the canvas streams positions here instead of calling the PUT above
+# per mouse event. Positions are coalesced per step and written in one UPDATE every
+# POSITION_FLUSH_INTERVAL_MS, on drag end and on disconnect (services/position_updates.py).
+# Messages (JSON):
+#   client -> {"type": "move", "step_id": 1, "position_x": 10.0, "position_y": 20.0}
+#   client -> {"type": "drag_end"}                        (flush now)
+#   server -> {"type": "flushed", "revision": 12, "steps": 3}
+#   server -> {"type": "error", "detail": "..."}
+# The access token is passed as ?token=..., since browsers can't set headers on WebSockets.
+class PositionMove(BaseModel):
+    type: Literal["move"]
+    step_id: int
+    position_x: float
+    position_y: float
+
+class DragEnd(BaseModel):
+    type: Literal["drag_end"]
+
+PositionMessage = TypeAdapter(Annotated[Union[PositionMove, DragEnd], Field(discriminator="type")])
+
+@router.websocket("/assignments/{assignment_id}/positions")
+async def position_channel(websocket: WebSocket, assignment_id: int, token: str = Query(...)):
+    try:
+        email = token_email(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # Ownership is checked once per connection; flushes only touch this assignment's steps.
+    async with AsyncSessionLocal() as db:
+        owned = (await db.execute(
+            select(Assignment.id)
+            .join(User, User.id == Assignment.user_id)
+            .where(Assignment.id == assignment_id, User.email == email)
+        )).scalar()
+    if owned is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    coalescer = PositionCoalescer(assignment_id)
+
+    async def flush_and_ack():
+        flushed = await coalescer.flush()
+        if flushed:
+            await websocket.send_json({"type": "flushed", "revision": flushed[0], "steps": flushed[1]})
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(POSITION_FLUSH_INTERVAL_MS / 1000)
+            try:
+                await flush_and_ack()
+            except WebSocketDisconnect:
+                return
+            except Exception as e:
+                print("Error flushing canvas positions:", e)
+
+    flusher = asyncio.create_task(flush_periodically())
+    try:
+        while True:
+            try:
+                message = PositionMessage.validate_python(await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            if isinstance(message, PositionMove):
+                coalescer.add(message.step_id, message.position_x, message.position_y)
+                if len(coalescer.pending) < POSITION_MAX_PENDING:
+                    continue
+            await flush_and_ack()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        try:
+            await coalescer.flush()
+        except Exception as e:
+            print("Error flushing canvas positions on disconnect:", e)
+
 # ---------------------------
 # Delete a Node with Refined Connection Re-wiring
 # ---------------------------
@@ -60,108 +146,7 @@ def delete_node(
     if node.assignment.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this node")
     
-    # For substeps (node with a parent), use the connection table to rewire:
-    if node.parent_id is not None:
-        # Filter incoming connection: from a node that is either a main step or a sibling.
-        incoming_conn = (
-            db.query(Connection)
-            .join(Step, Connection.from_step == Step.id)
-            .filter(
-                Connection.to_step == node_id,
-                ((Step.parent_id == node.parent_id) | (Step.parent_id.is_(None)))
-            )
-            .first()
-        )
-        # Filter outgoing connection: to a node that is a sibling (i.e. has same parent as the deleted node).
-        outgoing_conn = (
-            db.query(Connection)
-            .join(Step, Connection.to_step == Step.id)
-            .filter(
-                Connection.from_step == node_id,
-                Step.parent_id == node.parent_id
-            )
-            .first()
-        )
-        # Filter outgoing subset connection: connection from node to a child (substep)
-        outgoing_subset_conn = (
-            db.query(Connection)
-            .join(Step, Connection.to_step == Step.id)
-            .filter(
-                Connection.from_step == node_id,
-                Step.parent_id == node_id
-            )
-            .first()
-        )
-        children: List[Step] = db.query(Step).filter(Step.parent_id == node.id).all()
-        
-        # Re-wire sibling connection if both incoming and outgoing exist.
-        if incoming_conn and outgoing_conn:
-            db.add(Connection(
-                assignment_id=node.assignment_id,
-                from_step=incoming_conn.from_step,
-                to_step=outgoing_conn.to_step
-            ))
-        
-        # Handle subset promotion if there is an outgoing subset connection.
-        if outgoing_subset_conn:
-            # Assume we promote the first substep (target of outgoing_subset_conn).
-            promoted_id = outgoing_subset_conn.to_step
-            promoted_node = db.query(Step).filter(Step.id == promoted_id).first()
-            for child in children:
-                if child == promoted_node:
-                    promoted_node.parent_id = None
-                else:
-                    child.parent_id = promoted_id
-            db.commit()
-    else:
-        # Node is a parent (main step)
-        # Query all children of this parent.
-        children: List[Step] = db.query(Step).filter(Step.parent_id == node.id).order_by(Step.position_y).all()
-        if children:
-            # Promote the first child to become the new parent.
-            promoted = children[0]
-            promoted.parent_id = None  # Now a main step.
-            # Update incoming connections that pointed to the deleted node,
-            # but only if their source is not already the promoted node.
-            incoming_conns = db.query(Connection).filter(
-                Connection.to_step == node_id,
-                Connection.from_step != promoted.id
-            ).all()
-            for conn in incoming_conns:
-                conn.to_step = promoted.id
-            # Update outgoing connections that originated from the deleted node,
-            # but only if their target is not already the promoted node.
-            outgoing_conns = db.query(Connection).filter(
-                Connection.from_step == node_id,
-                Connection.to_step != promoted.id
-            ).all()
-            for conn in outgoing_conns:
-                conn.from_step = promoted.id
-            # For the rest of the children, update their parent_id to the promoted node.
-            for child in children[1:]:
-                child.parent_id = promoted.id
-            db.commit()
-        else:
-            incoming_conn = db.query(Connection).filter(Connection.to_step == node_id).first()
-            outgoing_conn = db.query(Connection).filter(Connection.from_step == node_id).first()
-            if incoming_conn and outgoing_conn:
-                # Bridge the gap by connecting the source of the incoming to the target of the outgoing.
-                db.add(Connection(
-                    assignment_id=node.assignment_id,
-                    from_step=incoming_conn.from_step,
-                    to_step=outgoing_conn.to_step
-                ))
-
-    
-    # Remove all connections that directly reference the deleted node.
-    conns_to_delete: List[Connection] = db.query(Connection).filter(
-        (Connection.from_step == node_id) | (Connection.to_step == node_id)
-    ).all()
-    for conn in conns_to_delete:
-        db.delete(conn)
-    
-    # Finally, delete the node.
-    db.delete(node)
+    delete_node_and_rewire(db, node)
     db.commit()
     return {"message": "Node deleted successfully and connections re-wired"}
 
@@ -247,3 +232,100 @@ def update_node_content(
     node.content = update.content
     db.commit()
     return {"message": "Node content updated successfully"}
+
+# ---------------------------
+# Batch Graph Mutations
+# ---------------------------
+# Applies an ordered list of canvas edits in one request and one transaction, e.g.
+# a multi-node drag or an auto-layout. If any operation is invalid, none are applied.
+class MoveOperation(BaseModel):
+    op: Literal["move"]
+    step_id: int
+    position_x: float
+    position_y: float
+
+class EditOperation(BaseModel):
+    op: Literal["edit"]
+    step_id: int
+    content: str
+
+class CompleteOperation(BaseModel):
+    op: Literal["complete"]
+    step_id: int
+    completed: bool
+
+class AddOperation(BaseModel):
+    op: Literal["add"]
+    content: str
+    reference_node_id: Optional[int] = None
+    position_x: Optional[float] = None
+    position_y: Optional[float] = None
+    insertion_type: Optional[str] = None     # "new_step", "after", or "substep"
+
+class DeleteOperation(BaseModel):
+    op: Literal["delete"]
+    step_id: int
+
+class ConnectOperation(BaseModel):
+    op: Literal["connect"]
+    from_step: int
+    to_step: int
+
+GraphOperation = Annotated[
+    Union[MoveOperation, EditOperation, CompleteOperation, AddOperation, DeleteOperation, ConnectOperation],
+    Field(discriminator="op")
+]
+
+class GraphBatch(BaseModel):
+    operations: List[GraphOperation] = Field(..., max_length=GRAPH_BATCH_MAX_OPERATIONS)
+
+@router.post("/assignments/{assignment_id}/batch")
+def apply_batch(
+    assignment_id: int,
+    batch: GraphBatch,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if assignment.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to modify this assignment")
+
+    try:
+        results = apply_graph_batch(db, assignment, batch.operations)
+        # Read before commit: our revision bumps hold the assignment row lock until then.
+        revision = load_revision(db, assignment_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"revision": revision, "results": results}
+
+# ---------------------------
+# Auto-layout
+# ---------------------------
+# Without step_id the whole graph is laid out; with step_id only the subtree of that
+# step's main step moves (plus the main steps downstream of it, if it now overlaps
+# them). Only moved steps are written and returned.
+@router.post("/assignments/{assignment_id}/layout")
+def layout_graph(
+    assignment_id: int,
+    step_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if assignment.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to modify this assignment")
+
+    try:
+        moved = layout_assignment(db, assignment, step_id)
+        revision = load_revision(db, assignment_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {"revision": revision, "moved": moved}
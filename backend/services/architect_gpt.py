@@ -1,10 +1,8 @@
-from openai import AsyncOpenAI
 import os
 import json
 import asyncio
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from tenacity import retry, stop_after_attempt, wait_exponential
-from core.config import OPENAI_API_KEY
 from services.prompt_config import (
     get_section_guidelines, 
     get_formatting_rules, 
@@ -13,27 +11,28 @@ from services.prompt_config import (
     get_skill_level_adaptation,
     format_change_summary
 )
+from services.spec_service import SectionStream
+from services.llm_gateway import gateway
+from services.prompt_builder import PromptBuilder
+from utils.json_utils import StreamingJSONStringFields
 import re
 
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
-def format_message_history(messages: List[Dict[str, str]], k: int = 5) -> str:
-    """Format the last k messages into a string for context."""
-    if not messages:
-        return ""
-    
-    # Take last k messages
-    recent_messages = messages[-k:]
-    formatted = "\nRecent Conversation:\n"
-    
-    for msg in recent_messages:
-        formatted += f"User: {msg['user_message']}\n"
+ARCHITECT_MODEL = "gpt-4o-mini"  # Using mini for testing
+ARCHITECT_TEMPERATURE = 0.7
+ARCHITECT_MAX_TOKENS = 2500  # Increased for change communication
+
+def format_history_turns(messages: List[Dict[str, str]], k: int = 5) -> List[str]:
+    """Format each of the last k messages as its own block, oldest first."""
+    turns = []
+    for msg in messages[-k:]:
+        turn = f"User: {msg['user_message']}\n"
         if msg.get('bot_response'):
-            formatted += f"Assistant: {msg['bot_response']}\n"
+            turn += f"Assistant: {msg['bot_response']}\n"
         if msg.get('spec_markdown'):
-            formatted += f"[Spec Update]\n"
-    
-    return formatted
+            turn += f"[Spec Update]\n"
+        turns.append(turn)
+    return turns
 
 SYSTEM_PROMPT = """You are ArchitectGPT, an expert system architect helping users design technical specifications that can be converted into actionable development roadmaps.
 
@@ -138,6 +137,110 @@ def get_dynamic_guidelines(spec_markdown: str, user_msg: str, skill_level: str =
     
     return guidelines_text
 
+def build_architect_messages(
+    spec_markdown: str,
+    user_msg: str,
+    is_first_message: bool = False,
+    context_summary: Optional[str] = None,
+    message_history: Optional[List[Dict[str, str]]] = None,
+    skill_level: str = "intermediate"
+) -> List[Dict[str, str]]:
+    """Build the system and user messages for an ArchitectGPT call, within the prompt token budget."""
+    # Prepare the context information
+    context_info = f"Project Context:\n{context_summary}\n\n" if context_summary else ""
+    
+    # Get dynamic section guidelines with skill level adaptation
+    dynamic_guidelines = get_dynamic_guidelines(spec_markdown, user_msg, skill_level)
+    
+    # Add change communication rules
+    change_rules = get_change_communication_rules()
+    change_guidance = f"\n\nCHANGE COMMUNICATION RULES:\n"
+    for change_type, details in change_rules["change_types"].items():
+        change_guidance += f"• {details['emoji']} {details['verb']}: {details['description']}\n"
+
+    # The history is trimmed first (oldest turns), the spec after it; the user's message last
+    prompt = (
+        PromptBuilder("architect", ARCHITECT_MODEL)
+        .text("system", SYSTEM_PROMPT + dynamic_guidelines + change_guidance)
+        .text("spec", f"{context_info}Current Specification:\n\n{spec_markdown}\n\n")
+        .items("history", format_history_turns(message_history or []), keep="last", separator="")
+        .text("question", user_msg)
+        .build()
+    )
+    conversation_history = f"\nRecent Conversation:\n{prompt['history']}" if prompt["history"] else ""
+
+    return [
+        {"role": "system", "content": prompt["system"]},
+        {"role": "user", "content": (
+            f"{prompt['spec']}"
+            f"{conversation_history}"
+            f"User Message: {prompt['question']}\n\n"
+            f"Skill Level: {skill_level.upper()}\n\n"
+            f"{'This is the first message for this project. Please suggest a title, provide an initial context summary, and explain what sections you created.' if is_first_message else 'Please explain exactly what you changed and why.'}"
+        )}
+    ]
+
+def fallback_response(spec_markdown: str, assistant_msg: str) -> Dict:
+    """A response that leaves the spec untouched."""
+    return {
+        "assistant_msg": assistant_msg,
+        "spec_markdown": spec_markdown,
+        "updated_sections": [],
+        "suggested_title": None,
+        "context_summary": None,
+        "changes_made": []
+    }
+
+def parse_architect_response(content: str, spec_markdown: str, is_first_message: bool = False) -> Dict:
+    """Parse and validate the raw completion text into the call_architect_gpt result shape."""
+    try:
+        # Try to parse as JSON first
+        result = json.loads(content)
+        
+        # Validate response format
+        if not isinstance(result.get("assistant_msg"), str):
+            raise ValueError("assistant_msg must be a string")
+        if not isinstance(result.get("spec_markdown"), str):
+            raise ValueError("spec_markdown must be a string")
+        if not isinstance(result.get("updated_sections"), list):
+            # If updated_sections is missing or not a list, extract from spec changes
+            updated = []
+            # Try to extract from assistant message mentions
+            assistant_msg = result.get("assistant_msg", "")
+            for section in get_formatting_rules()["content"]["section_order"]:
+                if section in assistant_msg:
+                    updated.append(section)
+            result["updated_sections"] = updated
+
+        # Handle suggested_title
+        if is_first_message and not isinstance(result.get("suggested_title"), str):
+            # Try to extract title from markdown if not provided
+            match = re.search(r"# ([^\n]+)", result["spec_markdown"])
+            result["suggested_title"] = match.group(1) if match else "New Project"
+        elif not is_first_message:
+            result["suggested_title"] = None
+        
+        # Handle context_summary
+        if not isinstance(result.get("context_summary"), str):
+            result["context_summary"] = None
+        
+        # Handle changes_made (new for Phase 1)
+        if not isinstance(result.get("changes_made"), list):
+            result["changes_made"] = []
+        
+        return result
+        
+    except json.JSONDecodeError:
+        # If the response isn't valid JSON, extract what looks like the message
+        # and return it without spec updates
+        return fallback_response(spec_markdown, content)
+    except ValueError as e:
+        print(f"Invalid response format: {str(e)}")
+        return fallback_response(
+            spec_markdown,
+            "I apologize, but I encountered an error in processing the specification updates. Let me know if you'd like me to try again."
+        )
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
@@ -174,109 +277,74 @@ async def call_architect_gpt(
         - changes_made (List[Dict]): Structured list of changes for future use
     """
     try:
-        # Prepare the context information
-        context_info = f"Project Context:\n{context_summary}\n\n" if context_summary else ""
-        
-        # Add message history if available
-        conversation_history = format_message_history(message_history) if message_history else ""
-        
-        # Get dynamic section guidelines with skill level adaptation
-        dynamic_guidelines = get_dynamic_guidelines(spec_markdown, user_msg, skill_level)
-        
-        # Add change communication rules
-        change_rules = get_change_communication_rules()
-        change_guidance = f"\n\nCHANGE COMMUNICATION RULES:\n"
-        for change_type, details in change_rules["change_types"].items():
-            change_guidance += f"• {details['emoji']} {details['verb']}: {details['description']}\n"
-
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT + dynamic_guidelines + change_guidance},
-            {"role": "user", "content": (
-                f"{context_info}"
-                f"Current Specification:\n\n{spec_markdown}\n\n"
-                f"{conversation_history}"
-                f"User Message: {user_msg}\n\n"
-                f"Skill Level: {skill_level.upper()}\n\n"
-                f"{'This is the first message for this project. Please suggest a title, provide an initial context summary, and explain what sections you created.' if is_first_message else 'Please explain exactly what you changed and why.'}"
-            )}
-        ]
+        messages = build_architect_messages(
+            spec_markdown, user_msg, is_first_message, context_summary, message_history, skill_level
+        )
 
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",  # Using mini for testing
+        response = await gateway.chat(
+            model=ARCHITECT_MODEL,
             messages=messages,
-            temperature=0.7,
-            max_tokens=2500  # Increased for change communication
+            temperature=ARCHITECT_TEMPERATURE,
+            max_tokens=ARCHITECT_MAX_TOKENS
         )
 
         # Extract and parse the response
         content = response.choices[0].message.content
         print(content)
-        try:
-            # Try to parse as JSON first
-            result = json.loads(content)
-            
-            # Validate response format
-            if not isinstance(result.get("assistant_msg"), str):
-                raise ValueError("assistant_msg must be a string")
-            if not isinstance(result.get("spec_markdown"), str):
-                raise ValueError("spec_markdown must be a string")
-            if not isinstance(result.get("updated_sections"), list):
-                # If updated_sections is missing or not a list, extract from spec changes
-                updated = []
-                # Try to extract from assistant message mentions
-                assistant_msg = result.get("assistant_msg", "")
-                for section in get_formatting_rules()["content"]["section_order"]:
-                    if section in assistant_msg:
-                        updated.append(section)
-                result["updated_sections"] = updated
-
-            # Handle suggested_title
-            if is_first_message and not isinstance(result.get("suggested_title"), str):
-                # Try to extract title from markdown if not provided
-                match = re.search(r"# ([^\n]+)", result["spec_markdown"])
-                result["suggested_title"] = match.group(1) if match else "New Project"
-            elif not is_first_message:
-                result["suggested_title"] = None
-            
-            # Handle context_summary
-            if not isinstance(result.get("context_summary"), str):
-                result["context_summary"] = None
-            
-            # Handle changes_made (new for Phase 1)
-            if not isinstance(result.get("changes_made"), list):
-                result["changes_made"] = []
-            
-            return result
-            
-        except json.JSONDecodeError:
-            # If the response isn't valid JSON, extract what looks like the message
-            # and return it without spec updates
-            return {
-                "assistant_msg": content,
-                "spec_markdown": spec_markdown,
-                "updated_sections": [],
-                "suggested_title": None,
-                "context_summary": None,
-                "changes_made": []
-            }
-        except ValueError as e:
-            print(f"Invalid response format: {str(e)}")
-            return {
-                "assistant_msg": "I apologize, but I encountered an error in processing the specification updates. Let me know if you'd like me to try again.",
-                "spec_markdown": spec_markdown,
-                "updated_sections": [],
-                "suggested_title": None,
-                "context_summary": None,
-                "changes_made": []
-            }
+        return parse_architect_response(content, spec_markdown, is_first_message)
 
     except Exception as e:
         print(f"Error in call_architect_gpt: {str(e)}")
-        return {
-            "assistant_msg": "I apologize, but I encountered an error processing your request. Please try again.",
-            "spec_markdown": spec_markdown,
-            "updated_sections": [],
-            "suggested_title": None,
-            "context_summary": None,
-            "changes_made": []
-        } 
\ No newline at end of file
+        return fallback_response(
+            spec_markdown,
+            "I apologize, but I encountered an error processing your request. Please try again."
+        )
+
+async def stream_architect_gpt(
+    spec_markdown: str,
+    user_msg: str,
+    is_first_message: bool = False,
+    context_summary: Optional[str] = None,
+    message_history: Optional[List[Dict[str, str]]] = None,
+    skill_level: str = "intermediate"
+) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of call_architect_gpt. Yields events as the completion arrives:
+        {"type": "assistant_delta", "text": str}              tokens of assistant_msg
+        {"type": "section", "section": str, "content": str}   a spec section that finished parsing
+        {"type": "result", "result": Dict}                    the same dict call_architect_gpt returns
+    Streamed calls are not retried: tokens may already have reached the client.
+    """
+    fields = StreamingJSONStringFields()
+    sections = SectionStream()
+    parts = []
+    try:
+        messages = build_architect_messages(
+            spec_markdown, user_msg, is_first_message, context_summary, message_history, skill_level
+        )
+        async with gateway.chat_stream(
+            model=ARCHITECT_MODEL,
+            messages=messages,
+            temperature=ARCHITECT_TEMPERATURE,
+            max_tokens=ARCHITECT_MAX_TOKENS
+        ) as stream:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                parts.append(delta)
+                for kind, key, text in fields.feed(delta):
+                    if key == "assistant_msg" and kind == "delta":
+                        yield {"type": "assistant_delta", "text": text}
+                    elif key == "spec_markdown":
+                        completed = sections.feed(text) if kind == "delta" else sections.finish()
+                        for section, content in completed:
+                            yield {"type": "section", "section": section, "content": content}
+        result = parse_architect_response("".join(parts), spec_markdown, is_first_message)
+    except Exception as e:
+        print(f"Error in stream_architect_gpt: {str(e)}")
+        result = fallback_response(
+            spec_markdown,
+            "I apologize, but I encountered an error processing your request. Please try again."
+        )
+    yield {"type": "result", "result": result}
@@ -1,37 +1,42 @@
-import openai
 import os
 import json
 import re
 import asyncio
-from core.config import OPENAI_API_KEY
-from openai import AsyncOpenAI
+from datetime import datetime
+from typing import List, Optional
+from services.llm_gateway import gateway
 from services.embedder import chunk_text
-from services.rag_retriever import retrieve_relevant_chunks
-from core.database import SessionLocal
+from services.rag_retriever import retrieve_chunk_rows
+from services.prompt_builder import PromptBuilder
+from services.response_cache import response_cache, request_key, request_scope
+from services.embedding_cache import get_query_embedding
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models.models import Assignment, ChatMessage, Step
+from utils.node_operations import insert_chain
 
-openai.api_key = OPENAI_API_KEY
-client = AsyncOpenAI(api_key=openai.api_key)
+DEEP_DIVE_MODEL = "gpt-4o-mini"
 
 
-async def generate_deep_dive_breakdown(node_context: str, extra_context: str = "") -> dict:
+async def generate_deep_dive_breakdown(node_context: str, extra_context: str = "", db: Optional[AsyncSession] = None) -> dict:
     """
     Build a prompt for deep dive breakdown and return a JSON-parsed response.
     For deep dive, we only request substeps (without positional data).
+    Pass the request's AsyncSession as `db` to retrieve on its connection.
     """
-    embedding_response = await client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=node_context
-    )
-    query_embedding = embedding_response.data[0].embedding
+    query_embedding = await get_query_embedding(node_context)
 
     # Retrieve related context
-    db = SessionLocal()
-    retrieved_chunks = retrieve_relevant_chunks(query_embedding, db)
-    if not retrieved_chunks:
-        rag_context = "No relevant course notes found."
-    else:
-        rag_context = "\n\n".join(retrieved_chunks)
-    db.close()
+    chunk_rows = await retrieve_chunk_rows(query_embedding, db)
+    chunk_ids = [chunk_id for chunk_id, _ in chunk_rows]
+    prompt = (
+        PromptBuilder("deep_dive", DEEP_DIVE_MODEL)
+        .items("rag", [content for _, content in chunk_rows])
+        .text("spec", node_context)
+        .text("question", extra_context)
+        .build()
+    )
+    rag_context = prompt["rag"] or "No relevant course notes found."
     # Suggested system prompt for deep_dive.py:
     messages = [
         {
@@ -63,20 +68,32 @@ async def generate_deep_dive_breakdown(node_context: str, extra_context: str = "
         {
             "role": "user",
             "content": (
-                f"{node_context}\n\n"
-                f"The student wants a deeper breakdown of the step: \"{extra_context}\"\n"
+                f"{prompt['spec']}\n\n"
+                f"The student wants a deeper breakdown of the step: \"{prompt['question']}\"\n"
                 "Create a detailed set of substeps that will help them complete this specific part of their assignment. "
                 "IMPORTANT: Return only valid JSON with no additional text or explanation."
             )
         }
     ]
+    params = {"model": DEEP_DIVE_MODEL, "messages": messages, "temperature": 0.6, "max_tokens": 1500}
+
+    # The query embedding only covers node_context, so the step being expanded is part of the scope
+    key = request_key(params["model"], messages, params["temperature"], params["max_tokens"], chunk_ids)
+    scope = request_scope("deep_dive", params["model"], params["temperature"], params["max_tokens"], chunk_ids, extra_context)
+    cached = response_cache.get("deep_dive", key, scope, query_embedding)
+    if cached is not None:
+        return cached
+
+    breakdown = await _request_breakdown(params)
+    if breakdown:
+        response_cache.set("deep_dive", key, breakdown, scope, query_embedding)
+    return breakdown
+
+
+async def _request_breakdown(params: dict) -> dict:
+    """Call the model and parse its JSON answer; {} if either fails."""
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.6,
-            max_tokens=1500
-        )
+        response = await gateway.chat(**params)
         output_text = response.choices[0].message.content.strip()
         try:
             breakdown = json.loads(output_text)
@@ -92,4 +109,26 @@ async def generate_deep_dive_breakdown(node_context: str, extra_context: str = "
                 return {}
     except Exception as e:
         print(f"Error during GPT deep dive call: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+
+def node_deep_dive_context(assignment: Assignment, node: Step, question: str) -> str:
+    """The node_context passed to generate_deep_dive_breakdown for a question about node."""
+    node_context = f"Assignment: {assignment.title}\nDescription: {assignment.description}\nNode Content: {node.content}\n"
+    node_context += f"\nUser Deep Dive Question: {question}\n"
+    return node_context
+
+def save_deep_dive(db: Session, node: Step, question: str, breakdown: dict) -> List[Step]:
+    """
+    Insert the breakdown's substeps (and their connections) after node in one flush
+    and store the exchange as a chat message. The caller commits.
+    """
+    created_steps = insert_chain(db, node, [substep.get("content", "") for substep in breakdown["new_steps"]])
+    db.add(ChatMessage(
+        assignment_id=node.assignment_id,
+        step_id=node.id,
+        user_message=question,
+        bot_response=json.dumps({"substeps": [step.content for step in created_steps]}),
+        timestamp=datetime.utcnow()
+    ))
+    return created_steps
@@ -1,9 +1,18 @@
-import openai
-from pgvector.sqlalchemy import Vector
+import asyncio
+import hashlib
+from typing import AsyncIterator, Dict, Iterable, List, Tuple, Union
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
-from models.models import DocumentChunk
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from core.config import EMBED_BATCH_SIZE, EMBED_MAX_CONCURRENCY
+from models.models import DocumentChunk, DocumentSource
+from services.llm_gateway import gateway
 from uuid import uuid4
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
 def chunk_text(text, chunk_size=500, overlap=100):
     chunks = []
     for i in range(0, len(text), chunk_size - overlap):
@@ -11,22 +20,188 @@ def chunk_text(text, chunk_size=500, overlap=100):
         chunks.append(chunk)
     return chunks
 
-async def embed_and_store(text, db: Session, source="unknown"):
-    from openai import AsyncOpenAI
-    client = AsyncOpenAI()
+@retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+    wait=wait_random_exponential(multiplier=1, max=60),
+    stop=stop_after_attempt(8),
+    reraise=True
+)
+async def embed_batch(texts: List[str]) -> List[List[float]]:
+    """Embed many texts in a single embeddings request, retrying on rate limits."""
+    response = await gateway.embed(model=EMBEDDING_MODEL, input=texts)
+    # The API may return items out of order; sort by index to line them up with the input.
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def bulk_insert_chunks(db: Session, rows: List[dict]):
+    """Write chunk rows with a single executemany INSERT instead of one add() per row."""
+    if rows:
+        db.execute(insert(DocumentChunk), rows)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_manifest(db: Session) -> Dict[str, DocumentSource]:
+    """Return the ingestion manifest keyed by source."""
+    return {entry.source: entry for entry in db.query(DocumentSource).all()}
+
+def is_unchanged(manifest: Dict[str, DocumentSource], source: str, file_hash: str) -> bool:
+    entry = manifest.get(source)
+    return entry is not None and entry.file_hash == file_hash and entry.embedding_model == EMBEDDING_MODEL
+
+def remove_sources(db: Session, sources: Iterable[str]) -> int:
+    """Delete the chunks and manifest entries of documents that no longer exist."""
+    sources = list(sources)
+    if not sources:
+        return 0
+    deleted = db.execute(delete(DocumentChunk).where(DocumentChunk.source.in_(sources))).rowcount
+    db.execute(delete(DocumentSource).where(DocumentSource.source.in_(sources)))
+    db.commit()
+    return deleted
+
+def plan_document(db: Session, source: str, text: str) -> Tuple[List[Tuple[str, str]], List[dict], int]:
+    """
+    Diff a document's chunks against what is already stored for its source.
+
+    Chunks whose hash is already stored for the source are kept, stored chunks that
+    are no longer present are deleted, and new chunks reuse an existing embedding of
+    identical content (same model) when one exists. Returns the (hash, chunk) pairs
+    that still need embedding, ready-to-insert rows for reused embeddings, and the
+    number of unique chunks in the document.
+    """
+    chunks: Dict[str, str] = {}
+    for chunk in chunk_text(text):
+        chunks.setdefault(content_hash(chunk), chunk)
+
+    manifest_entry = db.get(DocumentSource, source)
+    model_changed = manifest_entry is not None and manifest_entry.embedding_model != EMBEDDING_MODEL
+
+    kept = set()
+    stale_ids = []
+    for chunk_id, chunk_hash in db.execute(
+        select(DocumentChunk.id, DocumentChunk.content_hash).where(DocumentChunk.source == source)
+    ):
+        if model_changed or chunk_hash not in chunks or chunk_hash in kept:
+            stale_ids.append(chunk_id)
+        else:
+            kept.add(chunk_hash)
+    if stale_ids:
+        db.execute(delete(DocumentChunk).where(DocumentChunk.id.in_(stale_ids)))
 
+    missing = [chunk_hash for chunk_hash in chunks if chunk_hash not in kept]
+    reusable = {}
+    if missing:
+        reusable = dict(db.execute(
+            select(DocumentChunk.content_hash, DocumentChunk.embedding)
+            .join(DocumentSource, DocumentSource.source == DocumentChunk.source)
+            .where(
+                DocumentChunk.content_hash.in_(missing),
+                DocumentSource.embedding_model == EMBEDDING_MODEL
+            )
+            .distinct(DocumentChunk.content_hash)
+        ).all())
+
+    reused_rows = [
+        {"id": uuid4(), "content": chunks[chunk_hash], "embedding": reusable[chunk_hash],
+         "source": source, "content_hash": chunk_hash}
+        for chunk_hash in missing if chunk_hash in reusable
+    ]
+    to_embed = [(chunk_hash, chunks[chunk_hash]) for chunk_hash in missing if chunk_hash not in reusable]
+    return to_embed, reused_rows, len(chunks)
+
+async def ingest_documents(
+    documents: Union[Iterable[Tuple[str, str, str]], AsyncIterator[Tuple[str, str, str]]],
+    db: Session,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY
+) -> Dict[str, int]:
+    """
+    Chunk, embed and store a stream of (source, text, file_hash) documents.
+
+    Only chunks that are not already stored (by content hash) are embedded; see
+    plan_document. Chunks are grouped into batches of `batch_size` per embeddings
+    request and at most `max_concurrency` requests are in flight. The batch queue is
+    bounded, so reading documents pauses while the embedding workers are saturated
+    (backpressure). Each embedded batch is bulk-inserted and committed, and the
+    manifest is written once every document has been stored, so an interrupted run
+    resumes cheaply. Returns counts of embedded and reused chunks.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_concurrency * 2)
+    stats = {"documents": 0, "embedded": 0, "reused": 0}
+    manifest_rows = []
+
+    async def produce():
+        batch: List[Tuple[str, str, str]] = []
+
+        async def add_document(source, text, file_hash):
+            to_embed, reused_rows, chunk_count = plan_document(db, source, text)
+            bulk_insert_chunks(db, reused_rows)
+            db.commit()
+            stats["documents"] += 1
+            stats["reused"] += len(reused_rows)
+            manifest_rows.append({
+                "source": source,
+                "file_hash": file_hash,
+                "chunk_count": chunk_count,
+                "embedding_model": EMBEDDING_MODEL
+            })
+            for chunk_hash, chunk in to_embed:
+                batch.append((source, chunk_hash, chunk))
+                if len(batch) >= batch_size:
+                    await queue.put(batch.copy())
+                    batch.clear()
+
+        if hasattr(documents, "__aiter__"):
+            async for source, text, file_hash in documents:
+                await add_document(source, text, file_hash)
+        else:
+            for source, text, file_hash in documents:
+                await add_document(source, text, file_hash)
+        if batch:
+            await queue.put(batch.copy())
+        for _ in range(max_concurrency):
+            await queue.put(None)
+
+    async def consume():
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+            embeddings = await embed_batch([chunk for _, _, chunk in batch])
+            bulk_insert_chunks(db, [
+                {"id": uuid4(), "content": chunk, "embedding": embedding,
+                 "source": source, "content_hash": chunk_hash}
+                for (source, chunk_hash, chunk), embedding in zip(batch, embeddings)
+            ])
+            db.commit()
+            stats["embedded"] += len(batch)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(consume()) for _ in range(max_concurrency)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        db.rollback()
+        raise
+
+    for row in manifest_rows:
+        db.merge(DocumentSource(**row))
+    db.commit()
+    return stats
+
+async def embed_and_store(text, db: Session, source="unknown"):
+    """
+    Embed text and append its chunks under source. Stored chunks are left alone and no
+    manifest row is written; use ingest_documents to replace a source's content.
+    """
     chunks = chunk_text(text)
-    for chunk in chunks:
-        response = await client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=chunk
-        )
-        embedding = response.data[0].embedding
-
-        db.add(DocumentChunk(
-            id=uuid4(),
-            content=chunk,
-            embedding=embedding,
-            source=source
-        ))
+    for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+        batch = chunks[start:start + EMBED_BATCH_SIZE]
+        embeddings = await embed_batch(batch)
+        bulk_insert_chunks(db, [
+            {"id": uuid4(), "content": chunk, "embedding": embedding,
+             "source": source, "content_hash": content_hash(chunk)}
+            for chunk, embedding in zip(batch, embeddings)
+        ])
     db.commit()
@@ -0,0 +1,194 @@
+# embedding_cache.py
+"""
+Query-embedding cache shared by chat, deep dive and workflow generation.
+
+Embeddings are keyed by (model, normalized text hash). Lookups go through an
+in-process LRU tier with TTL first and, if enabled, a persistent Postgres tier
+(query_embeddings table). Hit/miss counters are exposed through stats() and the
+/metrics endpoint.
+"""
+import asyncio
+import datetime
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+from sqlalchemy import select
+from core.config import (
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_TTL_SECONDS,
+    EMBEDDING_CACHE_PERSIST,
+    EMBEDDING_CACHE_PERSIST_TTL_SECONDS
+)
+from core.database import SessionLocal
+from models.models import QueryEmbedding
+from services.embedder import EMBEDDING_MODEL
+from services.llm_gateway import gateway
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode and collapse whitespace so trivially different inputs share a key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(model: str, normalized_text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalized_text}".encode("utf-8")).hexdigest()
+
+
+class MemoryEmbeddingStore:
+    """In-process LRU tier with a per-entry TTL."""
+    name = "memory"
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES, ttl_seconds: int = EMBEDDING_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, embedding = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return embedding
+
+    async def set(self, key: str, model: str, embedding: List[float]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class PostgresEmbeddingStore:
+    """Persistent tier backed by the query_embeddings table. DB work runs in a thread."""
+    name = "postgres"
+
+    def __init__(self, ttl_seconds: int = EMBEDDING_CACHE_PERSIST_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        db = SessionLocal()
+        try:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl_seconds)
+            embedding = db.execute(
+                select(QueryEmbedding.embedding).where(
+                    QueryEmbedding.cache_key == key,
+                    QueryEmbedding.created_at >= cutoff
+                )
+            ).scalar_one_or_none()
+            return list(embedding) if embedding is not None else None
+        finally:
+            db.close()
+
+    def _set(self, key: str, model: str, embedding: List[float]):
+        db = SessionLocal()
+        try:
+            db.merge(QueryEmbedding(
+                cache_key=key,
+                model=model,
+                embedding=embedding,
+                created_at=datetime.datetime.utcnow()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    async def get(self, key: str) -> Optional[List[float]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, model: str, embedding: List[float]):
+        await asyncio.to_thread(self._set, key, model, embedding)
+
+
+class EmbeddingCache:
+    """
+    Tiered embedding cache. Tiers are checked in order; a hit in a slower tier is
+    written back to the faster ones. Any object with async get/set and a `name`
+    can be used as a tier.
+    """
+
+    def __init__(self, tiers: list):
+        self.tiers = tiers
+        self.hits = {tier.name: 0 for tier in tiers}
+        self.misses = 0
+        self.errors = 0
+        self.miss_seconds = 0.0
+        self.miss_tokens = 0
+
+    async def _lookup(self, key: str):
+        for index, tier in enumerate(self.tiers):
+            try:
+                embedding = await tier.get(key)
+            except Exception as e:
+                self.errors += 1
+                print(f"Embedding cache {tier.name} lookup failed: {e}")
+                continue
+            if embedding is not None:
+                self.hits[tier.name] += 1
+                for faster in self.tiers[:index]:
+                    await faster.set(key, None, embedding)
+                return embedding
+        return None
+
+    async def _store(self, key: str, model: str, embedding: List[float]):
+        for tier in self.tiers:
+            try:
+                await tier.set(key, model, embedding)
+            except Exception as e:
+                self.errors += 1
+                print(f"Embedding cache {tier.name} write failed: {e}")
+
+    async def get_embedding(self, text: str, model: str = EMBEDDING_MODEL) -> List[float]:
+        normalized = normalize_text(text)
+        key = cache_key(model, normalized)
+        embedding = await self._lookup(key)
+        if embedding is not None:
+            return embedding
+
+        self.misses += 1
+        start = time.perf_counter()
+        response = await gateway.embed(model=model, input=normalized)
+        self.miss_seconds += time.perf_counter() - start
+        if response.usage is not None:
+            self.miss_tokens += response.usage.total_tokens
+        embedding = response.data[0].embedding
+        await self._store(key, model, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        hits = sum(self.hits.values())
+        lookups = hits + self.misses
+        avg_miss_seconds = self.miss_seconds / self.misses if self.misses else 0.0
+        avg_miss_tokens = self.miss_tokens / self.misses if self.misses else 0.0
+        return {
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.tiers[0]) if self.tiers and hasattr(self.tiers[0], "__len__") else None,
+            "embedding_seconds": round(self.miss_seconds, 3),
+            "embedding_tokens": self.miss_tokens,
+            # Estimates assume a hit would have cost an average miss.
+            "estimated_seconds_saved": round(hits * avg_miss_seconds, 3),
+            "estimated_tokens_saved": int(hits * avg_miss_tokens)
+        }
+
+
+def build_default_cache() -> EmbeddingCache:
+    tiers = [MemoryEmbeddingStore()]
+    if EMBEDDING_CACHE_PERSIST:
+        tiers.append(PostgresEmbeddingStore())
+    return EmbeddingCache(tiers)
+
+
+embedding_cache = build_default_cache()
+
+async def get_query_embedding(text: str, model: str = EMBEDDING_MODEL) -> List[float]:
+    """Embed a query string through the shared cache."""
+    return await embedding_cache.get_embedding(text, model=model)
@@ -1,63 +1,45 @@
-import openai
 import os
 import json
 import re
 import asyncio
-from core.config import OPENAI_API_KEY
-from openai import AsyncOpenAI
+from typing import AsyncIterator, Optional
+from services.llm_gateway import gateway
 from services.embedder import chunk_text
-from services.rag_retriever import retrieve_relevant_chunks
-from core.database import SessionLocal
+from services.rag_retriever import retrieve_chunks
+from services.prompt_builder import PromptBuilder
+from services.embedding_cache import get_query_embedding
+from sqlalchemy.ext.asyncio import AsyncSession
 
-openai.api_key = OPENAI_API_KEY
-client = AsyncOpenAI(api_key=openai.api_key)
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_TEMPERATURE = 0.4
+CHAT_MAX_TOKENS = 10000
 
-async def generate_assignment_chat_response(question: str, assignment_title: str, assignment_description: str, recent_messages: list) -> str:
-    """
-    Builds context for an assignment-level chat message and returns GPT's response.
-    
-    Parameters:
-      question (str): The user's question.
-      assignment_title (str): The title of the assignment.
-      assignment_description (str): The assignment description.
-      recent_messages (list): A list of recent ChatMessage objects (dictionaries) without a step_id.
-      
-    Returns:
-      str: GPT's response text.
-    """
-    embedding_response = await client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=question
-    )
-    query_embedding = embedding_response.data[0].embedding
+ASSIGNMENT_CHAT_SYSTEM_PROMPT = (
+    "You are an expert academic workflow assistant in the Flowde app. "
+    "This app helps students break down assignments visually in a flowchart format with steps and substeps. "
+    "Your role is to provide clear, actionable advice that helps students complete their assignments. "
+    "Reference the visual workflow where appropriate and suggest specific, practical next steps."
+)
+NODE_CHAT_SYSTEM_PROMPT = (
+    "You are an expert academic workflow assistant in the Flowde app. "
+    "This app helps students break down assignments visually in a flowchart format. "
+    "The student is asking about a specific step in their workflow. "
+    "Provide targeted, actionable advice that helps them complete this specific step. "
+    "Be concrete and specific rather than general. Suggest practical approaches, resources, "
+    "or techniques they could use to complete this particular workflow step."
+)
 
-    # Step: Retrieve context
-    db = SessionLocal()
-    retrieved_chunks = retrieve_relevant_chunks(query_embedding, db)
-    if not retrieved_chunks:
-        rag_context = "No relevant course notes found."
-    else:
-        rag_context = "\n\n".join(retrieved_chunks)
-    db.close()
-    # Build context string
-    context = f"Assignment Title: {assignment_title}\nAssignment Description: {assignment_description}\nRecent Conversation:\n"
-    for msg in recent_messages:
-        context += f"User: {msg.user_message}\nBot: {msg.bot_response or 'No response yet'}\n"
-    context += f"\nUser Question: {question}\n"
+def format_chat_turns(recent_messages: list) -> list:
+    """One "User/Bot" block per earlier message, oldest first."""
+    return [f"User: {msg.user_message}\nBot: {msg.bot_response or 'No response yet'}\n" for msg in recent_messages]
 
-    # Create a more structured messages array instead of building one big prompt
-    messages = [
+def chat_messages(prompt: dict, context: str) -> list:
+    """System and user messages from a built prompt and its context block."""
+    rag_context = prompt["rag"] or "No relevant course notes found."
+    return [
+        {"role": "system", "content": prompt["system"]},
         {
-            "role": "system", 
-            "content": (
-                "You are an expert academic workflow assistant in the Flowde app. "
-                "This app helps students break down assignments visually in a flowchart format with steps and substeps. "
-                "Your role is to provide clear, actionable advice that helps students complete their assignments. "
-                "Reference the visual workflow where appropriate and suggest specific, practical next steps."
-            )
-        },
-        {
-            "role": "user", 
+            "role": "user",
             "content": (
                 "RELEVANT COURSE MATERIALS:\n"
                 f"{rag_context}\n\n"
@@ -66,19 +48,49 @@ async def generate_assignment_chat_response(question: str, assignment_title: str
             )
         }
     ]
+
+async def build_assignment_chat_messages(question: str, assignment_title: str, assignment_description: str, recent_messages: list, db: Optional[AsyncSession] = None) -> list:
+    """
+    Builds the messages array (with RAG context) for an assignment-level chat message.
     
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",  # or your desired model
-        messages=messages,
-        temperature=0.4,
-        max_tokens=10000
+    Parameters:
+      question (str): The user's question.
+      assignment_title (str): The title of the assignment.
+      assignment_description (str): The assignment description.
+      recent_messages (list): A list of recent ChatMessage objects (dictionaries) without a step_id.
+      db (AsyncSession, optional): Request session to run RAG retrieval on.
+      
+    Returns:
+      list: Chat completion messages.
+    """
+    query_embedding = await get_query_embedding(question)
+
+    # Step: Retrieve context
+    retrieved_chunks = await retrieve_chunks(query_embedding, db)
+    # Fit notes, conversation and assignment text into the prompt budget
+    prompt = (
+        PromptBuilder("chat", CHAT_MODEL)
+        .text("system", ASSIGNMENT_CHAT_SYSTEM_PROMPT)
+        .items("rag", retrieved_chunks)
+        .text("spec", f"Assignment Title: {assignment_title}\nAssignment Description: {assignment_description}\n")
+        .items("history", format_chat_turns(recent_messages), keep="last", separator="")
+        .text("question", question)
+        .build()
     )
-    reply = response.choices[0].message.content.strip()
-    return reply
+    context = f"{prompt['spec']}Recent Conversation:\n{prompt['history']}\nUser Question: {prompt['question']}\n"
+    return chat_messages(prompt, context)
 
-async def generate_node_chat_response(question: str, assignment_title: str, assignment_description: str, node_content: str, recent_node_messages: list) -> str:
+async def generate_assignment_chat_response(question: str, assignment_title: str, assignment_description: str, recent_messages: list, db: Optional[AsyncSession] = None) -> str:
     """
-    Builds context for a node-specific chat message and returns GPT's response.
+    Builds context for an assignment-level chat message and returns GPT's response.
+    See build_assignment_chat_messages for the parameters.
+    """
+    messages = await build_assignment_chat_messages(question, assignment_title, assignment_description, recent_messages, db)
+    return await complete_chat(messages)
+
+async def build_node_chat_messages(question: str, assignment_title: str, assignment_description: str, node_content: str, recent_node_messages: list, db: Optional[AsyncSession] = None) -> list:
+    """
+    Builds the messages array (with RAG context) for a node-specific chat message.
     
     Parameters:
       question (str): The user's question.
@@ -86,64 +98,61 @@ async def generate_node_chat_response(question: str, assignment_title: str, assi
       assignment_description (str): The assignment description.
       node_content (str): The content of the node.
       recent_node_messages (list): A list of recent ChatMessage objects (dictionaries) for this node.
+      db (AsyncSession, optional): Request session to run RAG retrieval on.
       
     Returns:
-      str: GPT's response text.
+      list: Chat completion messages.
     """
-    embedding_response = await client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=question
-    )
-    query_embedding = embedding_response.data[0].embedding
+    query_embedding = await get_query_embedding(question)
 
     # Step: Retrieve context
-    db = SessionLocal()
-    retrieved_chunks = retrieve_relevant_chunks(query_embedding, db)
-    if not retrieved_chunks:
-        rag_context = "No relevant course notes found."
-    else:
-        rag_context = "\n\n".join(retrieved_chunks)
-    db.close()
-
-    context = (
-        f"Assignment Title: {assignment_title}\n"
-        f"Assignment Description: {assignment_description}\n"
-        f"Node Content: {node_content}\n"
-        "Recent Node Conversation:\n"
+    retrieved_chunks = await retrieve_chunks(query_embedding, db)
+    prompt = (
+        PromptBuilder("node_chat", CHAT_MODEL)
+        .text("system", NODE_CHAT_SYSTEM_PROMPT)
+        .items("rag", retrieved_chunks)
+        .text("spec", (
+            f"Assignment Title: {assignment_title}\n"
+            f"Assignment Description: {assignment_description}\n"
+            f"Node Content: {node_content}\n"
+        ))
+        .items("history", format_chat_turns(recent_node_messages), keep="last", separator="")
+        .text("question", question)
+        .build()
     )
-    for msg in recent_node_messages:
-        context += f"User: {msg.user_message}\nBot: {msg.bot_response or 'No response yet'}\n"
-    context += f"\nUser Question: {question}\n"
+    context = f"{prompt['spec']}Recent Node Conversation:\n{prompt['history']}\nUser Question: {prompt['question']}\n"
+    return chat_messages(prompt, context)
 
-    # Create a more structured messages array
-    messages = [
-        {
-            "role": "system", 
-            "content": (
-                "You are an expert academic workflow assistant in the Flowde app. "
-                "This app helps students break down assignments visually in a flowchart format. "
-                "The student is asking about a specific step in their workflow. "
-                "Provide targeted, actionable advice that helps them complete this specific step. "
-                "Be concrete and specific rather than general. Suggest practical approaches, resources, "
-                "or techniques they could use to complete this particular workflow step."
-            )
-        },
-        {
-            "role": "user", 
-            "content": (
-                "RELEVANT COURSE MATERIALS:\n"
-                f"{rag_context}\n\n"
-                "CONTEXT AND QUESTION:\n"
-                f"{context}"
-            )
-        }
-    ]
-    
-    response = await client.chat.completions.create(
-        model="gpt-4o-mini",
+async def generate_node_chat_response(question: str, assignment_title: str, assignment_description: str, node_content: str, recent_node_messages: list, db: Optional[AsyncSession] = None) -> str:
+    """
+    Builds context for a node-specific chat message and returns GPT's response.
+    See build_node_chat_messages for the parameters.
+    """
+    messages = await build_node_chat_messages(question, assignment_title, assignment_description, node_content, recent_node_messages, db)
+    return await complete_chat(messages)
+
+async def complete_chat(messages: list) -> str:
+    """Run a (non-streamed) chat completion for prebuilt messages and return the reply."""
+    response = await gateway.chat(
+        model=CHAT_MODEL,
         messages=messages,
-        temperature=0.4,
-        max_tokens=10000
+        temperature=CHAT_TEMPERATURE,
+        max_tokens=CHAT_MAX_TOKENS
     )
-    reply = response.choices[0].message.content.strip()
-    return reply
+    return response.choices[0].message.content.strip()
+
+async def stream_chat_response(messages: list) -> AsyncIterator[str]:
+    """
+    Stream a chat completion, yielding content tokens as they arrive.
+    The upstream response is closed when the consumer stops early or is cancelled
+    (e.g. the client disconnected), so no request is left running.
+    """
+    async with gateway.chat_stream(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=CHAT_TEMPERATURE,
+        max_tokens=CHAT_MAX_TOKENS
+    ) as stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
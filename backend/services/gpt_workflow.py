@@ -1,19 +1,17 @@
-import openai
 import os
 import json
 import re
 import asyncio
-from core.config import OPENAI_API_KEY
+from typing import Optional
 
-from openai import AsyncOpenAI
+from services.llm_gateway import gateway
 from services.embedder import chunk_text
-from services.rag_retriever import retrieve_relevant_chunks
-from core.database import SessionLocal
+from services.rag_retriever import retrieve_chunk_rows
+from services.response_cache import response_cache, request_key, request_scope
+from services.embedding_cache import get_query_embedding
+from sqlalchemy.ext.asyncio import AsyncSession
 
-openai.api_key = OPENAI_API_KEY
-client = AsyncOpenAI(api_key=openai.api_key)
-
-async def generate_assignment_workflow(assignment_input: str) -> dict:
+async def generate_assignment_workflow(assignment_input: str, db: Optional[AsyncSession] = None) -> dict:
     """
     Sends a prompt to GPT-4 to extract and structure assignment details.
     
@@ -25,24 +23,20 @@ async def generate_assignment_workflow(assignment_input: str) -> dict:
     
     Parameters:
       assignment_input (str): The combined text input including assignment details and any resources.
+      db (AsyncSession, optional): Request session to run RAG retrieval on.
     
     Returns:
       dict: Parsed JSON data with the assignment workflow, or None if parsing fails.
     """
-    embedding_response = await client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=assignment_input
-    )
-    query_embedding = embedding_response.data[0].embedding
+    query_embedding = await get_query_embedding(assignment_input)
 
     # Retrieve top relevant document chunks
-    db = SessionLocal()
-    retrieved_chunks = retrieve_relevant_chunks(query_embedding, db)
-    if not retrieved_chunks:
+    chunk_rows = await retrieve_chunk_rows(query_embedding, db)
+    chunk_ids = [chunk_id for chunk_id, _ in chunk_rows]
+    if not chunk_rows:
         rag_context = "No relevant course notes found."
     else:
-        rag_context = "\n\n".join(retrieved_chunks)
-    db.close()
+        rag_context = "\n\n".join(content for _, content in chunk_rows)
     # Construct prompt messages
     messages = [
         {
@@ -80,15 +74,31 @@ async def generate_assignment_workflow(assignment_input: str) -> dict:
             )
         }
     ]
-    
+    params = {
+        "model": "gpt-4o-mini",  # Replace with your intended model if needed
+        "messages": messages,
+        "temperature": 0.4,
+        "max_tokens": 2500
+    }
+
+    # Identical requests (same assignment text, notes and parameters) reuse the earlier workflow
+    key = request_key(params["model"], messages, params["temperature"], params["max_tokens"], chunk_ids)
+    scope = request_scope("workflow", params["model"], params["temperature"], params["max_tokens"], chunk_ids)
+    cached = response_cache.get("workflow", key, scope, query_embedding)
+    if cached is not None:
+        return cached
+
+    assignment_data = await _request_workflow(params)
+    if assignment_data is not None:
+        response_cache.set("workflow", key, assignment_data, scope, query_embedding)
+    return assignment_data
+
+
+async def _request_workflow(params: dict) -> Optional[dict]:
+    """Call the model and parse its JSON answer; None if either fails."""
     try:
         # Call GPT-4 API using the ChatCompletion endpoint
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",  # Replace with your intended model if needed
-            messages=messages,
-            temperature=0.4,
-            max_tokens=2500
-        )
+        response = await gateway.chat(**params)
         
         # Extract the output text from GPT-4's response and strip any leading/trailing spaces
         output_text = response.choices[0].message.content.strip()
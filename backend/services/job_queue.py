@@ -0,0 +1,303 @@
+# job_queue.py
+"""
+Postgres-backed queue for slow LLM work (workflow generation, deep dives).
+
+The API enqueues a job row and answers with its id right away. The work is done by
+worker processes (worker.py), so a request never holds its connection open for
+the LLM call, and a proxy timeout can't duplicate the work.
+
+  queued --claim--> running --success--> succeeded
+                       |
+                       +--error--> queued again after a backoff, or failed once
+                                   max_attempts is used up (or the error is permanent)
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number of
+them can poll the same table. A claim is a lease that the worker renews while it
+runs the job (every JOB_LEASE_SECONDS / 3, and on every progress update): a job
+whose worker died is claimed again once its lease is older than JOB_LEASE_SECONDS,
+and the old worker can no longer finish it (every update checks the claim's lock_token).
+
+A job kind is two steps:
+  generate(job) -> generated   async; the LLM call. Nothing is written.
+  persist(db, job, generated) -> result
+                               sync; writes the job's rows in the same
+                               transaction that marks the job succeeded.
+A retried or reclaimed job therefore never applies its writes twice.
+"""
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+from sqlalchemy import Integer, String, select, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from core.config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BASE_SECONDS,
+    JOB_LEASE_SECONDS,
+    JOB_POLL_INTERVAL_SECONDS,
+    JOB_WORKER_CONCURRENCY
+)
+from core.database import AsyncSessionLocal, SessionLocal
+from models.models import Assignment, Job, Step
+from services.llm_gateway import bind_user
+from services.gpt_workflow import generate_assignment_workflow
+from services.deep_dive import generate_deep_dive_breakdown, node_deep_dive_context, save_deep_dive
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# Timestamps are naive UTC, like the ORM defaults (datetime.utcnow).
+CLAIM_SQL = text("""
+    UPDATE jobs
+    SET status = 'running', attempts = attempts + 1, progress = 'claimed',
+        locked_at = now() AT TIME ZONE 'utc', lock_token = :token, updated_at = now() AT TIME ZONE 'utc'
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE (status = 'queued' AND run_after <= now() AT TIME ZONE 'utc')
+           OR (status = 'running' AND locked_at < now() AT TIME ZONE 'utc' - make_interval(secs => :lease_seconds))
+        ORDER BY run_after
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, user_id, kind, payload, attempts, max_attempts
+""").columns(id=Integer, user_id=UUID(as_uuid=True), kind=String, payload=JSONB, attempts=Integer, max_attempts=Integer)
+PROGRESS_SQL = text("""
+    UPDATE jobs SET progress = :progress, locked_at = now() AT TIME ZONE 'utc', updated_at = now() AT TIME ZONE 'utc'
+    WHERE id = :id AND lock_token = :token
+""")
+RENEW_LEASE_SQL = text("""
+    UPDATE jobs SET locked_at = now() AT TIME ZONE 'utc'
+    WHERE id = :id AND lock_token = :token
+""")
+SUCCEED_SQL = text("""
+    UPDATE jobs
+    SET status = 'succeeded', result = CAST(:result AS jsonb), error = NULL, progress = NULL,
+        locked_at = NULL, lock_token = NULL, updated_at = now() AT TIME ZONE 'utc'
+    WHERE id = :id AND lock_token = :token
+""")
+# With retry false, or with attempts used up, the job fails for good.
+FAIL_SQL = text("""
+    UPDATE jobs
+    SET status = CASE WHEN CAST(:retry AS boolean) AND attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+        run_after = now() AT TIME ZONE 'utc' + make_interval(secs => :delay_seconds),
+        error = :error, progress = NULL, locked_at = NULL, lock_token = NULL,
+        updated_at = now() AT TIME ZONE 'utc'
+    WHERE id = :id AND lock_token = :token
+""")
+
+
+class JobFailed(Exception):
+    """A permanent failure: the job fails without further attempts."""
+
+
+class ClaimedJob(NamedTuple):
+    id: int
+    user_id: uuid.UUID
+    kind: str
+    payload: dict
+    attempts: int
+    max_attempts: int
+    token: str
+
+
+class JobKind(NamedTuple):
+    generate: Callable[[ClaimedJob], Awaitable[object]]
+    persist: Callable[[Session, ClaimedJob, object], dict]
+
+
+# ---------------------------
+# Job kinds
+# ---------------------------
+async def generate_workflow(job: ClaimedJob):
+    workflow = await generate_assignment_workflow(job.payload["assignment_input"])
+    if workflow is None:
+        raise RuntimeError("Workflow generation failed")
+    return workflow
+
+def persist_workflow(db: Session, job: ClaimedJob, workflow: dict) -> dict:
+    return workflow
+
+async def generate_deep_dive(job: ClaimedJob):
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(Step, Assignment)
+            .join(Assignment, Step.assignment_id == Assignment.id)
+            .where(Step.id == job.payload["node_id"])
+        )).first()
+        if row is None or row.Assignment.user_id != job.user_id:
+            raise JobFailed("Node not found or not authorized")
+        node, assignment = row
+        node_context = node_deep_dive_context(assignment, node, job.payload["question"])
+    breakdown = await generate_deep_dive_breakdown(node_context, extra_context=job.payload["question"])
+    if not breakdown or not isinstance(breakdown.get("new_steps"), list):
+        raise RuntimeError("Deep dive breakdown failed")
+    return breakdown
+
+def persist_deep_dive(db: Session, job: ClaimedJob, breakdown: dict) -> dict:
+    node = db.get(Step, job.payload["node_id"])
+    if node is None:
+        raise JobFailed("Node was deleted")
+    created_steps = save_deep_dive(db, node, job.payload["question"], breakdown)
+    return {
+        "breakdown_steps": [
+            {
+                "id": step.id,
+                "content": step.content,
+                "position_x": step.position_x,
+                "position_y": step.position_y,
+                "completed": bool(step.completed),
+                "parent_id": step.parent_id
+            }
+            for step in created_steps
+        ]
+    }
+
+JOB_KINDS: Dict[str, JobKind] = {
+    "workflow": JobKind(generate_workflow, persist_workflow),
+    "deep_dive": JobKind(generate_deep_dive, persist_deep_dive),
+}
+
+
+# ---------------------------
+# Enqueueing (API side)
+# ---------------------------
+class IdempotencyConflict(Exception):
+    """The idempotency key was already used for a different request."""
+
+
+async def enqueue(db: AsyncSession, user_id, kind: str, payload: dict, idempotency_key: Optional[str] = None) -> Job:
+    """
+    Add a queued job and commit. With an idempotency key that this user already
+    used, the existing job is returned instead (IdempotencyConflict if it was for
+    a different kind or payload).
+    """
+    job_id = (await db.execute(
+        insert(Job)
+        .values(
+            user_id=user_id, kind=kind, payload=payload, status="queued", attempts=0,
+            max_attempts=JOB_MAX_ATTEMPTS, idempotency_key=idempotency_key
+        )
+        .on_conflict_do_nothing(constraint="uq_jobs_user_id_idempotency_key")
+        .returning(Job.id)
+    )).scalar()
+    await db.commit()
+    if job_id is not None:
+        return await db.get(Job, job_id)
+    job = (await db.execute(
+        select(Job).where(Job.user_id == user_id, Job.idempotency_key == idempotency_key)
+    )).scalars().one()
+    if job.kind != kind or job.payload != payload:
+        raise IdempotencyConflict(idempotency_key)
+    return job
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+async def claim(db: AsyncSession) -> Optional[ClaimedJob]:
+    token = uuid.uuid4().hex
+    row = (await db.execute(CLAIM_SQL, {"token": token, "lease_seconds": float(JOB_LEASE_SECONDS)})).first()
+    await db.commit()
+    return ClaimedJob(*row, token=token) if row is not None else None
+
+async def set_progress(job: ClaimedJob, progress: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(PROGRESS_SQL, {"id": job.id, "token": job.token, "progress": progress})
+        await db.commit()
+
+async def keep_lease(job: ClaimedJob):
+    """Renew the job's lease every JOB_LEASE_SECONDS / 3 until cancelled, or until the claim was lost."""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            async with AsyncSessionLocal() as db:
+                renewed = await db.execute(RENEW_LEASE_SQL, {"id": job.id, "token": job.token})
+                await db.commit()
+        except Exception as e:
+            # Try again next round; the lease is still good for two more.
+            print(f"Job {job.id}: lease renewal failed: {e}")
+            continue
+        if renewed.rowcount == 0:
+            return
+
+async def fail(job: ClaimedJob, error: str, retry: bool = True):
+    delay = float(JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+    async with AsyncSessionLocal() as db:
+        await db.execute(FAIL_SQL, {
+            "id": job.id, "token": job.token, "error": error[:2000], "retry": retry, "delay_seconds": delay
+        })
+        await db.commit()
+
+def persist_and_succeed(job: ClaimedJob, generated) -> bool:
+    """Run the kind's persist step and mark the job succeeded in one transaction. False if the lease was lost."""
+    db = SessionLocal()
+    try:
+        result = JOB_KINDS[job.kind].persist(db, job, generated)
+        updated = db.execute(SUCCEED_SQL, {"id": job.id, "token": job.token, "result": json.dumps(result, default=str)})
+        if updated.rowcount == 0:
+            db.rollback()
+            return False
+        db.commit()
+        return True
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def run_job(job: ClaimedJob):
+    kind = JOB_KINDS.get(job.kind)
+    if kind is None:
+        await fail(job, f"Unknown job kind: {job.kind}", retry=False)
+        return
+    if job.attempts > job.max_attempts:
+        # Reclaimed after its worker died on the last attempt.
+        await fail(job, "Job lease expired on its last attempt", retry=False)
+        return
+    # Attribute the job's LLM calls to its user (this task has its own context).
+    bind_user(job.user_id)
+    lease = asyncio.create_task(keep_lease(job))
+    try:
+        await set_progress(job, "generating")
+        generated = await kind.generate(job)
+        await set_progress(job, "saving")
+        if not await asyncio.to_thread(persist_and_succeed, job, generated):
+            print(f"Job {job.id}: lease lost before it finished; result discarded")
+    except JobFailed as e:
+        await fail(job, str(e), retry=False)
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+        await fail(job, str(e))
+    finally:
+        lease.cancel()
+
+async def run_worker(concurrency: int = JOB_WORKER_CONCURRENCY, stop: Optional[asyncio.Event] = None):
+    """
+    Claim and run jobs, up to `concurrency` at a time, until `stop` is set. Jobs
+    already running are finished before returning.
+    """
+    stop = stop or asyncio.Event()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    while not stop.is_set():
+        await slots.acquire()
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await claim(db)
+        except Exception as e:
+            print(f"Job claim failed: {e}")
+            job = None
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(stop.wait(), JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(run_job(job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
+    if running:
+        await asyncio.wait(running)
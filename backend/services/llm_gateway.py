@@ -0,0 +1,286 @@
+# llm_gateway.py
+"""
+Single entry point for OpenAI chat and embedding calls.
+
+All services share one AsyncOpenAI client on a pooled HTTP connection pool. Each
+call is admitted in this order:
+  1. the calling user's concurrency slot (LLM_PER_USER_CONCURRENCY), so one user's
+     burst can't take over the global slots;
+  2. a global concurrency slot (LLM_MAX_CONCURRENCY);
+  3. the requests-per-minute and tokens-per-minute token buckets.
+A request that can't be admitted yet waits in line instead of failing. Token use
+is reserved from an estimate up front and settled against the reported usage.
+
+The user is taken from a context variable that routes set through bind_user (see
+auth_dependencies.get_llm_user). Calls with no user bound (document ingestion, jobs
+before bind_user, /test-gpt) skip the per-user slot and only take the global slot and
+rate budget, so e.g. EMBED_MAX_CONCURRENCY isn't capped at LLM_PER_USER_CONCURRENCY.
+Queue depth, in-flight calls and wait times are exposed through stats() and /metrics.
+
+With LLM_SINGLE_FLIGHT on, identical concurrent chat() or embed() calls (same
+parameters) share one upstream call (see services/single_flight.py). The shared call
+is admitted once, as the user who started it. Streams are never shared.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from openai import AsyncOpenAI
+from core.config import (
+    OPENAI_API_KEY,
+    LLM_MAX_CONCURRENCY,
+    LLM_PER_USER_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_CONNECTIONS,
+    LLM_TIMEOUT_SECONDS,
+    LLM_SINGLE_FLIGHT
+)
+from services.single_flight import SingleFlight
+
+_llm_user: ContextVar[Optional[str]] = ContextVar("llm_user", default=None)
+
+WAIT_SAMPLES = 1000
+
+
+def bind_user(user_id) -> None:
+    """Attribute the LLM calls made by the current request (task) to user_id."""
+    _llm_user.set(str(user_id))
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) used for reservations."""
+    return len(text) // 4 + 1
+
+def estimate_message_tokens(messages: List[dict]) -> int:
+    return sum(estimate_tokens(str(message.get("content") or "")) + 4 for message in messages)
+
+def request_fingerprint(params: dict) -> str:
+    """Identifies calls with identical parameters for single-flight sharing."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def build_client() -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+        timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+    )
+    return AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to a burst of `per_minute`.
+    acquire() waits (first come, first served) until the amount is available.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """Return (positive) or charge (negative) units after the fact; may go into debt."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        per_user_concurrency: int = LLM_PER_USER_CONCURRENCY,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        single_flight: bool = LLM_SINGLE_FLIGHT
+    ):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._users: Dict[str, list] = {}   # user -> [semaphore, callers holding or waiting]
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._chat_flights = SingleFlight() if single_flight else None
+        self._embed_flights = SingleFlight() if single_flight else None
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._waits: deque = deque(maxlen=WAIT_SAMPLES)
+        self.tokens_used = 0
+
+    # ---------------------------
+    # Admission
+    # ---------------------------
+    @asynccontextmanager
+    async def _admitted(self, estimated_tokens: int):
+        """Hold a user slot (if a user is bound), a global slot and rate budget for the duration of a call. Yields a settle(actual_tokens) callback."""
+        user = _llm_user.get()
+        entry = self._users.setdefault(user, [asyncio.Semaphore(self.per_user_concurrency), 0]) if user is not None else None
+        if entry is not None:
+            entry[1] += 1
+        self.waiting += 1
+        start = time.perf_counter()
+        admitted = False
+        try:
+            async with entry[0] if entry is not None else nullcontext():
+                async with self._global:
+                    if self._requests is not None:
+                        await self._requests.acquire(1)
+                    if self._tokens is not None:
+                        await self._tokens.acquire(estimated_tokens)
+                    admitted = True
+                    self._record_wait(time.perf_counter() - start)
+                    self.waiting -= 1
+                    self.in_flight += 1
+                    settled = False
+
+                    def settle(actual_tokens: Optional[int]):
+                        nonlocal settled
+                        if settled or actual_tokens is None:
+                            return
+                        settled = True
+                        self.tokens_used += actual_tokens
+                        if self._tokens is not None:
+                            self._tokens.adjust(estimated_tokens - actual_tokens)
+
+                    try:
+                        yield settle
+                    except Exception:
+                        self.errors += 1
+                        raise
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            if not admitted:
+                self.waiting -= 1
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._users.pop(user, None)
+
+    def _record_wait(self, seconds: float):
+        self.calls += 1
+        self.total_wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        self._waits.append(seconds)
+
+    # ---------------------------
+    # Calls
+    # ---------------------------
+    async def chat(self, **params):
+        """chat.completions.create through the gateway (non-streamed)."""
+        if self._chat_flights is None:
+            return await self._chat(params)
+        return await self._chat_flights.do(request_fingerprint(params), lambda: self._chat(params))
+
+    async def _chat(self, params: dict):
+        estimate = estimate_message_tokens(params.get("messages", [])) + params.get("max_tokens", 0)
+        async with self._admitted(estimate) as settle:
+            response = await self.client.chat.completions.create(**params)
+            settle(response.usage.total_tokens if response.usage is not None else None)
+            return response
+
+    @asynccontextmanager
+    async def chat_stream(self, **params) -> AsyncIterator:
+        """
+        Streamed chat.completions.create. The slot is held until the block exits,
+        and the upstream stream is closed then (also on cancellation).
+        """
+        estimate = estimate_message_tokens(params.get("messages", [])) + params.get("max_tokens", 0)
+        async with self._admitted(estimate) as settle:
+            stream = await self.client.chat.completions.create(
+                **params, stream=True, stream_options={"include_usage": True}
+            )
+            try:
+                yield _UsageTrackingStream(stream, settle)
+            finally:
+                await stream.close()
+
+    async def embed(self, **params):
+        """embeddings.create through the gateway."""
+        if self._embed_flights is None:
+            return await self._embed(params)
+        return await self._embed_flights.do(request_fingerprint(params), lambda: self._embed(params))
+
+    async def _embed(self, params: dict):
+        inputs = params.get("input", "")
+        texts = inputs if isinstance(inputs, list) else [inputs]
+        estimate = sum(estimate_tokens(str(text)) for text in texts)
+        async with self._admitted(estimate) as settle:
+            response = await self.client.embeddings.create(**params)
+            settle(response.usage.total_tokens if response.usage is not None else None)
+            return response
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        def percentile(pct: float) -> Optional[float]:
+            return round(waits[min(len(waits) - 1, int(len(waits) * pct))] * 1000, 1) if waits else None
+        return {
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "active_users": len(self._users),
+            "calls": self.calls,
+            "errors": self.errors,
+            "tokens_used": self.tokens_used,
+            "wait_ms": {
+                "avg": round(self.total_wait_seconds / self.calls * 1000, 1) if self.calls else None,
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max": round(self.max_wait_seconds * 1000, 1)
+            },
+            "limits": {
+                "max_concurrency": self.max_concurrency,
+                "per_user_concurrency": self.per_user_concurrency,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute
+            },
+            "single_flight": {
+                "chat": self._chat_flights.stats(),
+                "embeddings": self._embed_flights.stats()
+            } if self._chat_flights is not None else None
+        }
+
+
+class _UsageTrackingStream:
+    """Iterates a completion stream and settles the reservation with the final usage chunk."""
+
+    def __init__(self, stream, settle):
+        self._stream = stream
+        self._settle = settle
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            if getattr(chunk, "usage", None) is not None:
+                self._settle(chunk.usage.total_tokens)
+            yield chunk
+
+
+gateway = LLMGateway(build_client())
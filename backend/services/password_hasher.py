@@ -0,0 +1,77 @@
+# password_hasher.py
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow (BCRYPT_ROUNDS sets the cost) and releases the GIL
+while hashing, so it runs in a small dedicated thread pool: a burst of logins
+queues there instead of stalling other requests. When more than
+PASSWORD_HASH_MAX_QUEUE hash requests are already waiting, new ones fail fast
+with PasswordHasherBusy rather than piling up.
+
+verify_password also reports when a stored hash was made with a different cost,
+so the caller can store the upgraded hash it returns.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from core.config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE
+
+# deprecated="auto" plus the configured rounds makes hashes with other costs "need update".
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def _run(fn, *args):
+    global _in_flight
+    with _in_flight_lock:
+        if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+            raise PasswordHasherBusy("Too many password checks in progress")
+        _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), fn, *args)
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+async def verify_password(password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Returns (valid, new_hash). new_hash is set when the password is valid but the
+    stored hash uses an outdated cost or scheme; store it in place of the old one.
+    """
+    if not hashed_password:
+        return False, None
+    return await _run(pwd_context.verify_and_update, password, hashed_password)
+
+def stats() -> dict:
+    return {
+        "workers": PASSWORD_HASH_WORKERS,
+        "in_flight": _in_flight,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "rounds": BCRYPT_ROUNDS
+    }
@@ -0,0 +1,144 @@
+# pdf_extractor.py
+"""
+Shared PDF text extraction service.
+
+Pages are split into ranges and parsed in a process pool, so CPU-bound parsing
+never blocks the event loop and large documents use several cores. Results are
+always returned in page order.
+"""
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, List, Optional, Tuple, Union
+import PyPDF2
+from core.config import PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK, PDF_MAX_BYTES, PDF_MAX_PAGES
+
+# Either raw PDF bytes or a path to a PDF on disk.
+PdfSource = Union[bytes, str]
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class PdfTooLargeError(ValueError):
+    pass
+
+class PdfTooManyPagesError(ValueError):
+    pass
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn keeps workers independent of the server's threads and open connections.
+        _executor = ProcessPoolExecutor(
+            max_workers=PDF_EXTRACT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _open_reader(source: PdfSource) -> PyPDF2.PdfReader:
+    if isinstance(source, str):
+        return PyPDF2.PdfReader(source)
+    return PyPDF2.PdfReader(io.BytesIO(source))
+
+def _count_pages(source: PdfSource) -> int:
+    return len(_open_reader(source).pages)
+
+def _extract_page_range(source: PdfSource, start: int, end: int) -> List[str]:
+    """Runs in a worker process: extract pages [start, end) of one document."""
+    reader = _open_reader(source)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def format_pages(pages: List[str]) -> str:
+    """Join page texts with page markers, skipping empty pages."""
+    return "".join(
+        f"--- Page {page_num} ---\n{page_text}\n\n"
+        for page_num, page_text in enumerate(pages, start=1)
+        if page_text
+    )
+
+async def count_pages(source: PdfSource) -> int:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _count_pages, source)
+
+async def read_upload(upload, max_bytes: int = PDF_MAX_BYTES) -> bytes:
+    """
+    Read an uploaded file (anything with an async read(size)) straight into memory,
+    without going through a temp file. Reads at most max_bytes + 1 bytes so an
+    oversized upload is rejected without loading all of it.
+    """
+    await upload.seek(0)
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise PdfTooLargeError(f"PDF exceeds {max_bytes} bytes")
+    return data
+
+async def check_page_limit(source: PdfSource, max_pages: int = PDF_MAX_PAGES) -> int:
+    """Return the page count, raising PdfTooManyPagesError above max_pages."""
+    total = await count_pages(source)
+    if total > max_pages:
+        raise PdfTooManyPagesError(f"PDF has {total} pages; the limit is {max_pages}")
+    return total
+
+async def iter_page_batches(
+    source: PdfSource,
+    max_pages: Optional[int] = None,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+    max_in_flight: int = PDF_EXTRACT_WORKERS,
+    total_pages: Optional[int] = None
+) -> AsyncIterator[Tuple[int, List[str]]]:
+    """
+    Yield (first_page_index, page_texts) batches in page order.
+
+    At most `max_in_flight` page ranges of a document are submitted at once. When the
+    source is bytes every task receives its own copy, so this also bounds the memory a
+    single document can hold in the pool.
+    """
+    if isinstance(source, (bytes, bytearray)) and len(source) > PDF_MAX_BYTES:
+        raise PdfTooLargeError(f"PDF exceeds {PDF_MAX_BYTES} bytes")
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+
+    total = total_pages if total_pages is not None else await count_pages(source)
+    if max_pages is not None:
+        total = min(total, max_pages)
+    ranges = [(start, min(start + pages_per_task, total)) for start in range(0, total, pages_per_task)]
+
+    pending = []
+    next_range = 0
+    try:
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < max_in_flight:
+                start, end = ranges[next_range]
+                pending.append((start, loop.run_in_executor(executor, _extract_page_range, source, start, end)))
+                next_range += 1
+            start, future = pending.pop(0)
+            yield start, await future
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+async def iter_pages(source: PdfSource, total_pages: Optional[int] = None) -> AsyncIterator[Tuple[int, str]]:
+    """Yield (page_num, text) one page at a time, in order, numbered from 1."""
+    async for start, batch in iter_page_batches(source, total_pages=total_pages):
+        for offset, page_text in enumerate(batch):
+            yield start + offset + 1, page_text
+
+async def extract_pages(source: PdfSource, max_pages: Optional[int] = None) -> List[str]:
+    """Extract every page's text, in page order."""
+    pages: List[str] = []
+    async for _, batch in iter_page_batches(source, max_pages=max_pages):
+        pages.extend(batch)
+    return pages
+
+async def extract_text(source: PdfSource, max_pages: Optional[int] = None) -> str:
+    return "\n".join(await extract_pages(source, max_pages=max_pages))
@@ -0,0 +1,224 @@
+# prompt_builder.py
+"""
+Token-budgeted prompt assembly.
+
+A prompt is assembled from named components: "system", "rag", "history", "spec"
+and "question". A component is either one text, or a list of items (RAG chunks,
+conversation turns) that is trimmed by dropping whole items. Trimming happens in
+two passes:
+  1. each component is cut to its own budget (PROMPT_BUDGET_*);
+  2. if the total is still over PROMPT_MAX_INPUT_TOKENS, components are cut
+     further in TRIM_ORDER: history first, the question last.
+Lists drop items from the end that matters least: RAG chunks come in rank order,
+so the lowest-ranked chunks go first; for history, the oldest turns go first. Texts are
+cut at a token boundary and marked with TRUNCATION_MARKER.
+
+Tokens are counted with tiktoken when it is installed and has the model's
+encoding. Otherwise the gateway's rough estimate is used. A build's token counts
+are kept on PromptBuilder.usage; totals per prompt are exposed through stats() and /metrics.
+"""
+from typing import Dict, List, Optional, Tuple
+from core.config import (
+    PROMPT_MAX_INPUT_TOKENS,
+    PROMPT_BUDGET_SYSTEM,
+    PROMPT_BUDGET_RAG,
+    PROMPT_BUDGET_HISTORY,
+    PROMPT_BUDGET_SPEC,
+    PROMPT_BUDGET_QUESTION
+)
+from services.llm_gateway import estimate_tokens
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_BUDGETS = {
+    "system": PROMPT_BUDGET_SYSTEM,
+    "rag": PROMPT_BUDGET_RAG,
+    "history": PROMPT_BUDGET_HISTORY,
+    "spec": PROMPT_BUDGET_SPEC,
+    "question": PROMPT_BUDGET_QUESTION
+}
+TRIM_ORDER = ("history", "rag", "spec", "system", "question")
+TRUNCATION_MARKER = "\n[...truncated]"
+
+_encodings: Dict[str, object] = {}
+_usage: Dict[str, Dict] = {}
+
+
+# ---------------------------
+# Token counting
+# ---------------------------
+def _encoding(model: str):
+    """tiktoken encoding for model, or None if tiktoken or the encoding is unavailable."""
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # The encoding files are fetched on first use; offline, fall back to estimates
+            print(f"tiktoken unavailable for {model}, estimating tokens: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+def count_tokens(text: str, model: str) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """The longest prefix of text within max_tokens (marker included), or "" if not even the marker fits."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    room = max_tokens - count_tokens(TRUNCATION_MARKER, model)
+    if room <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:room * 4] + TRUNCATION_MARKER
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:room]) + TRUNCATION_MARKER
+
+
+# ---------------------------
+# Components
+# ---------------------------
+class _Component:
+    def __init__(self, model: str, text: Optional[str] = None, items: Optional[List[str]] = None,
+                 keep: str = "first", separator: str = "\n\n"):
+        self.model = model
+        self.items = list(items) if items is not None else None
+        self.text = text or ""
+        self.keep = keep
+        self.separator = separator
+        self.dropped = 0
+        self.truncated = False
+
+    def render(self) -> str:
+        return self.separator.join(self.items) if self.items is not None else self.text
+
+    def tokens(self) -> int:
+        rendered = self.render()
+        return count_tokens(rendered, self.model) if rendered else 0
+
+    def shrink_to(self, budget: int):
+        budget = max(0, budget)
+        if self.tokens() <= budget:
+            return
+        if self.items is None:
+            self.text = truncate_tokens(self.text, budget, self.model)
+            self.truncated = True
+            return
+        # Keep the most important items whole; cut the first one rather than lose everything
+        ordered = self.items if self.keep == "first" else self.items[::-1]
+        kept, used = [], 0
+        for item in ordered:
+            cost = count_tokens(item + self.separator, self.model)
+            if used + cost > budget:
+                break
+            kept.append(item)
+            used += cost
+        if not kept and ordered:
+            first = truncate_tokens(ordered[0], budget, self.model)
+            kept = [first] if first else []
+            self.truncated = True
+        self.dropped += len(self.items) - len(kept)
+        self.items = kept if self.keep == "first" else kept[::-1]
+
+
+class PromptBuilder:
+    """
+    Collects components, then build() returns their trimmed texts by name.
+    `name` groups the usage stats (e.g. "chat", "architect", "deep_dive").
+    """
+
+    def __init__(self, name: str, model: str, max_input_tokens: int = PROMPT_MAX_INPUT_TOKENS,
+                 budgets: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self._components: Dict[str, _Component] = {}
+        self.usage: Optional[Dict] = None
+
+    def text(self, component: str, text: str) -> "PromptBuilder":
+        self._components[component] = _Component(self.model, text=text)
+        return self
+
+    def items(self, component: str, items: List[str], keep: str = "first", separator: str = "\n\n") -> "PromptBuilder":
+        """A list component. keep="first" drops items from the end, keep="last" from the start."""
+        self._components[component] = _Component(self.model, items=items, keep=keep, separator=separator)
+        return self
+
+    def build(self) -> Dict[str, str]:
+        for name, component in self._components.items():
+            component.shrink_to(self.budgets.get(name, self.max_input_tokens))
+
+        tokens = {name: component.tokens() for name, component in self._components.items()}
+        excess = sum(tokens.values()) - self.max_input_tokens
+        for name in sorted(self._components, key=_trim_rank):
+            if excess <= 0:
+                break
+            component = self._components[name]
+            component.shrink_to(tokens[name] - excess)
+            excess -= tokens[name] - component.tokens()
+            tokens[name] = component.tokens()
+
+        self.usage = {
+            "total": sum(tokens.values()),
+            "components": {
+                name: {
+                    "tokens": tokens[name],
+                    "budget": self.budgets.get(name),
+                    "dropped_items": component.dropped,
+                    "truncated": component.truncated
+                }
+                for name, component in self._components.items()
+            }
+        }
+        _record(self.name, self.usage)
+        return {name: component.render() for name, component in self._components.items()}
+
+
+def _trim_rank(name: str) -> Tuple[int, str]:
+    return (TRIM_ORDER.index(name) if name in TRIM_ORDER else -1, name)
+
+
+# ---------------------------
+# Usage reporting
+# ---------------------------
+def _record(name: str, usage: Dict):
+    trimmed = [
+        part for part, info in usage["components"].items()
+        if info["dropped_items"] or info["truncated"]
+    ]
+    totals = _usage.setdefault(name, {"calls": 0, "trimmed_calls": 0, "tokens": 0, "max_tokens": 0, "components": {}})
+    totals["calls"] += 1
+    totals["trimmed_calls"] += 1 if trimmed else 0
+    totals["tokens"] += usage["total"]
+    totals["max_tokens"] = max(totals["max_tokens"], usage["total"])
+    for part, info in usage["components"].items():
+        totals["components"][part] = totals["components"].get(part, 0) + info["tokens"]
+
+def stats() -> dict:
+    return {
+        "tokenizers": {model: "tiktoken" if encoding is not None else "estimate" for model, encoding in _encodings.items()}
+        if tiktoken is not None else "estimate",
+        "max_input_tokens": PROMPT_MAX_INPUT_TOKENS,
+        "prompts": {
+            name: {
+                "calls": totals["calls"],
+                "trimmed_calls": totals["trimmed_calls"],
+                "avg_tokens": round(totals["tokens"] / totals["calls"]),
+                "max_tokens": totals["max_tokens"],
+                "avg_component_tokens": {
+                    part: round(value / totals["calls"]) for part, value in totals["components"].items()
+                }
+            }
+            for name, totals in _usage.items()
+        }
+    }
@@ -1,14 +1,89 @@
+from typing import List, Optional, Tuple
 from sqlalchemy import text
 from models.models import DocumentChunk
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import RAG_TOP_K, RAG_HNSW_EF_SEARCH, RAG_IVFFLAT_PROBES
+from core.database import AsyncSessionLocal
 
 
-def retrieve_relevant_chunks(query_embedding, db: Session, top_k=5):
-    sql = text("""
-        SELECT content
-        FROM document_chunks
-        ORDER BY embedding <-> (:embedding)::vector
-        LIMIT :limit
-    """)
-    result = db.execute(sql, {"embedding": query_embedding, "limit": top_k})
+SEARCH_PARAMS_SQL = text(
+    "SELECT set_config('hnsw.ef_search', :ef_search, true), set_config('ivfflat.probes', :probes, true)"
+)
+RETRIEVE_SQL = text("""
+    SELECT content
+    FROM document_chunks
+    ORDER BY embedding <-> (:embedding)::vector
+    LIMIT :limit
+""")
+RETRIEVE_WITH_IDS_SQL = text("""
+    SELECT id, content
+    FROM document_chunks
+    ORDER BY embedding <-> (:embedding)::vector
+    LIMIT :limit
+""")
+
+
+def search_params(ef_search: Optional[int] = None, probes: Optional[int] = None, top_k: int = RAG_TOP_K) -> dict:
+    # hnsw.ef_search must be at least top_k or the index returns fewer rows than asked for.
+    return {
+        "ef_search": str(max(ef_search or RAG_HNSW_EF_SEARCH, top_k)),
+        "probes": str(probes or RAG_IVFFLAT_PROBES),
+    }
+
+def set_search_params(db: Session, ef_search: Optional[int] = None, probes: Optional[int] = None, top_k: int = RAG_TOP_K):
+    """
+    Apply per-query recall/speed knobs for the ANN index to the current transaction.
+    Higher ef_search (HNSW) or probes (IVFFlat) improves recall at the cost of latency.
+    """
+    db.execute(SEARCH_PARAMS_SQL, search_params(ef_search, probes, top_k))
+
+
+def retrieve_relevant_chunks(
+    query_embedding,
+    db: Session,
+    top_k: int = RAG_TOP_K,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+):
+    set_search_params(db, ef_search=ef_search, probes=probes, top_k=top_k)
+    result = db.execute(RETRIEVE_SQL, {"embedding": query_embedding, "limit": top_k})
     return [row[0] for row in result]
+
+
+async def aretrieve_relevant_chunks(
+    query_embedding,
+    db: AsyncSession,
+    top_k: int = RAG_TOP_K,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+):
+    """Async variant of retrieve_relevant_chunks for AsyncSession callers."""
+    await db.execute(SEARCH_PARAMS_SQL, search_params(ef_search, probes, top_k))
+    result = await db.execute(RETRIEVE_SQL, {"embedding": query_embedding, "limit": top_k})
+    return [row[0] for row in result]
+
+async def retrieve_chunks(query_embedding, db: Optional[AsyncSession] = None, top_k: int = RAG_TOP_K):
+    """
+    Retrieve on the caller's request session when one is passed, so a request checks
+    out a single connection; otherwise use a short-lived session of our own.
+    """
+    if db is not None:
+        return await aretrieve_relevant_chunks(query_embedding, db, top_k=top_k)
+    async with AsyncSessionLocal() as own_db:
+        return await aretrieve_relevant_chunks(query_embedding, own_db, top_k=top_k)
+
+async def retrieve_chunk_rows(query_embedding, db: Optional[AsyncSession] = None, top_k: int = RAG_TOP_K) -> List[Tuple[str, str]]:
+    """
+    Like retrieve_chunks, but returns (chunk id, content) pairs; the ids identify the
+    retrieved context in response cache keys.
+    """
+    async def run(session: AsyncSession):
+        await session.execute(SEARCH_PARAMS_SQL, search_params(top_k=top_k))
+        result = await session.execute(RETRIEVE_WITH_IDS_SQL, {"embedding": query_embedding, "limit": top_k})
+        return [(str(row[0]), row[1]) for row in result]
+
+    if db is not None:
+        return await run(db)
+    async with AsyncSessionLocal() as own_db:
+        return await run(own_db)
@@ -0,0 +1,152 @@
+# response_cache.py
+"""
+Cache of parsed LLM responses for workflow generation and deep dives.
+
+Many students paste the same assignment text, and each paste used to pay for a
+full completion. A response is reused when the request is identical: same model,
+same messages after whitespace/unicode normalization, same temperature and
+max_tokens, and the same retrieved RAG chunks (by id). Entries are evicted LRU
+beyond RESPONSE_CACHE_MAX_ENTRIES and expire after RESPONSE_CACHE_TTL_SECONDS.
+
+With RESPONSE_CACHE_SEMANTIC enabled, a request that differs only in its query
+text can also reuse a response whose query embedding is at least
+RESPONSE_CACHE_SEMANTIC_THRESHOLD cosine-similar. The rest of the request (its
+"scope": endpoint, parameters, chunk ids and any extra prompt input) must match exactly.
+
+Hit rates are counted per endpoint and exposed through stats() and /metrics.
+"""
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from core.config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_SEMANTIC,
+    RESPONSE_CACHE_SEMANTIC_THRESHOLD
+)
+from services.embedding_cache import normalize_text
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def request_key(model: str, messages: List[dict], temperature: float, max_tokens: int, chunk_ids: Sequence[str]) -> str:
+    """Exact-match key of a completion request."""
+    return _digest({
+        "model": model,
+        "messages": [[message["role"], normalize_text(message["content"])] for message in messages],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "chunks": list(chunk_ids)
+    })
+
+def request_scope(endpoint: str, model: str, temperature: float, max_tokens: int, chunk_ids: Sequence[str], extra: str = "") -> str:
+    """Everything about a request except its query text; semantic matches must share it."""
+    return _digest({
+        "endpoint": endpoint,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "chunks": list(chunk_ids),
+        "extra": normalize_text(extra)
+    })
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        semantic_threshold: float = RESPONSE_CACHE_SEMANTIC_THRESHOLD
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic = semantic
+        self.semantic_threshold = semantic_threshold
+        # key -> (expires_at, scope, unit query embedding or None, value)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_scope: Dict[str, set] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, endpoint: str, outcome: str):
+        counts = self._stats.setdefault(endpoint, {"hits": 0, "semantic_hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def _remove(self, key: str):
+        _, scope, _, _ = self._entries.pop(key)
+        keys = self._keys_by_scope.get(scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_scope[scope]
+
+    def _live(self, key: str) -> Optional[tuple]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, scope: str, embedding: np.ndarray) -> Optional[str]:
+        best_key, best_score = None, self.semantic_threshold
+        for key in list(self._keys_by_scope.get(scope, ())):
+            entry = self._live(key)
+            if entry is None or entry[2] is None:
+                continue
+            score = float(np.dot(entry[2], embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, endpoint: str, key: str, scope: Optional[str] = None, embedding: Optional[Sequence[float]] = None):
+        """A deep copy of the cached value, or None on a miss."""
+        entry = self._live(key)
+        outcome = "hits"
+        if entry is None and self.semantic and scope is not None and embedding is not None:
+            near_key = self._nearest(scope, _unit(embedding))
+            if near_key is not None:
+                key, entry, outcome = near_key, self._entries[near_key], "semantic_hits"
+        if entry is None:
+            self._count(endpoint, "misses")
+            return None
+        self._entries.move_to_end(key)
+        self._count(endpoint, outcome)
+        return copy.deepcopy(entry[3])
+
+    def set(self, endpoint: str, key: str, value, scope: Optional[str] = None, embedding: Optional[Sequence[float]] = None):
+        if self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        scope = scope or ""
+        vector = _unit(embedding) if self.semantic and embedding is not None else None
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, scope, vector, copy.deepcopy(value))
+        self._keys_by_scope.setdefault(scope, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        endpoints = {}
+        for endpoint, counts in self._stats.items():
+            lookups = counts["hits"] + counts["semantic_hits"] + counts["misses"]
+            endpoints[endpoint] = {
+                **counts,
+                "hit_rate": round((counts["hits"] + counts["semantic_hits"]) / lookups, 4) if lookups else None
+            }
+        return {"entries": len(self._entries), "semantic": self.semantic, "endpoints": endpoints}
+
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,77 @@
+# single_flight.py
+"""
+Coalesces identical concurrent calls into one.
+
+The first caller for a key starts the call in its own task (the leader). Callers
+that arrive with the same key while it is running await that task instead of
+starting another, and everyone gets the same result or exception. Each caller
+awaits the task through asyncio.shield, so a caller that disconnects (is
+cancelled) only stops waiting: the call keeps running for the others. The call
+itself is cancelled only once every caller waiting on it has gone away.
+
+Keys are forgotten as soon as the call finishes. This is not a cache; finished
+results are not kept.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.shared = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return fn()'s result, sharing one call among concurrent callers with the same key."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finished(key, flight))
+            self.calls += 1
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Last one waiting: nobody needs the result any more. Forget the key
+                # first so a caller arriving meanwhile starts a fresh call.
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finished(self, key: Hashable, flight: _Flight):
+        self._forget(key, flight)
+        # Mark a failure as retrieved even if every caller was cancelled before it arrived
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "shared": self.shared,
+            "abandoned": self.abandoned
+        }
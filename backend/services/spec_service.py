@@ -185,4 +185,52 @@ def get_section_order(section_name: str) -> int:
         "UI/UX Components": 6,
         "Infrastructure": 7
     }
-    return order_map.get(section_name, 99)  # Default to end for unknown sections 
\ No newline at end of file
+    return order_map.get(section_name, 99)  # Default to end for unknown sections
+
+
+class SectionStream:
+    """
+    Split spec markdown that arrives in pieces into completed "## " sections.
+    feed() returns (title, section_markdown) for each section that is known to be
+    complete because the next "## " heading has started; finish() flushes the last one.
+    Text before the first "## " heading (e.g. the "# Title" line) is not a section.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.current_title: Optional[str] = None
+        self.current_lines: List[str] = []
+
+    def _take_line(self, line: str) -> Optional[tuple]:
+        completed = None
+        match = re.match(r'^##\s+(.+)$', line.rstrip('\n'))
+        if match:
+            if self.current_title is not None:
+                completed = (self.current_title, "".join(self.current_lines).strip())
+            self.current_title = match.group(1).strip()
+            self.current_lines = []
+        self.current_lines.append(line)
+        return completed
+
+    def feed(self, text: str) -> List[tuple]:
+        self.pending += text
+        completed = []
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            section = self._take_line(line + "\n")
+            if section:
+                completed.append(section)
+        return completed
+
+    def finish(self) -> List[tuple]:
+        completed = []
+        if self.pending:
+            section = self._take_line(self.pending)
+            self.pending = ""
+            if section:
+                completed.append(section)
+        if self.current_title is not None:
+            completed.append((self.current_title, "".join(self.current_lines).strip()))
+            self.current_title = None
+            self.current_lines = []
+        return completed
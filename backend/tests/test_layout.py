@@ -0,0 +1,65 @@
+"""
+Property-based tests for utils/layout.py on random canvas-shaped graphs.
+"""
+from hypothesis import given, settings, strategies as st
+from utils.workflow_graph import WorkflowGraph
+from utils.layout import NODE_WIDTH, ROW_HEIGHT, full_layout, layout_around, apply_positions
+from tests.test_workflow_graph import INSERTION_TYPES, build_graph
+
+seed_ops = st.lists(st.tuples(st.sampled_from(INSERTION_TYPES), st.integers(min_value=0, max_value=10_000)), max_size=40)
+
+
+def overlapping(positions):
+    items = sorted(positions.items())
+    return [
+        (a, b)
+        for index, (a, (ax, ay)) in enumerate(items)
+        for b, (bx, by) in items[index + 1:]
+        if abs(ax - bx) < NODE_WIDTH and abs(ay - by) < ROW_HEIGHT
+    ]
+
+
+def current_positions(graph: WorkflowGraph):
+    return {step_id: (node.position_x, node.position_y) for step_id, node in graph.steps.items()}
+
+
+@settings(max_examples=150, deadline=None)
+@given(seed_ops=seed_ops)
+def test_full_layout_places_every_step_without_overlap(seed_ops):
+    graph = build_graph(seed_ops)
+    positions = full_layout(graph)
+    assert set(positions) == set(graph.steps)
+    assert overlapping(positions) == []
+    # Deterministic and stable: laying out the laid-out graph moves nothing.
+    apply_positions(graph, positions)
+    assert full_layout(graph) == positions
+    assert apply_positions(graph, full_layout(graph)) == []
+
+
+@settings(max_examples=150, deadline=None)
+@given(seed_ops=seed_ops, insertion_type=st.sampled_from(INSERTION_TYPES), pick=st.integers(min_value=0, max_value=10_000))
+def test_layout_around_insert_only_moves_affected_steps(seed_ops, insertion_type, pick):
+    graph = build_graph(seed_ops)
+    apply_positions(graph, full_layout(graph))
+    before = current_positions(graph)
+    reference = sorted(graph.steps)[pick % len(graph.steps)]
+    if insertion_type == "new_step" and graph.steps[reference].parent_id is not None:
+        insertion_type = "after"
+    new_id = graph.insert("new", reference, insertion_type=insertion_type)
+    apply_positions(graph, layout_around(graph, new_id))
+
+    main_id = new_id
+    while graph.steps[main_id].parent_id is not None:
+        main_id = graph.steps[main_id].parent_id
+    # Steps of other main steps in the same column stay put.
+    for step_id, position in before.items():
+        if graph.steps[step_id].position_x < graph.steps[main_id].position_x:
+            assert current_positions(graph)[step_id] == position
+    # The edited main step's subtree is tidy again.
+    subtree = {main_id}
+    frontier = [main_id]
+    while frontier:
+        children = graph.children.get(frontier.pop(), set())
+        subtree |= children
+        frontier.extend(children)
+    assert overlapping({step_id: current_positions(graph)[step_id] for step_id in subtree}) == []
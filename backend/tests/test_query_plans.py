@@ -0,0 +1,75 @@
+"""
+Query-plan regression tests for the hot route queries.
+
+Each query is EXPLAINed with enable_seqscan=off: the planner then only picks a
+sequential scan when no index can serve the query, so a Seq Scan in the plan
+means a supporting index is missing (or no longer matches the query).
+
+Needs a Postgres database migrated to head (`alembic upgrade head`):
+    TEST_DATABASE_URL=postgresql://... pytest tests/test_query_plans.py
+"""
+import os
+import uuid
+import pytest
+from sqlalchemy import create_engine, desc, select
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+from models.models import (  # noqa: E402
+    Assignment, Step, Connection, ChatMessage, IdeaSession, IdeaMessage, SpecChange
+)
+
+USER_ID = str(uuid.uuid4())
+SESSION_ID = str(uuid.uuid4())
+
+# Mirrors the WHERE/ORDER BY of the route queries they are named after.
+HOT_QUERIES = {
+    "dashboard.get_user_assignments": select(Assignment)
+        .where(Assignment.user_id == USER_ID).order_by(desc(Assignment.created_at)),
+    "dashboard.get_assignment_steps": select(Step).where(Step.assignment_id == 1),
+    "node.delete_node.children": select(Step).where(Step.parent_id == 1).order_by(Step.position_y),
+    "node.delete_node.incoming": select(Connection).where(Connection.to_step == 1),
+    "node.delete_node.outgoing": select(Connection).where(Connection.from_step == 1),
+    "connection.create_connection.duplicate": select(Connection).where(
+        Connection.assignment_id == 1, Connection.from_step == 1, Connection.to_step == 2
+    ),
+    "connection.list_for_assignment": select(Connection).where(Connection.assignment_id == 1),
+    "chat.get_assignment_chat": select(ChatMessage).where(
+        ChatMessage.assignment_id == 1, ChatMessage.step_id.is_(None)
+    ).order_by(ChatMessage.timestamp),
+    "chat.get_node_chat": select(ChatMessage).where(ChatMessage.step_id == 1).order_by(ChatMessage.timestamp),
+    "idea_session.get_user_sessions": select(IdeaSession)
+        .where(IdeaSession.user_id == USER_ID).order_by(desc(IdeaSession.created_at)),
+    "idea_session.get_session_messages": select(IdeaMessage)
+        .where(IdeaMessage.session_id == SESSION_ID).order_by(IdeaMessage.created_at),
+    "idea_session.get_spec_history": select(SpecChange)
+        .where(SpecChange.session_id == SESSION_ID).order_by(desc(SpecChange.created_at)),
+}
+
+
+@pytest.fixture(scope="module")
+def connection():
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+def seq_scans(plan: dict) -> list:
+    found = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found += seq_scans(child)
+    return found
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(connection, name):
+    compiled = HOT_QUERIES[name].compile(dialect=connection.dialect)
+    with connection.begin() as transaction:
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        plan = connection.exec_driver_sql(
+            "EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params
+        ).scalar()[0]["Plan"]
+        transaction.rollback()
+    assert seq_scans(plan) == [], f"{name} falls back to a sequential scan"
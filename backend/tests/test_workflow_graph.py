@@ -0,0 +1,165 @@
+"""
+Property-based tests for utils/workflow_graph.py.
+
+Random graphs are built with the same insert operations the canvas uses, then
+random inserts/deletes are applied. After every operation the indexes must agree
+with the steps/connections, nothing may point at a missing step, and replaying the
+recorded diff onto the loaded rows must give the in-memory graph back.
+"""
+from hypothesis import given, settings, strategies as st
+from fastapi import HTTPException
+from utils.workflow_graph import WorkflowGraph
+
+INSERTION_TYPES = ["new_step", "after", "substep", None]
+
+operation = st.tuples(
+    st.sampled_from(["insert", "delete"]),
+    st.sampled_from(INSERTION_TYPES),
+    st.integers(min_value=0, max_value=10_000)
+)
+
+
+def build_graph(seed_ops) -> WorkflowGraph:
+    """A graph with positive (database) ids, as WorkflowGraph.load would return it."""
+    graph = WorkflowGraph(1, [], [])
+    graph.insert("root")
+    for insertion_type, pick in seed_ops:
+        step_ids = sorted(graph.steps)
+        try:
+            graph.insert("step", step_ids[pick % len(step_ids)], insertion_type=insertion_type)
+        except HTTPException:
+            pass
+    ids = {step_id: index + 1 for index, step_id in enumerate(sorted(graph.steps, reverse=True))}
+    steps = [
+        (ids[step_id], ids.get(node.parent_id), node.position_x, node.position_y)
+        for step_id, node in graph.steps.items()
+    ]
+    connections = [
+        (index + 1, ids[from_step], ids[to_step])
+        for index, (from_step, to_step) in enumerate(graph.connections.values())
+    ]
+    return WorkflowGraph(1, steps, connections)
+
+
+def snapshot(graph: WorkflowGraph):
+    steps = {step_id: (node.parent_id, node.position_x, node.position_y) for step_id, node in graph.steps.items()}
+    return steps, dict(graph.connections)
+
+
+def replay(loaded, graph: WorkflowGraph):
+    """Apply the graph's recorded diff to a snapshot of the loaded state."""
+    steps, connections = dict(loaded[0]), dict(loaded[1])
+    for step_id in graph.deleted_steps:
+        del steps[step_id]
+    for step_id, fields in graph.step_changes.items():
+        parent_id, position_x, position_y = steps[step_id]
+        steps[step_id] = (
+            fields.get("parent_id", parent_id),
+            fields.get("position_x", position_x),
+            fields.get("position_y", position_y)
+        )
+    for step_id in graph.new_steps:
+        node = graph.steps[step_id]
+        steps[step_id] = (node.parent_id, node.position_x, node.position_y)
+    for connection_id in graph.deleted_connections:
+        del connections[connection_id]
+    for connection_id, fields in graph.connection_changes.items():
+        connections[connection_id] = (fields["from_step"], fields["to_step"])
+    for connection_id in graph.new_connections:
+        connections[connection_id] = graph.connections[connection_id]
+    return steps, connections
+
+
+def assert_consistent(graph: WorkflowGraph):
+    for step_id, node in graph.steps.items():
+        assert node.parent_id is None or node.parent_id in graph.steps
+        if node.parent_id is not None:
+            assert step_id in graph.children[node.parent_id]
+    for parent_id, children in graph.children.items():
+        for child_id in children:
+            assert graph.steps[child_id].parent_id == parent_id
+    for connection_id, (from_step, to_step) in graph.connections.items():
+        assert from_step in graph.steps and to_step in graph.steps
+        assert connection_id in graph.outgoing[from_step]
+        assert connection_id in graph.incoming[to_step]
+    for index in (graph.outgoing, graph.incoming):
+        for step_id, connection_ids in index.items():
+            assert step_id in graph.steps or not connection_ids
+            assert connection_ids <= set(graph.connections)
+
+
+@settings(max_examples=200, deadline=None)
+@given(
+    seed_ops=st.lists(st.tuples(st.sampled_from(INSERTION_TYPES), st.integers(min_value=0, max_value=10_000)), max_size=25),
+    operations=st.lists(operation, min_size=1, max_size=15)
+)
+def test_random_edits_keep_graph_consistent(seed_ops, operations):
+    graph = build_graph(seed_ops)
+    loaded = snapshot(graph)
+    for kind, insertion_type, pick in operations:
+        step_ids = sorted(graph.steps)
+        before = len(graph.steps)
+        if kind == "insert":
+            reference = step_ids[pick % len(step_ids)] if step_ids else None
+            try:
+                graph.insert("new", reference, insertion_type=insertion_type if step_ids else None)
+            except HTTPException:
+                assert len(graph.steps) == before
+                continue
+            assert len(graph.steps) == before + 1
+        elif step_ids:
+            target = step_ids[pick % len(step_ids)]
+            graph.delete(target)
+            assert target not in graph.steps
+            assert len(graph.steps) == before - 1
+        assert_consistent(graph)
+    assert replay(loaded, graph) == snapshot(graph)
+
+
+@settings(max_examples=100, deadline=None)
+@given(seed_ops=st.lists(st.tuples(st.sampled_from(INSERTION_TYPES), st.integers(min_value=0, max_value=10_000)), max_size=25))
+def test_delete_keeps_neighbours_connected(seed_ops):
+    original = build_graph(seed_ops)
+    candidates = [
+        step_id for step_id, node in original.steps.items()
+        if node.parent_id is None and not original.children.get(step_id)
+    ]
+    for step_id in candidates:
+        graph = build_graph(seed_ops)
+        predecessors = {graph.connections[c][0] for c in graph.incoming.get(step_id, ())}
+        successors = {graph.connections[c][1] for c in graph.outgoing.get(step_id, ())}
+        graph.delete(step_id)
+        assert_consistent(graph)
+        if predecessors and successors:
+            linked = {graph.connections[c][1] for p in predecessors for c in graph.outgoing.get(p, ())}
+            assert linked & successors
+
+
+def test_insert_new_step_splits_main_connection():
+    graph = WorkflowGraph(1, [(1, None, 0, 0), (2, None, 100, 0)], [(1, 1, 2)])
+    new_id = graph.insert("middle", 1, insertion_type="new_step")
+    assert graph.deleted_connections == {1}
+    assert sorted(graph.connections.values()) == sorted([(1, new_id), (new_id, 2)])
+    assert not graph.step_changes
+
+
+def test_delete_main_step_promotes_topmost_substep():
+    graph = WorkflowGraph(
+        1,
+        [(1, None, 0, 0), (2, None, 100, 0), (3, 2, 100, 140), (4, 2, 100, 70), (5, None, 200, 0)],
+        [(1, 1, 2), (2, 2, 5), (3, 2, 4), (4, 4, 3)]
+    )
+    graph.delete(2)
+    assert graph.steps[4].parent_id is None
+    assert graph.steps[3].parent_id == 4
+    assert sorted(graph.connections.values()) == [(1, 4), (4, 3), (4, 5)]
+    assert graph.deleted_steps == {2}
+    assert graph.deleted_connections == {3}
+    assert not graph.new_connections
+
+
+def test_connections_to_other_assignments_are_skipped():
+    graph = WorkflowGraph(1, [(1, None, 0, 0), (2, None, 100, 0)], [(1, 1, 2), (2, 2, 99), (3, 98, 1)])
+    assert graph.connections == {1: (1, 2)}
+    graph.delete(2)
+    assert_consistent(graph)
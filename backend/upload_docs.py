@@ -1,25 +1,46 @@
 import os
-import fitz  
+import hashlib
 import asyncio
 from core.database import SessionLocal
-from services.embedder import embed_and_store
+from services.embedder import ingest_documents, load_manifest, is_unchanged, remove_sources
+from services.pdf_extractor import extract_text, shutdown_executor
 
-def read_pdf(filepath):
-    doc = fitz.open(filepath)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+def hash_file(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-async def upload_folder(folder_path):
-    db = SessionLocal()
+async def read_folder(folder_path, manifest):
     for filename in os.listdir(folder_path):
         if filename.endswith(".pdf"):
             full_path = os.path.join(folder_path, filename)
+            file_hash = await asyncio.to_thread(hash_file, full_path)
+            if is_unchanged(manifest, filename, file_hash):
+                print(f"Unchanged, skipping: {filename}")
+                continue
             print(f"Uploading: {filename}")
-            text = read_pdf(full_path)
-            await embed_and_store(text, db, source=filename)  # Pass filename as source
-    db.close()
+            text = await extract_text(full_path)
+            yield filename, text, file_hash  # Pass filename as source
+
+async def upload_folder(folder_path):
+    """
+    Incrementally sync a folder of PDFs into document_chunks.
+    Unchanged files are skipped, modified files only embed their new chunks, and
+    chunks of files that were removed from the folder are deleted.
+    """
+    db = SessionLocal()
+    try:
+        manifest = load_manifest(db)
+        stats = await ingest_documents(read_folder(folder_path, manifest), db)
+        present = {filename for filename in os.listdir(folder_path) if filename.endswith(".pdf")}
+        removed = remove_sources(db, set(manifest) - present)
+        print(f"Ingested {stats['documents']} documents: {stats['embedded']} chunks embedded, "
+              f"{stats['reused']} reused, {removed} removed")
+    finally:
+        db.close()
+        shutdown_executor()
 
 if __name__ == "__main__":
-    asyncio.run(upload_folder("/Users/aryandaga/Desktop/workflow_documents"))  
+    asyncio.run(upload_folder("/Users/aryandaga/Desktop/workflow_documents"))
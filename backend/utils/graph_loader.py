@@ -0,0 +1,112 @@
+# utils/graph_loader.py
+"""
+Load an assignment's workflow graph (assignment, steps, connections) in a single
+round trip. Postgres builds the JSON document itself, so the full format can be
+sent to the client as-is without going through ORM objects or Pydantic.
+
+Graphs carry the assignment's revision (utils/revisions.py). A delta load returns
+only the steps/connections changed after a given revision plus the ids of the
+ones deleted since then.
+"""
+from typing import Optional, Tuple
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Rows changed after :since; a full load passes since = -1 to get every row.
+_STEPS_JSON = """
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', s.id,
+                'content', s.content,
+                'position_x', s.position_x,
+                'position_y', s.position_y,
+                'completed', COALESCE(s.completed, false),
+                'parent_id', s.parent_id
+            ) ORDER BY s.id)
+            FROM steps s
+            WHERE s.assignment_id = a.id AND s.revision > :since
+        ), '[]'::json)"""
+
+_CONNECTIONS_JSON = """
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', c.id,
+                'from_step', c.from_step,
+                'to_step', c.to_step
+            ) ORDER BY c.id)
+            FROM connections c
+            WHERE c.assignment_id = a.id AND c.revision > :since
+        ), '[]'::json)"""
+
+_DELETED_JSON = """
+        COALESCE((
+            SELECT json_agg(t.object_id ORDER BY t.object_id)
+            FROM graph_tombstones t
+            WHERE t.assignment_id = a.id AND t.kind = '{kind}' AND t.revision > :since
+        ), '[]'::json)"""
+
+_ASSIGNMENT_FIELDS = """
+        'id', a.id,
+        'title', a.title,
+        'description', a.description,
+        'deadline', a.deadline,
+        'completed', COALESCE(a.completed, false),
+        'revision', a.revision,"""
+
+GRAPH_SQL = text(f"""
+    SELECT a.revision, json_build_object({_ASSIGNMENT_FIELDS}
+        'steps', {_STEPS_JSON},
+        'connections', {_CONNECTIONS_JSON}
+    )::text
+    FROM assignments a
+    WHERE a.id = :assignment_id
+""")
+
+DELTA_SQL = text(f"""
+    SELECT a.revision, json_build_object({_ASSIGNMENT_FIELDS}
+        'since', :since,
+        'steps', {_STEPS_JSON},
+        'connections', {_CONNECTIONS_JSON},
+        'deleted_steps', {_DELETED_JSON.format(kind="step")},
+        'deleted_connections', {_DELETED_JSON.format(kind="connection")}
+    )::text
+    FROM assignments a
+    WHERE a.id = :assignment_id
+""")
+
+REVISION_SQL = text("SELECT revision FROM assignments WHERE id = :assignment_id")
+
+STEP_FIELDS = ("id", "content", "position_x", "position_y", "completed", "parent_id")
+CONNECTION_FIELDS = ("id", "from_step", "to_step")
+
+
+def load_revision(db: Session, assignment_id: int) -> Optional[int]:
+    """The assignment's current revision (a primary-key lookup), or None if it doesn't exist."""
+    return db.execute(REVISION_SQL, {"assignment_id": assignment_id}).scalar()
+
+def load_graph_json(db: Session, assignment_id: int, since: Optional[int] = None) -> Optional[Tuple[int, str]]:
+    """
+    Return (revision, graph JSON string), or None if the assignment doesn't exist.
+    With `since`, the JSON is a delta against that revision instead of the full graph.
+    """
+    if since is None:
+        row = db.execute(GRAPH_SQL, {"assignment_id": assignment_id, "since": -1}).first()
+    else:
+        row = db.execute(DELTA_SQL, {"assignment_id": assignment_id, "since": since}).first()
+    return (row[0], row[1]) if row else None
+
+def to_columns(rows: list, fields: tuple) -> dict:
+    return {field: [row[field] for row in rows] for field in fields}
+
+def compact_graph(graph_json: str) -> dict:
+    """
+    Columnar form of the graph for large workflows: steps and connections become
+    parallel arrays (one list per field) instead of a list of objects, which drops
+    the repeated keys from the payload.
+    """
+    graph = orjson.loads(graph_json)
+    graph["format"] = "compact"
+    graph["steps"] = to_columns(graph["steps"], STEP_FIELDS)
+    graph["connections"] = to_columns(graph["connections"], CONNECTION_FIELDS)
+    return graph
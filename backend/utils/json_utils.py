@@ -0,0 +1,114 @@
+# utils/json_utils.py
+from typing import List, Optional, Tuple
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+class StreamingJSONStringFields:
+    """
+    Incrementally decode the string values of a JSON object's top-level keys
+    while the JSON text is still arriving, e.g. from a streamed completion.
+
+    feed() returns events in order:
+      ("delta", key, text)   decoded text appended to a top-level string value
+      ("end", key, value)    the full decoded value once its closing quote arrives
+
+    Nested objects/arrays and non-string values are skipped; parse the complete
+    text with json.loads once the stream is done to get them. Text before the
+    opening brace (e.g. a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escape: Optional[str] = None  # None, "\\" or the "\\uXXXX" collected so far
+        self.high_surrogate: Optional[int] = None
+        self.expect_key = False
+        self.string_role: Optional[str] = None  # "key", "value" or None (skipped string)
+        self.current_key: Optional[str] = None
+        self.buffer: List[str] = []
+        self.values = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, str]]:
+        events = []
+        delta: List[str] = []
+        for ch in chunk:
+            if self.in_string:
+                decoded = self._consume_string_char(ch)
+                if decoded is None:
+                    continue
+                if decoded is _END:
+                    self._end_string(delta, events)
+                    continue
+                self.buffer.append(decoded)
+                if self.string_role == "value":
+                    delta.append(decoded)
+                continue
+
+            if ch == '"':
+                self.in_string = True
+                self.buffer = []
+                if self.depth == 1 and self.expect_key:
+                    self.string_role = "key"
+                elif self.depth == 1 and self.current_key is not None:
+                    self.string_role = "value"
+                else:
+                    self.string_role = None
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+            elif ch in "}]":
+                self.depth -= 1
+            elif self.depth == 1 and ch == ":":
+                self.expect_key = False
+            elif self.depth == 1 and ch == ",":
+                self.expect_key = True
+                self.current_key = None
+        if delta and self.string_role == "value":
+            events.append(("delta", self.current_key, "".join(delta)))
+        return events
+
+    def _end_string(self, delta: List[str], events: list):
+        self.in_string = False
+        text = "".join(self.buffer)
+        if self.string_role == "key":
+            self.current_key = text
+        elif self.string_role == "value":
+            if delta:
+                events.append(("delta", self.current_key, "".join(delta)))
+                delta.clear()
+            self.values[self.current_key] = text
+            events.append(("end", self.current_key, text))
+        self.string_role = None
+
+    def _consume_string_char(self, ch: str):
+        """Return the decoded character(s), None if more input is needed, or _END."""
+        if self.escape is None:
+            if ch == "\\":
+                self.escape = "\\"
+                return None
+            if ch == '"':
+                return _END
+            return ch
+        if self.escape == "\\":
+            if ch == "u":
+                self.escape = "\\u"
+                return None
+            self.escape = None
+            return _ESCAPES.get(ch, ch)
+        self.escape += ch
+        if len(self.escape) < 6:
+            return None
+        code = int(self.escape[2:], 16)
+        self.escape = None
+        if 0xD800 <= code < 0xDC00:
+            self.high_surrogate = code
+            return None
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self.high_surrogate = None
+        return chr(code)
+
+
+_END = object()
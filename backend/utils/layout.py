@@ -0,0 +1,214 @@
+# utils/layout.py
+"""
+Deterministic auto-layout for workflow graphs (runs on a WorkflowGraph).
+
+Main steps are layered left to right: a main step's column is the longest path to
+it over main-step connections (cycles are broken at the top-left-most step), and
+main steps sharing a column are stacked top to bottom, ordered by where their
+predecessors were placed. Each main step's substeps form a tidy tree below it:
+siblings follow their connection chain, and a substep's own substeps are placed in
+the next column to its right, so nothing in a subtree overlaps.
+
+full_layout places every step; layout_around only moves the subtree of the main
+step containing a given step, plus (as a whole, by one offset) the main steps
+downstream of it that it would otherwise overlap. Both return target positions;
+apply_positions records the ones that actually change, so write_graph_diff only
+writes moved rows.
+"""
+import heapq
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from utils.workflow_graph import WorkflowGraph
+
+NODE_WIDTH = 180      # One column; also the offset "substep" insertion uses.
+ROW_HEIGHT = 70       # One row; also the offset "after" insertion uses.
+COLUMN_GAP = 60       # Between main-step columns.
+BRANCH_GAP = 70       # Between main steps stacked in the same column.
+
+Positions = Dict[int, Tuple[float, float]]
+
+
+# ---------------------------
+# Ordering
+# ---------------------------
+def _successors(graph: WorkflowGraph, step_id: int) -> Set[int]:
+    return {graph.connections[connection_id][1] for connection_id in graph.outgoing.get(step_id, ())}
+
+def _predecessors(graph: WorkflowGraph, step_id: int) -> Set[int]:
+    return {graph.connections[connection_id][0] for connection_id in graph.incoming.get(step_id, ())}
+
+def _position_key(graph: WorkflowGraph) -> Callable[[int], tuple]:
+    return lambda step_id: (graph.steps[step_id].position_y, graph.steps[step_id].position_x, step_id)
+
+def longest_path_ranks(nodes: Iterable[int], successors: Callable[[int], Set[int]], key: Callable[[int], tuple]) -> Dict[int, int]:
+    """
+    Rank each node by the longest path to it within `nodes`. When only cycles are
+    left, the remaining node with the smallest key is treated as a source.
+    """
+    nodes = set(nodes)
+    edges = {node: (successors(node) & nodes) - {node} for node in nodes}
+    indegree = dict.fromkeys(nodes, 0)
+    for targets in edges.values():
+        for target in targets:
+            indegree[target] += 1
+    rank = dict.fromkeys(nodes, 0)
+    ready = [(key(node), node) for node in nodes if indegree[node] == 0]
+    heapq.heapify(ready)
+    done: Set[int] = set()
+    while len(done) < len(nodes):
+        if not ready:
+            node = min(nodes - done, key=key)
+        else:
+            node = heapq.heappop(ready)[1]
+            if node in done:
+                continue
+        done.add(node)
+        for target in edges[node]:
+            if target in done:
+                continue
+            rank[target] = max(rank[target], rank[node] + 1)
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                heapq.heappush(ready, (key(target), target))
+    return rank
+
+def ordered_children(graph: WorkflowGraph, parent_id: int) -> List[int]:
+    """A step's substeps in the order of their connection chain (then top to bottom)."""
+    children = graph.children.get(parent_id, set())
+    if not children:
+        return []
+    key = _position_key(graph)
+    ranks = longest_path_ranks(children, lambda step_id: _successors(graph, step_id), key)
+    return sorted(children, key=lambda step_id: (ranks[step_id], key(step_id)))
+
+
+# ---------------------------
+# Tidy subtrees
+# ---------------------------
+def place_subtree(graph: WorkflowGraph, root_id: int, x: float, y: float, positions: Positions,
+                  visited: Optional[Set[int]] = None) -> Tuple[int, int]:
+    """
+    Place root_id at (x, y) and its substeps below/right of it, into `positions`.
+    Returns the subtree's size as (rows, columns).
+    A main step's substeps are stacked below it in its own column; a substep's own
+    substeps start on its row, one column to the right.
+    """
+    visited = set() if visited is None else visited
+    visited.add(root_id)
+    positions[root_id] = (x, y)
+    children = [child_id for child_id in ordered_children(graph, root_id) if child_id not in visited]
+    if not children:
+        return 1, 1
+    is_main = graph.steps[root_id].parent_id is None
+    child_x = x if is_main else x + NODE_WIDTH
+    row = 1 if is_main else 0
+    columns = 1
+    for child_id in children:
+        child_rows, child_columns = place_subtree(graph, child_id, child_x, y + row * ROW_HEIGHT, positions, visited)
+        row += child_rows
+        columns = max(columns, child_columns if is_main else child_columns + 1)
+    return max(row, 1), columns
+
+def _main_steps(graph: WorkflowGraph) -> List[int]:
+    return [step_id for step_id, node in graph.steps.items() if node.parent_id is None]
+
+def _main_successors(graph: WorkflowGraph, step_id: int) -> Set[int]:
+    return {target for target in _successors(graph, step_id) if graph.steps[target].parent_id is None}
+
+def _main_ancestor(graph: WorkflowGraph, step_id: int) -> int:
+    seen = set()
+    while graph.steps[step_id].parent_id is not None and step_id not in seen:
+        seen.add(step_id)
+        step_id = graph.steps[step_id].parent_id
+    return step_id
+
+
+# ---------------------------
+# Layouts
+# ---------------------------
+def full_layout(graph: WorkflowGraph) -> Positions:
+    """Lay out the whole graph, anchored at the current top-left main step position."""
+    mains = _main_steps(graph)
+    if not mains:
+        return {}
+    key = _position_key(graph)
+    ranks = longest_path_ranks(mains, lambda step_id: _main_successors(graph, step_id), key)
+    layers: Dict[int, List[int]] = {}
+    for step_id in mains:
+        layers.setdefault(ranks[step_id], []).append(step_id)
+
+    origin_x = min(graph.steps[step_id].position_x for step_id in mains)
+    origin_y = min(graph.steps[step_id].position_y for step_id in mains)
+    positions: Positions = {}
+    visited: Set[int] = set()
+    x = origin_x
+    for rank in sorted(layers):
+        # Order a column by the mean row of its already placed predecessors.
+        barycenters = {}
+        for step_id in layers[rank]:
+            placed = [positions[p][1] for p in _predecessors(graph, step_id) if p in positions]
+            barycenters[step_id] = sum(placed) / len(placed) if placed else graph.steps[step_id].position_y
+        y = origin_y
+        layer_columns = 1
+        for step_id in sorted(layers[rank], key=lambda step_id: (barycenters[step_id], key(step_id))):
+            rows, columns = place_subtree(graph, step_id, x, y, positions, visited)
+            y += rows * ROW_HEIGHT + BRANCH_GAP
+            layer_columns = max(layer_columns, columns)
+        x += layer_columns * NODE_WIDTH + COLUMN_GAP
+    return positions
+
+def layout_around(graph: WorkflowGraph, step_id: int) -> Positions:
+    """
+    Incremental layout after an edit at step_id: re-lay out the subtree of its main
+    step (kept clear of its main-step predecessors' subtrees) and shift the main
+    steps downstream of it right if they would now overlap it.
+    """
+    graph.require_step(step_id)
+    main_id = _main_ancestor(graph, step_id)
+    main = graph.steps[main_id]
+
+    x = main.position_x
+    for predecessor_id in _predecessors(graph, main_id):
+        predecessor = graph.steps[predecessor_id]
+        if predecessor.parent_id is not None or predecessor_id == main_id:
+            continue
+        _, columns = place_subtree(graph, predecessor_id, predecessor.position_x, predecessor.position_y, {})
+        x = max(x, predecessor.position_x + columns * NODE_WIDTH + COLUMN_GAP)
+
+    positions: Positions = {}
+    _, columns = place_subtree(graph, main_id, x, main.position_y, positions)
+
+    # Shift everything downstream by one offset, so its own layout is preserved.
+    successors = _main_successors(graph, main_id) - {main_id}
+    if not successors:
+        return positions
+    required_x = x + columns * NODE_WIDTH + COLUMN_GAP
+    shift = required_x - min(graph.steps[successor_id].position_x for successor_id in successors)
+    if shift <= 0:
+        return positions
+    downstream, frontier = set(), list(successors)
+    while frontier:
+        current = frontier.pop()
+        if current in downstream or current == main_id:
+            continue
+        downstream.add(current)
+        frontier.extend(_main_successors(graph, current))
+    for current in downstream:
+        stack = [current]
+        while stack:
+            moved_id = stack.pop()
+            if moved_id in positions:
+                continue
+            node = graph.steps[moved_id]
+            positions[moved_id] = (node.position_x + shift, node.position_y)
+            stack.extend(graph.children.get(moved_id, ()))
+    return positions
+
+def apply_positions(graph: WorkflowGraph, positions: Positions) -> List[int]:
+    """Record the positions that differ from the graph's; returns the moved step ids."""
+    moved = []
+    for step_id, (x, y) in sorted(positions.items()):
+        node = graph.steps[step_id]
+        if (node.position_x, node.position_y) != (x, y):
+            graph.update_step(step_id, position_x=x, position_y=y)
+            moved.append(step_id)
+    return moved
@@ -1,8 +1,10 @@
 # utils/node_operations.py
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
-from models.models import Step, Assignment, Connection, User
-from typing import Optional
+from models.models import Step, Assignment, User
+from typing import List, Optional
+from utils.workflow_graph import WorkflowGraph, write_graph_diff
+from utils.layout import full_layout, layout_around, apply_positions
 
 def create_node(
     db: Session,
@@ -25,129 +27,105 @@ def create_node(
     if assignment.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to add a node to this assignment")
     
-    # Set default positions.
-    default_x, default_y = 100, 100
-    pos_x = position_x if position_x is not None else default_x
-    pos_y = position_y if position_y is not None else default_y
-    parent_id = None
+    graph = WorkflowGraph.load(db, assignment.id)
+    temp_id = graph.insert(content, reference_node_id, position_x, position_y, insertion_type)
+    id_map = write_graph_diff(db, graph)
+    db.commit()
+    return db.get(Step, id_map[temp_id])
 
-    # Determine insertion type.
-    if insertion_type == "new_step":
-        # "new_step": Add a new main step to the right of a parent.
-        if not reference_node_id:
-            raise HTTPException(status_code=400, detail="Reference node required for 'new_step' insertion")
-        ref_node = db.query(Step).filter(Step.id == reference_node_id).first()
-        if not ref_node:
-            raise HTTPException(status_code=404, detail="Reference node not found")
-        if ref_node.parent_id is not None:
-            raise HTTPException(status_code=400, detail="Reference node must be a main step for 'new_step' insertion")
-        parent_id = None  # New node is an independent main step.
-        # Compute new position to the right.
-        pos_x = ref_node.position_x + 100  
-        pos_y = ref_node.position_y
+def delete_node_and_rewire(db: Session, node: Step):
+    """
+    Delete a node, promoting its children and re-wiring connections around it
+    (see WorkflowGraph.delete). Does not commit.
+    """
+    graph = WorkflowGraph.load(db, node.assignment_id)
+    graph.delete(node.id)
+    write_graph_diff(db, graph)
 
-    elif insertion_type == "after":
-        # "after": Insert as a sibling immediately after the reference node.
-        if not reference_node_id:
-            raise HTTPException(status_code=400, detail="Reference node required for 'after' insertion")
-        ref_node = db.query(Step).filter(Step.id == reference_node_id).first()
-        if not ref_node:
-            raise HTTPException(status_code=404, detail="Reference node not found")
-        # If the reference node is a parent, we treat "after" as adding a new substep.
-        if ref_node.parent_id is None:
-            parent_id = ref_node.id  # New node becomes a child.
-            pos_x = ref_node.position_x
-            pos_y = ref_node.position_y + 70
-        else:
-            # For substeps: insert as a sibling.
-            parent_id = ref_node.parent_id
-            pos_x = ref_node.position_x
-            pos_y = ref_node.position_y + 70
-    elif insertion_type == "substep":
-        # "substep": Insert as a child of the reference node.
-        if not reference_node_id:
-            raise HTTPException(status_code=400, detail="Reference node required for 'substep' insertion")
-        parent_id = reference_node_id
-        ref_node = db.query(Step).filter(Step.id == reference_node_id).first()
-        if not ref_node:
-            raise HTTPException(status_code=404, detail="Reference node not found")
-        pos_x = ref_node.position_x + 180 
-        pos_y = ref_node.position_y
-    else:
-        # Random insertion: treat as main step.
-        parent_id = None
+# ---------------------------
+# Chain insertion (deep dive substeps)
+# ---------------------------
+def insert_chain(db: Session, anchor: Step, contents: List[str]) -> List[Step]:
+    """
+    Insert an ordered chain of steps next to `anchor`, laid out and connected exactly
+    as successive create_node calls would (as the deep dive used to do):
+      - anchor is a main step: the first item becomes a new main step to its right
+        ("new_step", taking over the anchor's outgoing main-step connection) and the
+        rest become its substeps, stacked below it ("after").
+      - anchor is a substep: the first item becomes a child of the anchor
+        ("substep") and the rest its siblings, stacked below it ("after").
+    The chain is built on a WorkflowGraph and written as one diff.
+    The caller checks ownership and commits.
+    """
+    if not contents:
+        return []
+    graph = WorkflowGraph.load(db, anchor.assignment_id)
+    temp_ids = [graph.insert(contents[0], anchor.id, insertion_type="new_step" if anchor.parent_id is None else "substep")]
+    for content in contents[1:]:
+        temp_ids.append(graph.insert(content, temp_ids[-1], insertion_type="after"))
+    id_map = write_graph_diff(db, graph)
+    step_ids = [id_map[temp_id] for temp_id in temp_ids]
+    steps = {step.id: step for step in db.query(Step).filter(Step.id.in_(step_ids))}
+    return [steps[step_id] for step_id in step_ids]
 
-    # Create the new node.
-    node = Step(
-        assignment_id=assignment_id,
-        content=content,
-        parent_id=parent_id,
-        position_x=pos_x,
-        position_y=pos_y,
-        completed=False
-    )
-    db.add(node)
-    db.commit()
-    db.refresh(node)
-    
-    # Connection re-wiring based on insertion type.
-    if insertion_type == "new_step":
-        # For "new_step": Insert a new main step.
-        # Check if the reference node (ref_node) has an outgoing connection.
-        conn_out = (
-            db.query(Connection)
-            .join(Step, Connection.to_step == Step.id)
-            .filter(
-                Connection.from_step == reference_node_id,
-                Step.parent_id == None  # Only consider connections where target is a main step.
-            )
-            .first()
-        )
-        if conn_out:
-            # Case 1: There is an outgoing main-step connection.
-            # Delete the connection from the reference parent to its current main-step target.
-            db.delete(conn_out)
-            # Create connection from the reference parent to the new node.
-            db.add(Connection(assignment_id=assignment.id, from_step=reference_node_id, to_step=node.id))
-            # And create connection from the new node to the former target.
-            db.add(Connection(assignment_id=assignment.id, from_step=node.id, to_step=conn_out.to_step))
-        else:
-            # Case 2: No main-step outgoing connection exists.
-            db.add(Connection(assignment_id=assignment.id, from_step=reference_node_id, to_step=node.id))
-    
-    elif insertion_type == "after":
-        # For "after":
-        if ref_node.parent_id is None:
-            # For a parent node, treat "after" as adding a new substep.
-            # Get the outgoing connection from ref_node (if any).
-            first_child_conn = (db.query(Connection).join(Step, Connection.to_step == Step.id).filter(Connection.from_step == ref_node.id, Step.parent_id == ref_node.id).first())
-            if first_child_conn:
-                db.delete(first_child_conn)
-                db.add(Connection(assignment_id=assignment.id, from_step=ref_node.id, to_step=node.id))
-                db.add(Connection(assignment_id=assignment.id, from_step=node.id, to_step=first_child_conn.to_step))
-            else:
-                db.add(Connection(assignment_id=assignment.id, from_step=ref_node.id, to_step=node.id))
-        else:
-            # For substeps, treat as sibling insertion.
-            conn_out = (
-                db.query(Connection)
-                .join(Step, Connection.to_step == Step.id)
-                .filter(
-                    Connection.from_step == ref_node.id,
-                    Step.parent_id == ref_node.parent_id
-                )
-                .first()
-            )
-            if conn_out:
-                db.delete(conn_out)
-                db.add(Connection(assignment_id=assignment.id, from_step=reference_node_id, to_step=node.id))
-                db.add(Connection(assignment_id=assignment.id, from_step=node.id, to_step=conn_out.to_step))
-            else:
-                db.add(Connection(assignment_id=assignment.id, from_step=reference_node_id, to_step=node.id))
-    
-    elif insertion_type == "substep":
-        # For "substep": create a direct connection.
-        db.add(Connection(assignment_id=assignment.id, from_step=reference_node_id, to_step=node.id))
-    
-    db.commit()
-    return node
\ No newline at end of file
+# ---------------------------
+# Batch graph mutations
+# ---------------------------
+def apply_graph_batch(db: Session, assignment: Assignment, operations: list) -> List[dict]:
+    """
+    Apply an ordered list of graph operations to an assignment whose ownership the
+    caller already checked. The graph is loaded once, every operation runs against
+    it in memory, and the combined diff is written with bulk INSERT/UPDATE/DELETE
+    statements. Does not commit; an invalid operation raises before anything is written.
+
+    Returns one result per operation (with the ids of created steps/connections).
+    """
+    graph = WorkflowGraph.load(db, assignment.id)
+    results: List[dict] = []
+    for index, op in enumerate(operations):
+        try:
+            if op.op == "move":
+                graph.update_step(op.step_id, position_x=op.position_x, position_y=op.position_y)
+                results.append({"op": op.op, "step_id": op.step_id})
+            elif op.op == "edit":
+                graph.update_step(op.step_id, content=op.content)
+                results.append({"op": op.op, "step_id": op.step_id})
+            elif op.op == "complete":
+                graph.update_step(op.step_id, completed=op.completed)
+                results.append({"op": op.op, "step_id": op.step_id})
+            elif op.op == "add":
+                step_id = graph.insert(op.content, op.reference_node_id, op.position_x, op.position_y, op.insertion_type)
+                results.append({"op": "add", "step_id": step_id})
+            elif op.op == "delete":
+                graph.delete(op.step_id)
+                results.append({"op": "delete", "step_id": op.step_id})
+            elif op.op == "connect":
+                connection_id = graph.connect(op.from_step, op.to_step)
+                results.append({"op": "connect", "connection_id": connection_id})
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Operation {index}: {e.detail}")
+
+    id_map = write_graph_diff(db, graph)
+    for result in results:
+        for key in ("step_id", "connection_id"):
+            if key in result:
+                result[key] = id_map.get(result[key], result[key])
+    return results
+
+# ---------------------------
+# Auto-layout
+# ---------------------------
+def layout_assignment(db: Session, assignment: Assignment, step_id: Optional[int] = None) -> List[dict]:
+    """
+    Auto-layout an assignment whose ownership the caller already checked: the whole
+    graph, or with step_id only the subtree around that step (see utils/layout.py).
+    Writes only the steps that move and returns their new positions. Does not commit.
+    """
+    graph = WorkflowGraph.load(db, assignment.id)
+    positions = full_layout(graph) if step_id is None else layout_around(graph, step_id)
+    moved = apply_positions(graph, positions)
+    write_graph_diff(db, graph)
+    return [
+        {"id": moved_id, "position_x": positions[moved_id][0], "position_y": positions[moved_id][1]}
+        for moved_id in moved
+    ]
@@ -0,0 +1,74 @@
+# utils/revisions.py
+"""
+Per-assignment graph revisions.
+
+Every flush that creates, changes or deletes a Step or Connection (or changes an
+Assignment's own fields) bumps assignments.revision once per affected assignment,
+stamps the touched rows with the new revision and records a GraphTombstone for each
+deleted row. Routes therefore don't have to remember to bump anything, and clients
+can ask for "everything changed since revision N".
+
+The bump is an UPDATE on the assignment row, so concurrent writers to the same
+assignment are serialized until commit and revisions follow commit order.
+
+Bulk SQL (UPDATE/DELETE statements that bypass the ORM unit of work) is not seen by
+the flush hook; such code calls bump_revision itself and stamps the rows it changes.
+"""
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.util import identity_key
+from models.models import Assignment, Step, Connection, GraphTombstone
+
+BUMP_SQL = text("UPDATE assignments SET revision = revision + 1 WHERE id = :assignment_id RETURNING revision")
+
+TOMBSTONE_KINDS = {Step: "step", Connection: "connection"}
+
+
+def bump_revision(db: Session, assignment_id: int) -> Optional[int]:
+    """Increment and return the assignment's revision (None if the assignment doesn't exist)."""
+    return db.connection().execute(BUMP_SQL, {"assignment_id": assignment_id}).scalar()
+
+def _graph_assignment_id(obj) -> Optional[int]:
+    if obj.assignment_id is not None:
+        return obj.assignment_id
+    return obj.assignment.id if obj.assignment is not None else None
+
+@event.listens_for(Session, "before_flush")
+def stamp_graph_revisions(session, flush_context, instances):
+    touched = {}   # assignment_id -> Steps/Connections to stamp
+    deleted = {}   # assignment_id -> (kind, id) of deleted Steps/Connections
+    for obj in session.new:
+        if isinstance(obj, (Step, Connection)):
+            assignment_id = _graph_assignment_id(obj)
+            # A step added together with a brand-new assignment has no id to bump yet.
+            if assignment_id is not None:
+                touched.setdefault(assignment_id, []).append(obj)
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, (Step, Connection)):
+            touched.setdefault(obj.assignment_id, []).append(obj)
+        elif isinstance(obj, Assignment):
+            touched.setdefault(obj.id, [])
+    for obj in session.deleted:
+        if isinstance(obj, (Step, Connection)):
+            deleted.setdefault(obj.assignment_id, []).append((TOMBSTONE_KINDS[type(obj)], obj.id))
+
+    # Lock assignment rows in a fixed order so concurrent flushes can't deadlock.
+    for assignment_id in sorted(set(touched) | set(deleted)):
+        revision = bump_revision(session, assignment_id)
+        if revision is None:
+            continue  # The assignment itself is being deleted.
+        for obj in touched.get(assignment_id, []):
+            obj.revision = revision
+        for kind, object_id in deleted.get(assignment_id, []):
+            session.add(GraphTombstone(
+                assignment_id=assignment_id,
+                kind=kind,
+                object_id=object_id,
+                revision=revision
+            ))
+        assignment = session.identity_map.get(identity_key(Assignment, assignment_id))
+        if assignment is not None:
+            attributes.set_committed_value(assignment, "revision", revision)
@@ -0,0 +1,405 @@
+# utils/workflow_graph.py
+"""
+In-memory model of an assignment's workflow graph.
+
+WorkflowGraph loads an assignment's steps and connections once (two queries) and
+keeps adjacency and parent/child indexes, so predecessors, successors and children
+are dictionary lookups instead of one join query each. Node insertion and deletion
+(with child promotion and connection re-wiring) run against the in-memory graph and
+are recorded as a diff; write_graph_diff then writes only the changed rows with
+bulk statements.
+
+The insertion/deletion rules are the ones the canvas has always used (see
+create_node and the delete_node route). Where the old queries took "the first"
+matching connection, the graph takes the one with the lowest id.
+
+Steps and connections created in memory get negative temporary ids until written.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.orm import Session
+from models.models import Step, Connection, GraphTombstone
+from utils.revisions import bump_revision
+
+DEFAULT_POSITION = (100, 100)
+
+
+@dataclass
+class StepNode:
+    parent_id: Optional[int]
+    position_x: float
+    position_y: float
+    # Only set for new steps and steps whose content/completion changed;
+    # rewiring never needs them, so they are not loaded.
+    content: Optional[str] = None
+    completed: Optional[bool] = None
+
+
+class WorkflowGraph:
+    def __init__(self, assignment_id: int, steps: Iterable[tuple], connections: Iterable[tuple]):
+        """
+        steps: (id, parent_id, position_x, position_y) rows.
+        connections: (id, from_step, to_step) rows.
+        """
+        self.assignment_id = assignment_id
+        self.steps: Dict[int, StepNode] = {}
+        self.children: Dict[int, Set[int]] = {}
+        self.connections: Dict[int, Tuple[int, int]] = {}
+        self.outgoing: Dict[int, Set[int]] = {}   # step id -> connection ids
+        self.incoming: Dict[int, Set[int]] = {}   # step id -> connection ids
+        for step_id, parent_id, position_x, position_y in steps:
+            self._add_step(step_id, StepNode(parent_id, position_x, position_y))
+        for connection_id, from_step, to_step in connections:
+            # Skip connections with an endpoint in another assignment (create_connection
+            # didn't always check); the database cascades them when that step is deleted.
+            if from_step in self.steps and to_step in self.steps:
+                self._add_connection(connection_id, from_step, to_step)
+
+        # Diff against the loaded state.
+        self.new_steps: List[int] = []
+        self.step_changes: Dict[int, Dict[str, object]] = {}
+        self.deleted_steps: Set[int] = set()
+        self.new_connections: List[int] = []
+        self.connection_changes: Dict[int, Dict[str, int]] = {}
+        self.deleted_connections: Set[int] = set()
+        self._next_temp_id = -1
+
+    @classmethod
+    def load(cls, db: Session, assignment_id: int) -> "WorkflowGraph":
+        steps = db.execute(
+            select(Step.id, Step.parent_id, Step.position_x, Step.position_y)
+            .where(Step.assignment_id == assignment_id)
+        ).all()
+        connections = db.execute(
+            select(Connection.id, Connection.from_step, Connection.to_step)
+            .where(Connection.assignment_id == assignment_id)
+        ).all()
+        return cls(assignment_id, steps, connections)
+
+    # ---------------------------
+    # Index maintenance
+    # ---------------------------
+    def _temp_id(self) -> int:
+        temp_id = self._next_temp_id
+        self._next_temp_id -= 1
+        return temp_id
+
+    def _add_step(self, step_id: int, node: StepNode):
+        self.steps[step_id] = node
+        if node.parent_id is not None:
+            self.children.setdefault(node.parent_id, set()).add(step_id)
+
+    def _add_connection(self, connection_id: int, from_step: int, to_step: int):
+        self.connections[connection_id] = (from_step, to_step)
+        self.outgoing.setdefault(from_step, set()).add(connection_id)
+        self.incoming.setdefault(to_step, set()).add(connection_id)
+
+    def _unlink_connection(self, connection_id: int):
+        from_step, to_step = self.connections.pop(connection_id)
+        self.outgoing[from_step].discard(connection_id)
+        self.incoming[to_step].discard(connection_id)
+
+    # ---------------------------
+    # Recorded mutations
+    # ---------------------------
+    def update_step(self, step_id: int, **fields):
+        node = self.require_step(step_id)
+        if "parent_id" in fields and fields["parent_id"] != node.parent_id:
+            if node.parent_id is not None:
+                self.children[node.parent_id].discard(step_id)
+            if fields["parent_id"] is not None:
+                self.children.setdefault(fields["parent_id"], set()).add(step_id)
+        for field, value in fields.items():
+            setattr(node, field, value)
+        if step_id > 0:
+            self.step_changes.setdefault(step_id, {}).update(fields)
+
+    def add_step(self, content: str, parent_id: Optional[int], position_x: float, position_y: float) -> int:
+        step_id = self._temp_id()
+        self._add_step(step_id, StepNode(parent_id, position_x, position_y, content, False))
+        self.new_steps.append(step_id)
+        return step_id
+
+    def remove_step(self, step_id: int):
+        """Remove a step that no connection references any more."""
+        node = self.steps.pop(step_id)
+        if node.parent_id is not None:
+            self.children[node.parent_id].discard(step_id)
+        # Like the ORM delete did, remaining children become main steps.
+        for child_id in sorted(self.children.pop(step_id, ())):
+            self.update_step(child_id, parent_id=None)
+        self.outgoing.pop(step_id, None)
+        self.incoming.pop(step_id, None)
+        if step_id > 0:
+            self.deleted_steps.add(step_id)
+            self.step_changes.pop(step_id, None)
+        else:
+            self.new_steps.remove(step_id)
+
+    def add_connection(self, from_step: int, to_step: int) -> int:
+        connection_id = self._temp_id()
+        self._add_connection(connection_id, from_step, to_step)
+        self.new_connections.append(connection_id)
+        return connection_id
+
+    def update_connection(self, connection_id: int, from_step: Optional[int] = None, to_step: Optional[int] = None):
+        current_from, current_to = self.connections[connection_id]
+        self._unlink_connection(connection_id)
+        new_from = current_from if from_step is None else from_step
+        new_to = current_to if to_step is None else to_step
+        self._add_connection(connection_id, new_from, new_to)
+        if connection_id > 0:
+            self.connection_changes.setdefault(connection_id, {}).update(
+                {"from_step": new_from, "to_step": new_to}
+            )
+
+    def remove_connection(self, connection_id: int):
+        self._unlink_connection(connection_id)
+        if connection_id > 0:
+            self.deleted_connections.add(connection_id)
+            self.connection_changes.pop(connection_id, None)
+        else:
+            self.new_connections.remove(connection_id)
+
+    # ---------------------------
+    # Lookups
+    # ---------------------------
+    def require_step(self, step_id: int, detail: str = "Node not found") -> StepNode:
+        node = self.steps.get(step_id)
+        if node is None:
+            raise HTTPException(status_code=404, detail=detail)
+        return node
+
+    def first_outgoing(self, step_id: int, target_parent_ids: Tuple[Optional[int], ...]) -> Optional[int]:
+        """Lowest-id connection from step_id to a step whose parent_id is one of target_parent_ids."""
+        matches = [
+            connection_id for connection_id in self.outgoing.get(step_id, ())
+            if self.steps[self.connections[connection_id][1]].parent_id in target_parent_ids
+        ]
+        return min(matches, default=None)
+
+    def first_incoming(self, step_id: int, source_parent_ids: Tuple[Optional[int], ...]) -> Optional[int]:
+        """Lowest-id connection into step_id from a step whose parent_id is one of source_parent_ids."""
+        matches = [
+            connection_id for connection_id in self.incoming.get(step_id, ())
+            if self.steps[self.connections[connection_id][0]].parent_id in source_parent_ids
+        ]
+        return min(matches, default=None)
+
+    def find_connection(self, from_step: int, to_step: int) -> Optional[int]:
+        matches = [
+            connection_id for connection_id in self.outgoing.get(from_step, ())
+            if self.connections[connection_id][1] == to_step
+        ]
+        return min(matches, default=None)
+
+    # ---------------------------
+    # Insert
+    # ---------------------------
+    def insert(
+        self,
+        content: str,
+        reference_node_id: Optional[int] = None,
+        position_x: Optional[float] = None,
+        position_y: Optional[float] = None,
+        insertion_type: Optional[str] = None
+    ) -> int:
+        """
+        Insert a node and re-wire connections. Insertion types:
+          - "new_step": a new main step to the right of a main-step reference; it takes
+            over the reference's outgoing main-step connection.
+          - "after": below the reference; a main-step reference gets it as a substep
+            (taking over its connection to its first substep), a substep reference
+            gets it as the next sibling.
+          - "substep": a child of the reference node.
+          - None: an unconnected main step.
+        Returns the new step's (temporary) id.
+        """
+        pos_x = position_x if position_x is not None else DEFAULT_POSITION[0]
+        pos_y = position_y if position_y is not None else DEFAULT_POSITION[1]
+        parent_id = None
+        ref = None
+        if insertion_type in ("new_step", "after", "substep"):
+            if not reference_node_id:
+                raise HTTPException(status_code=400, detail=f"Reference node required for '{insertion_type}' insertion")
+            ref = self.require_step(reference_node_id, "Reference node not found")
+
+        if insertion_type == "new_step":
+            if ref.parent_id is not None:
+                raise HTTPException(status_code=400, detail="Reference node must be a main step for 'new_step' insertion")
+            pos_x, pos_y = ref.position_x + 100, ref.position_y
+        elif insertion_type == "after":
+            parent_id = reference_node_id if ref.parent_id is None else ref.parent_id
+            pos_x, pos_y = ref.position_x, ref.position_y + 70
+        elif insertion_type == "substep":
+            parent_id = reference_node_id
+            pos_x, pos_y = ref.position_x + 180, ref.position_y
+
+        # Pick the connection to split before the new node exists, so it can't match.
+        split = None
+        if insertion_type == "new_step":
+            split = self.first_outgoing(reference_node_id, (None,))
+        elif insertion_type == "after":
+            split = self.first_outgoing(reference_node_id, (reference_node_id if ref.parent_id is None else ref.parent_id,))
+
+        node_id = self.add_step(content, parent_id, pos_x, pos_y)
+        if ref is None:
+            return node_id
+        if split is not None:
+            next_step = self.connections[split][1]
+            self.remove_connection(split)
+            self.add_connection(reference_node_id, node_id)
+            self.add_connection(node_id, next_step)
+        else:
+            self.add_connection(reference_node_id, node_id)
+        return node_id
+
+    # ---------------------------
+    # Delete
+    # ---------------------------
+    def delete(self, node_id: int):
+        """
+        Delete a node, promoting its children and re-wiring connections around it.
+          - Substep: its predecessor is connected to its next sibling. If it has its own
+            substeps, the one it connects to first is promoted to a main step and the
+            others are re-parented under it.
+          - Main step with substeps: the topmost substep takes its place (parent,
+            incoming and outgoing connections); the other substeps move under it.
+          - Main step without substeps: its predecessor is connected to its successor.
+        """
+        node = self.require_step(node_id)
+        if node.parent_id is not None:
+            incoming = self.first_incoming(node_id, (node.parent_id, None))
+            outgoing = self.first_outgoing(node_id, (node.parent_id,))
+            outgoing_subset = self.first_outgoing(node_id, (node_id,))
+            if incoming is not None and outgoing is not None:
+                self.add_connection(self.connections[incoming][0], self.connections[outgoing][1])
+            if outgoing_subset is not None:
+                promoted_id = self.connections[outgoing_subset][1]
+                for child_id in sorted(self.children.get(node_id, ())):
+                    self.update_step(child_id, parent_id=None if child_id == promoted_id else promoted_id)
+        else:
+            children = sorted(self.children.get(node_id, ()), key=lambda child_id: (self.steps[child_id].position_y, child_id))
+            if children:
+                promoted_id = children[0]
+                self.update_step(promoted_id, parent_id=None)
+                for connection_id in sorted(self.incoming.get(node_id, ())):
+                    if self.connections[connection_id][0] != promoted_id:
+                        self.update_connection(connection_id, to_step=promoted_id)
+                for connection_id in sorted(self.outgoing.get(node_id, ())):
+                    if self.connections[connection_id][1] != promoted_id:
+                        self.update_connection(connection_id, from_step=promoted_id)
+                for child_id in children[1:]:
+                    self.update_step(child_id, parent_id=promoted_id)
+            else:
+                incoming = min(self.incoming.get(node_id, ()), default=None)
+                outgoing = min(self.outgoing.get(node_id, ()), default=None)
+                if incoming is not None and outgoing is not None:
+                    self.add_connection(self.connections[incoming][0], self.connections[outgoing][1])
+
+        # Remove all connections that still reference the node, then the node.
+        for connection_id in sorted(self.incoming.get(node_id, set()) | self.outgoing.get(node_id, set())):
+            self.remove_connection(connection_id)
+        self.remove_step(node_id)
+
+    def connect(self, from_step: int, to_step: int) -> int:
+        """Connect two steps, reusing an identical existing connection."""
+        self.require_step(from_step)
+        self.require_step(to_step)
+        existing = self.find_connection(from_step, to_step)
+        return existing if existing is not None else self.add_connection(from_step, to_step)
+
+    def has_changes(self) -> bool:
+        return bool(
+            self.new_steps or self.step_changes or self.deleted_steps or
+            self.new_connections or self.connection_changes or self.deleted_connections
+        )
+
+
+# ---------------------------
+# Persisting a diff
+# ---------------------------
+def allocate_step_ids(db: Session, count: int) -> List[int]:
+    """Reserve `count` ids from the steps id sequence, so rows and the connections between them can be built before writing."""
+    ids = db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('steps', 'id')) FROM generate_series(1, :count)"),
+        {"count": count}
+    ).scalars().all()
+    return sorted(ids)
+
+def write_graph_diff(db: Session, graph: WorkflowGraph) -> Dict[int, int]:
+    """
+    Write only the rows the graph changed, with bulk statements, stamped with one new
+    assignment revision (plus tombstones for deleted rows). Does not commit.
+    Returns a map from temporary ids (steps and connections) to database ids.
+    """
+    id_map: Dict[int, int] = {}
+    if not graph.has_changes():
+        return id_map
+    # Earlier ORM changes must reach the database before the bulk statements.
+    db.flush()
+    revision = bump_revision(db, graph.assignment_id)
+
+    def real(step_id: Optional[int]) -> Optional[int]:
+        return id_map.get(step_id, step_id) if step_id is not None and step_id < 0 else step_id
+
+    if graph.new_steps:
+        id_map.update(zip(graph.new_steps, allocate_step_ids(db, len(graph.new_steps))))
+        db.execute(insert(Step), [
+            {
+                "id": id_map[step_id],
+                "assignment_id": graph.assignment_id,
+                "parent_id": real(graph.steps[step_id].parent_id),
+                "content": graph.steps[step_id].content,
+                "position_x": graph.steps[step_id].position_x,
+                "position_y": graph.steps[step_id].position_y,
+                "completed": bool(graph.steps[step_id].completed),
+                "revision": revision,
+            }
+            for step_id in graph.new_steps
+        ])
+    if graph.step_changes:
+        db.execute(update(Step), [
+            {"id": step_id, "revision": revision,
+             **{field: real(value) if field == "parent_id" else value for field, value in fields.items()}}
+            for step_id, fields in graph.step_changes.items()
+        ])
+    if graph.deleted_connections:
+        db.execute(delete(Connection).where(Connection.id.in_(graph.deleted_connections)))
+    if graph.new_connections:
+        created = db.execute(
+            insert(Connection).returning(Connection.id, sort_by_parameter_order=True),
+            [
+                {
+                    "assignment_id": graph.assignment_id,
+                    "from_step": real(graph.connections[connection_id][0]),
+                    "to_step": real(graph.connections[connection_id][1]),
+                    "revision": revision,
+                }
+                for connection_id in graph.new_connections
+            ]
+        ).scalars().all()
+        id_map.update(zip(graph.new_connections, created))
+    if graph.connection_changes:
+        db.execute(update(Connection), [
+            {"id": connection_id, "revision": revision,
+             **{field: real(value) for field, value in fields.items()}}
+            for connection_id, fields in graph.connection_changes.items()
+        ])
+    if graph.deleted_steps:
+        db.execute(delete(Step).where(Step.id.in_(graph.deleted_steps)))
+
+    tombstones = (
+        [{"kind": "step", "object_id": step_id} for step_id in sorted(graph.deleted_steps)] +
+        [{"kind": "connection", "object_id": connection_id} for connection_id in sorted(graph.deleted_connections)]
+    )
+    if tombstones:
+        db.execute(insert(GraphTombstone), [
+            {"assignment_id": graph.assignment_id, "revision": revision, **tombstone}
+            for tombstone in tombstones
+        ])
+    # Bulk statements don't refresh objects already loaded in the session.
+    db.expire_all()
+    return id_map
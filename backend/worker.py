@@ -0,0 +1,41 @@
+"""
+Background job worker: runs queued workflow generation and deep-dive jobs
+(services/job_queue.py). Start as many processes as needed; they share the queue.
+
+Usage (from backend/):
+    python worker.py --concurrency 8
+
+SIGINT/SIGTERM stop claiming new jobs; jobs already running are finished first.
+"""
+import argparse
+import asyncio
+import signal
+from core.config import JOB_WORKER_CONCURRENCY
+from core.database import async_engine, engine
+from services.job_queue import run_worker
+
+# Registers the before_flush hook that bumps assignment graph revisions.
+import utils.revisions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    print(f"Job worker started (concurrency {args.concurrency})")
+    try:
+        await run_worker(args.concurrency, stop)
+    finally:
+        await async_engine.dispose()
+        engine.dispose()
+    print("Job worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())